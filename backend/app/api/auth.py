@@ -1,26 +1,33 @@
 from fastapi import APIRouter, Request, HTTPException
 from starlette.responses import RedirectResponse
-from authlib.integrations.starlette_client import OAuth
 from ..config import settings
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-oauth = OAuth()
+# authlib is imported and the Google client registered on first use (or during warmup)
+_oauth = None
 
-if settings.GOOGLE_CLIENT_ID and settings.GOOGLE_CLIENT_SECRET:
-    oauth.register(
-        name='google',
-        client_id=settings.GOOGLE_CLIENT_ID,
-        client_secret=settings.GOOGLE_CLIENT_SECRET,
-        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-        client_kwargs={
-            'scope': 'openid email profile'
-        }
-    )
-else:
-    logger.warning("Google credentials not found. OAuth will not work.")
+def get_oauth():
+    global _oauth
+    if _oauth is None:
+        from authlib.integrations.starlette_client import OAuth
+        oauth = OAuth()
+        if settings.GOOGLE_CLIENT_ID and settings.GOOGLE_CLIENT_SECRET:
+            oauth.register(
+                name='google',
+                client_id=settings.GOOGLE_CLIENT_ID,
+                client_secret=settings.GOOGLE_CLIENT_SECRET,
+                server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+                client_kwargs={
+                    'scope': 'openid email profile'
+                }
+            )
+        else:
+            logger.warning("Google credentials not found. OAuth will not work.")
+        _oauth = oauth
+    return _oauth
 
 @router.get('/login')
 async def login(request: Request):
@@ -38,27 +45,28 @@ async def login(request: Request):
     if 'onrender.com' in str(redirect_uri) or settings.RENDER:
         redirect_uri = str(redirect_uri).replace('http://', 'https://')
 
-    logger.info(f"redirect_uri: {redirect_uri}")
-    return await oauth.google.authorize_redirect(request, redirect_uri)
+    logger.info("redirect_uri: %s", redirect_uri)
+    return await get_oauth().google.authorize_redirect(request, redirect_uri)
 
 @router.get('/callback')
 async def auth_callback(request: Request):
     try:
-        token = await oauth.google.authorize_access_token(request)
+        token = await get_oauth().google.authorize_access_token(request)
         user_info = token.get('userinfo')
         if not user_info:
              # Sometimes userinfo is inside 'id_token' claims
              user_info = token.get('user_info') or token.get('id_token')
 
         if user_info:
+            # Stored server-side; the browser cookie only holds the session id
             request.session['user'] = dict(user_info)
-            logger.info(f"User logged in: {user_info.get('email')}")
+            logger.info("User logged in: %s", user_info.get('email'))
         
         # Redirect to frontend with a success flag
         # Ideally, we verify session on frontend. simple redirect to root for now.
         return RedirectResponse(url='/')
     except Exception as e:
-        logger.error(f"Error during Google callback: {str(e)}")
+        logger.error("Error during Google callback: %s", e)
         # Redirect to home with error details
         return RedirectResponse(url=f'/?error={str(e)}')
 
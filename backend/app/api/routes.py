@@ -1,28 +1,103 @@
+import asyncio
+import json
 import logging
-from fastapi import APIRouter, HTTPException, Depends
+import math
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from ..models.schemas import TextRequest, AIResponse
-from ..models.db import get_db, User, AnalysisHistory
+from ..models.db import get_db, User, AnalysisHistory, SessionLocal
 from ..services.prompt_router import get_prompts
-from ..services.claude_client import call_claude
+from ..services.claude_client import call_claude, is_upstream_failure
+from ..services.circuit_breaker import CircuitOpenError
+from ..models.enums import AnalysisModule
+from ..services.entitlements import entitlements
+from ..services.token_budget import fit_to_budget, TRIMMABLE_MODULES
+from ..services.lookup_index import lookup_index
+from ..services import knowledge_base
+from ..services.chunked_analysis import analyze_chunked, CHUNKED_MODULES
+from ..services.feedback_drafts import feedback_drafts
+from ..services.jobs import job_runner, JobQueueFull, IdempotencyKeyReused, FINISHED
+from ..config import settings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Modules whose answers don't depend on the user, so an older answer is still useful
+STALE_FALLBACK_MODULES = {AnalysisModule.GLOSSARY, AnalysisModule.TRANSLATOR}
+
+def degraded_response(request: TextRequest, db: Session, retry_after: float) -> AIResponse:
+    """
+    Answer given while Claude is unavailable: the last stored answer for the
+    same glossary/translator input, or a 503 asking to retry later.
+    """
+    if request.module in STALE_FALLBACK_MODULES:
+        try:
+            stale = db.query(AnalysisHistory.result_text).filter(
+                AnalysisHistory.module == request.module,
+                AnalysisHistory.input_text == request.text
+            ).order_by(AnalysisHistory.id.desc()).first()
+            if stale:
+                logger.info("Serving stale %s answer while upstream is unavailable", request.module)
+                return AIResponse(result=stale.result_text, degraded=True)
+        except Exception as e:
+            logger.error("Stale answer lookup failed: %s", e)
+
+    raise HTTPException(
+        status_code=503,
+        detail="El servicio de IA no está disponible en este momento. Por favor, inténtalo de nuevo en unos segundos.",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+def save_history(db: Session, request: TextRequest, result_text: str):
+    """Stores the analysis in the user's history (if we know who they are)."""
+    if request.user_email:
+        try:
+            # Find or create user
+            user = db.query(User).filter(User.email == request.user_email).first()
+            if not user:
+                user = User(email=request.user_email, is_premium=False)
+                db.add(user)
+                db.commit()
+                db.refresh(user)
+            
+            # Save history
+            history_item = AnalysisHistory(
+                user_email=user.email,
+                module=request.module,
+                input_text=request.text,
+                result_text=result_text,
+                meta_data=request.scenario_context or {}
+            )
+            db.add(history_item)
+            db.commit()
+        except Exception as e:
+            logger.error("Failed to save history: %s", e)
+            # Don't fail the request if history saving fails
+
+MAX_INPUT_LENGTH = 15000
+MAX_LONG_INPUT_LENGTH = 200000 # Roleplay histories are trimmed, long transcripts are chunked
+
+def check_length(request: TextRequest):
+    long_input = request.module in TRIMMABLE_MODULES or request.module in CHUNKED_MODULES
+    max_length = MAX_LONG_INPUT_LENGTH if long_input else MAX_INPUT_LENGTH
+    if len(request.text) > max_length:
+        raise HTTPException(status_code=400, detail=f"El texto es demasiado largo (máx {max_length} caracteres).")
+
+def is_chunked(request: TextRequest) -> bool:
+    return request.module in CHUNKED_MODULES and len(request.text) > settings.CHUNK_MAX_CHARS
+
 @router.post("/analyze", response_model=AIResponse)
 async def analyze_text(request: TextRequest, db: Session = Depends(get_db)):
     """
     Analyzes text using the specified module.
     Delegates prompt formatting to the prompt_router and calls Claude API.
     """
-    MAX_INPUT_LENGTH = 15000 # Increased for roleplay history
-    
     # --- PREMIUM LOGIC START ---
-    # Hardcoded list for MVP. In production, this would be a DB check.
-    PREMIUM_USERS = [
-        "andrealan2003@gmail.com"
-    ]
-    
     # Check for Premium Scenarios
     is_premium_scenario = False
     if request.module == 'roleplay' and request.scenario_context:
@@ -31,8 +106,8 @@ async def analyze_text(request: TextRequest, db: Session = Depends(get_db)):
             is_premium_scenario = True
             
     if is_premium_scenario:
-        user_email = request.user_email
-        if not user_email or user_email not in PREMIUM_USERS:
+        # Served from the entitlement cache; the DB is only read on a cold miss
+        if not entitlements.is_premium(request.user_email, db):
             # Rejection
             raise HTTPException(
                 status_code=403, 
@@ -40,10 +115,39 @@ async def analyze_text(request: TextRequest, db: Session = Depends(get_db)):
             )
     # --- PREMIUM LOGIC END ---
 
-    if len(request.text) > MAX_INPUT_LENGTH:
-        raise HTTPException(status_code=400, detail=f"El texto es demasiado largo (máx {MAX_INPUT_LENGTH} caracteres).")
+    check_length(request)
+
+    # Common idioms: precomputed answers, available even while the upstream is down
+    kb = knowledge_base.knowledge_base
+    if kb and request.module in STALE_FALLBACK_MODULES:
+        kb_hit = kb.lookup(request.module, request.text)
+        if kb_hit:
+            save_history(db, request, kb_hit.result_text)
+            return AIResponse(result=kb_hit.result_text, kb_version=kb_hit.version)
+
+    # Glossary/translator: answer repeated idioms from the local index without calling Claude
+    if settings.LOOKUP_INDEX_ENABLED:
+        hit = lookup_index.lookup(request.module, request.text)
+        if hit is None:
+            hit = await lookup_index.lookup_shared(request.module, request.text)
+        if hit:
+            save_history(db, request, hit.result_text)
+            return AIResponse(result=hit.result_text)
 
     try:
+        if is_chunked(request):
+            # Long transcripts: analyze chunks concurrently, then merge
+            result_text = await analyze_chunked(request.module, request.text, user_profile=request.user_profile)
+            save_history(db, request, result_text)
+            return AIResponse(result=result_text)
+
+        # End of a roleplay: the feedback has been drafted in the background during the conversation
+        if request.module == AnalysisModule.ROLEPLAY_FEEDBACK:
+            result_text = await feedback_drafts.finalize(request.conversation_id, request.text)
+            if result_text:
+                save_history(db, request, result_text)
+                return AIResponse(result=result_text)
+
         # Get appropriate prompts based on module, injecting profile/context
         system_prompt, user_prompt = get_prompts(
             request.module, 
@@ -52,45 +156,34 @@ async def analyze_text(request: TextRequest, db: Session = Depends(get_db)):
             scenario_context=request.scenario_context
         )
         
+        # Fit the prompt into the context budget (drops the oldest roleplay turns if needed)
+        budgeted = fit_to_budget(request.module, request.text, system_prompt, user_prompt)
+
         # Call AI service
         result_text = await call_claude(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt
+            system_prompt=budgeted.system_prompt,
+            user_prompt=budgeted.user_prompt,
+            max_tokens=budgeted.max_tokens,
+            estimated_input_tokens=budgeted.estimated_input_tokens,
+            module=request.module
         )
 
-        # --- HISTORY SAVING START ---
-        if request.user_email:
-            try:
-                # Find or create user
-                user = db.query(User).filter(User.email == request.user_email).first()
-                if not user:
-                    # Check if they should be premium based on hardcoded list
-                    is_premium = request.user_email in PREMIUM_USERS
-                    user = User(email=request.user_email, is_premium=is_premium)
-                    db.add(user)
-                    db.commit()
-                    db.refresh(user)
-                
-                # Save history
-                history_item = AnalysisHistory(
-                    user_email=user.email,
-                    module=request.module,
-                    input_text=request.text,
-                    result_text=result_text,
-                    meta_data=request.scenario_context or {}
-                )
-                db.add(history_item)
-                db.commit()
-            except Exception as e:
-                logger.error(f"Failed to save history: {e}")
-                # Don't fail the request if history saving fails
-        # --- HISTORY SAVING END ---
+        save_history(db, request, result_text)
+
+        if request.module == AnalysisModule.ROLEPLAY:
+            feedback_drafts.record_turn(request.conversation_id, request.text, result_text)
+
+        if settings.LOOKUP_INDEX_ENABLED:
+            lookup_index.add(request.module, request.text, result_text)
 
         return AIResponse(result=result_text)
 
 
+    except CircuitOpenError as e:
+        # Fail fast: don't wait on an upstream we know is down
+        return degraded_response(request, db, retry_after=e.retry_after)
     except ValueError as ve:
-        logger.warning(f"Validation error in analyze_text: {str(ve)}")
+        logger.warning("Validation error in analyze_text: %s", ve)
         raise HTTPException(
             status_code=400,
             detail=str(ve)
@@ -107,18 +200,227 @@ async def analyze_text(request: TextRequest, db: Session = Depends(get_db)):
         elif "429" in error_msg:
             friendly_error = "Límite de mensajes alcanzado. Por favor, espera un momento."
             raise HTTPException(status_code=429, detail=friendly_error)
+        elif is_upstream_failure(e):
+            return degraded_response(request, db, retry_after=settings.CIRCUIT_RECOVERY_SECONDS)
             
         raise HTTPException(
             status_code=500,
             detail=f"Error técnico: {str(e)}"
         )
 
+# --- STREAMING (long transcripts) ---
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/analyze/stream")
+async def analyze_stream(request: TextRequest):
+    """
+    Like /analyze for message/audio, but streams Server-Sent Events:
+    `progress` ({done, total}) as each chunk finishes, then `result` or `error`.
+    """
+    if request.module not in CHUNKED_MODULES:
+        raise HTTPException(status_code=400, detail="El modo progresivo solo está disponible para mensajes y audio.")
+    check_length(request)
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def on_progress(done: int, total: int):
+        await queue.put(sse_event("progress", {"done": done, "total": total}))
+
+    async def run():
+        try:
+            result_text = await analyze_chunked(
+                request.module, request.text, user_profile=request.user_profile, on_progress=on_progress
+            )
+            db = SessionLocal()
+            try:
+                save_history(db, request, result_text)
+            finally:
+                db.close()
+            await queue.put(sse_event("result", {"result": result_text}))
+        except CircuitOpenError as e:
+            await queue.put(sse_event("error", {
+                "detail": "El servicio de IA no está disponible en este momento. Por favor, inténtalo de nuevo en unos segundos.",
+                "retry_after": math.ceil(e.retry_after)
+            }))
+        except Exception as e:
+            logger.exception("Unexpected error during streamed analysis")
+            await queue.put(sse_event("error", {"detail": f"Error técnico: {str(e)}"}))
+        finally:
+            await queue.put(None)
+
+    async def events():
+        task = asyncio.create_task(run())
+        try:
+            while (item := await queue.get()) is not None:
+                yield item
+        finally:
+            # Client went away: stop spending upstream calls on it
+            task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# --- ASYNC JOBS (long analyses) ---
+# POST /api/jobs answers 202 straight away; the analysis runs in the job pool
+# (same logic as /analyze) and the result is stored, so a client that drops
+# the connection polls GET /api/jobs/{id} or re-attaches to the SSE watch
+# instead of starting over.
+
+async def run_job(request: TextRequest) -> AIResponse:
+    """Job pool executor: one /analyze call with a session of its own."""
+    db = SessionLocal()
+    try:
+        return await analyze_text(request, db)
+    finally:
+        db.close()
+
+@router.post("/jobs", status_code=202)
+async def submit_job(request: TextRequest, response: Response, idempotency_key: Optional[str] = Header(None)):
+    """
+    Queues an analysis. Retrying with the same Idempotency-Key (and the same
+    body) returns the same job; the key is scoped to the user.
+    """
+    if request.module not in {module.value for module in AnalysisModule}:
+        raise HTTPException(status_code=400, detail=f"Módulo no válido: {request.module}")
+    check_length(request)
+    try:
+        job = await job_runner.submit(request, idempotency_key)
+    except JobQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="El servicio está muy ocupado ahora mismo. Inténtalo de nuevo en unos segundos.",
+            headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_SECONDS)}
+        )
+    except IdempotencyKeyReused:
+        raise HTTPException(
+            status_code=422,
+            detail="Esta Idempotency-Key ya se usó para otra petición. Usa una clave nueva."
+        )
+    response.headers["Location"] = f"/api/jobs/{job['id']}"
+    return job
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, response: Response):
+    job = await job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado.")
+    if job["status"] not in FINISHED:
+        response.headers["Retry-After"] = "1"
+    return job
+
+@router.get("/jobs/{job_id}/events")
+async def watch_job(job_id: str):
+    """
+    Server-Sent Events for a job: `status` on every change, then `result`
+    (the AIResponse) or `error` ({status_code, detail}). Safe to reconnect.
+    """
+    job = await job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado.")
+
+    async def events():
+        current, last_status = job, None
+        while True:
+            if current["status"] != last_status:
+                last_status = current["status"]
+                yield sse_event("status", {"status": last_status})
+            if current["status"] == "done":
+                yield sse_event("result", current["result"])
+                return
+            if current["status"] == "error":
+                yield sse_event("error", current["error"])
+                return
+            await job_runner.wait(job_id, timeout=settings.JOBS_WATCH_POLL_SECONDS)
+            current = await job_runner.get(job_id) or current
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# --- CONDITIONAL GET / DELTA SYNC ---
+# Each user's history and wellbeing logs have a version: the newest history id,
+# and the latest wellbeing change in microseconds. It is read with one indexed
+# query and sent as the ETag, so a repeat visit with If-None-Match gets a 304
+# without loading any rows, and `?since=<version>` returns only what is newer.
+# A delta bigger than the list limit would leave the client's copy with gaps
+# under a version past them, so then the full list comes back instead, marked
+# with X-Sync-Full for the client to replace its copy rather than merge.
+
+HISTORY_LIMIT = 50
+WELLBEING_LIMIT = 30
+EPOCH = datetime(1970, 1, 1)
+
+def to_version(moment: Optional[datetime]) -> int:
+    return (moment - EPOCH) // timedelta(microseconds=1) if moment else 0
+
+def from_version(version: int) -> datetime:
+    return EPOCH + timedelta(microseconds=version)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None: # Takes precedence over If-Modified-Since (RFC 9110)
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def sync_rows(query, changed, order, limit: int, since: Optional[int], response: Response) -> list:
+    """The rows matching `changed` if they all fit in `limit`, else the full (newest `limit`) list."""
+    if since is not None:
+        rows = query.filter(changed).order_by(order).limit(limit + 1).all()
+        if len(rows) <= limit:
+            return rows
+        response.headers["X-Sync-Full"] = "1"
+    return query.order_by(order).limit(limit).all()
+
+def version_headers(version: int, last_modified: Optional[datetime]) -> dict:
+    headers = {"ETag": f'"{version}"', "Cache-Control": "private, no-cache"} # Always revalidate
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
 @router.get("/history")
-def get_history(email: str, db: Session = Depends(get_db)):
-    """Fetch analysis history for a specific user email."""
+def get_history(email: str, request: Request, response: Response, since: Optional[int] = Query(None, ge=0),
+                db: Session = Depends(get_db)):
+    """
+    Fetch analysis history for a specific user email (newest first).
+    With `since`, only the items added after that version (or all of them, see sync_rows).
+    """
     if not email:
         return []
-        
+
+    version, last_modified = db.query(
+        func.max(AnalysisHistory.id), func.max(AnalysisHistory.timestamp)
+    ).filter(AnalysisHistory.user_email == email).one()
+    headers = version_headers(version or 0, last_modified)
+    if not_modified(request, headers["ETag"], last_modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    if version is None or (since is not None and since >= version):
+        return []
+
+    query = db.query(AnalysisHistory).filter(AnalysisHistory.user_email == email)
+    history = sync_rows(query, AnalysisHistory.id > (since or 0), AnalysisHistory.timestamp.desc(),
+                        HISTORY_LIMIT, since, response)
+
     return [{
         "id": h.id,
         "module": h.module,
@@ -164,14 +466,28 @@ def save_wellbeing(request: WellbeingRequest, db: Session = Depends(get_db)):
         return {"status": "created", "level": request.battery_level}
 
 @router.get("/wellbeing")
-def get_wellbeing(email: str, db: Session = Depends(get_db)):
-    """Get last 30 days of wellbeing logs."""
-    logs = db.query(WellbeingLog).filter(
-        WellbeingLog.user_email == email
-    ).order_by(WellbeingLog.date.asc()).limit(30).all()
-    
+def get_wellbeing(email: str, request: Request, response: Response, since: Optional[int] = Query(None, ge=0),
+                  db: Session = Depends(get_db)):
+    """
+    Get the latest 30 wellbeing logs, oldest first.
+    With `since`, only the logs created or updated after that version (or all of them, see sync_rows).
+    """
+    last_modified = db.query(func.max(WellbeingLog.updated_at)).filter(WellbeingLog.user_email == email).scalar()
+    version = to_version(last_modified)
+    headers = version_headers(version, last_modified)
+    if not_modified(request, headers["ETag"], last_modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    if not version or (since is not None and since >= version):
+        return []
+
+    query = db.query(WellbeingLog).filter(WellbeingLog.user_email == email)
+    logs = sync_rows(query, WellbeingLog.updated_at > from_version(since or 0), WellbeingLog.date.desc(),
+                     WELLBEING_LIMIT, since, response)
+
     return [{
+        "id": log.id,
         "date": log.date.isoformat(),
         "battery_level": log.battery_level,
         "notes": log.notes
-    } for log in logs]
+    } for log in reversed(logs)]
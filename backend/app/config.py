@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
+import tempfile
 from pathlib import Path
 from typing import Optional
 
@@ -7,11 +8,111 @@ BACKEND_ROOT = Path(__file__).resolve().parent.parent
 class Settings(BaseSettings):
     CLAUDE_API_KEY: Optional[str] = None # Optional to prevent startup crash if env var missing
     CLAUDE_MODEL: str = "claude-sonnet-4-5-20250929" # Updated to Claude Sonnet 4.5 (Sep 2025)
+    ANTHROPIC_BASE_URL: Optional[str] = None # Point at tools/fake_anthropic.py for local load tests
     GOOGLE_CLIENT_ID: Optional[str] = None
     GOOGLE_CLIENT_SECRET: Optional[str] = None
     SECRET_KEY: str = "secret-key-for-dev"
     RENDER: bool = False # Render sets this automatically
     DATABASE_URL: Optional[str] = None
+    FRONTEND_DIR: Optional[Path] = None # Defaults to <repo>/frontend
+    WARMUP_ON_STARTUP: bool = True # Import anthropic/authlib in the background once the port is bound
+    WARMUP_DELAY_SECONDS: float = 1.0
+    HEALTH_REFRESH_SECONDS: float = 15.0 # How often /readyz's snapshot is rebuilt
+    ENABLE_DIAGNOSTICS: bool = False # Admin flag for /debug-system (walks the filesystem)
+
+    # Logging: records go through a queue and are written to stdout by a background thread
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json" # 'json' (one object per line) or 'text'
+    LOG_QUEUE_SIZE: int = 10000 # Records beyond this are dropped instead of blocking requests
+    LOG_SAMPLE_RATE: float = 1.0 # Fraction of high-volume info records (per request / per call) kept
+
+    # SQLite (the fallback database): WAL, one writer connection and a read pool per worker
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KB: int = 20000
+    SQLITE_READ_POOL_SIZE: int = 8
+    SQLITE_WRITER_TIMEOUT_SECONDS: float = 30.0 # Max wait for the writer connection
+
+    # Server-side sessions: 'memory' (single worker) or 'db' (shared between workers)
+    SESSION_BACKEND: str = "memory"
+    SESSION_TTL_SECONDS: int = 14 * 24 * 60 * 60
+    SESSION_MAX_ENTRIES: int = 10000
+    SESSION_PURGE_SECONDS: float = 3600.0 # How often the 'db' backend deletes expired sessions
+
+    # State shared by the workers (entitlement invalidation, circuit state, rate limits, lookup answers):
+    # 'memory' (single worker) or 'sqlite' (a WAL file used by every worker on the machine)
+    SHARED_STATE_BACKEND: str = "memory"
+    SHARED_STATE_PATH: Path = Path(tempfile.gettempdir()) / "enclaro_shared_state.db"
+    SHARED_STATE_BUSY_TIMEOUT_MS: int = 100 # Give up quickly on a locked store, callers fall back to local state
+
+    # Admission control: excess requests get 503 + Retry-After instead of queueing
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_ANALYZE: int = 32 # In-flight /api/analyze* requests per worker
+    ADMISSION_MAX_API: int = 64 # Other /api and /auth requests (static, health, wellbeing are never limited)
+    ADMISSION_MAX_STREAMS: int = 256 # Open /api/jobs/{id}/events watches (idle connections, cheap)
+    ADMISSION_MAX_LOOP_LAG_MS: float = 250.0 # Shed analyze calls while the event loop is this far behind
+    ADMISSION_MAX_UPSTREAM: int = 48 # ... or while this many Claude calls are already pending
+    ADMISSION_RETRY_AFTER_SECONDS: int = 2
+
+    # Token budget: prompts are trimmed to fit CONTEXT_TOKEN_TARGET (input + reserved output)
+    CONTEXT_TOKEN_TARGET: int = 16000
+    CHARS_PER_TOKEN: float = 3.5
+
+    # Request hedging: duplicate a call still pending after the module's p95 latency
+    HEDGE_ENABLED: bool = False
+    HEDGE_PERCENTILE: float = 0.95
+    HEDGE_MIN_SAMPLES: int = 20 # Observed calls per module before hedging kicks in
+    HEDGE_MAX_RATE: float = 0.05 # Max fraction of calls that may be hedged
+
+    # Upstream timeouts and circuit breaker
+    CLAUDE_TIMEOUT_SECONDS: float = 60.0
+    CLAUDE_MAX_RETRIES: int = 2
+    CIRCUIT_FAILURE_THRESHOLD: int = 5 # Consecutive upstream failures before the circuit opens
+    CIRCUIT_RECOVERY_SECONDS: float = 30.0 # Time open before a trial call is allowed
+    UPSTREAM_MAX_CALLS_PER_MINUTE: int = 0 # Claude calls per minute across all workers (0 = no limit)
+    UPSTREAM_BACKOFF_SECONDS: float = 10.0 # Pause for every worker after a 429 without Retry-After
+
+    # Local answer index for glossary/translator (normalized key + MinHash near-duplicates)
+    LOOKUP_INDEX_ENABLED: bool = True
+    LOOKUP_SIMILARITY_THRESHOLD: float = 0.85 # Jaccard similarity of character 3-grams
+    LOOKUP_SHARED_TTL_SECONDS: int = 24 * 60 * 60 # New answers are also published to shared state for other workers
+
+    # Map-reduce analysis of long message/audio transcripts
+    CHUNK_MAX_CHARS: int = 12000 # Inputs longer than this are split into chunks of this size
+    CHUNK_CONCURRENCY: int = 4 # Claude calls in flight per chunked analysis
+
+    # Roleplay feedback drafted in the background while the conversation happens
+    FEEDBACK_DRAFTS_ENABLED: bool = True
+    FEEDBACK_DRAFT_DEBOUNCE_SECONDS: float = 2.0 # Wait for the user's next turn before updating
+    FEEDBACK_DRAFT_MAX_UPSTREAM: int = 8 # Only draft while fewer Claude calls than this are in flight
+    FEEDBACK_DRAFT_CONCURRENCY: int = 2
+    FEEDBACK_DRAFT_MAX_CONVERSATIONS: int = 1000
+    FEEDBACK_DRAFT_TTL_SECONDS: float = 3600
+
+    # Async jobs (POST /api/jobs): long analyses run by a worker pool, results kept in the DB
+    JOBS_CONCURRENCY: int = 4 # Jobs running at once per worker
+    JOBS_MAX_QUEUED: int = 200 # Per worker; beyond this POST /api/jobs answers 503
+    JOBS_STALE_SECONDS: float = 600 # A job still running after this lost its worker and is run again
+    JOBS_MAX_ATTEMPTS: int = 2
+    JOBS_SWEEP_SECONDS: float = 30 # Pick up jobs left queued by other workers, purge old ones
+    JOBS_TTL_SECONDS: int = 24 * 60 * 60 # Finished jobs are kept this long
+    JOBS_WATCH_POLL_SECONDS: float = 1.0 # SSE watch: how often to re-read a job running on another worker
+
+    # Traffic capture for capacity planning (replayed with tools/replay_traffic.py). Opt-in;
+    # records request shapes only (module, sizes, flags, status, latency, Claude token usage)
+    TRAFFIC_CAPTURE_ENABLED: bool = False
+    TRAFFIC_CAPTURE_PATH: Path = BACKEND_ROOT / "traffic" / "capture.jsonl" # One file per worker: capture-<pid>.jsonl
+    TRAFFIC_CAPTURE_MAX_BYTES: int = 20 * 1024 * 1024 # Rotated at this size...
+    TRAFFIC_CAPTURE_BACKUPS: int = 5 # ... keeping this many old files
+    TRAFFIC_CAPTURE_SAMPLE_RATE: float = 1.0
+
+    # Precomputed idiom knowledge base (built with tools/build_kb.py)
+    KB_PATH: Path = BACKEND_ROOT / "kb" / "idioms_kb.sqlite"
+
+    # Premium entitlements (User.is_premium) cache
+    ENTITLEMENT_CACHE_TTL_SECONDS: int = 300
+    ENTITLEMENT_NEGATIVE_TTL_SECONDS: int = 60
+    PREMIUM_EMAILS: str = "" # Comma-separated emails granted premium at startup
     
     # Environment file configuration
     model_config = SettingsConfigDict(
@@ -22,6 +123,16 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
+def frontend_dir() -> Path:
+    if settings.FRONTEND_DIR:
+        return settings.FRONTEND_DIR
+    # Built by tools/build_assets.py on deploy; fall back to the raw sources in dev
+    dist = BACKEND_ROOT.parent / "frontend" / "dist"
+    return dist if (dist / "index.html").is_file() else BACKEND_ROOT.parent / "frontend"
+
+def premium_seed_emails() -> list[str]:
+    return [e.strip() for e in settings.PREMIUM_EMAILS.split(",") if e.strip()]
+
 # Export for convenience, though using 'settings' object is preferred
 CLAUDE_API_KEY = settings.CLAUDE_API_KEY
 CLAUDE_MODEL = settings.CLAUDE_MODEL
@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import re
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -8,88 +10,139 @@ from pathlib import Path
 import os
 
 
-from .api.routes import router
+from .api.routes import router, run_job
 from .services.claude_client import close_client
-from .utils.logging_config import setup_logging
-from .models.db import init_db
+from .services import claude_client
+from .utils.logging_config import setup_logging, stop_logging, RequestContextMiddleware
+from .models.db import init_db, SessionLocal
+from .services.entitlements import entitlements
+from .services.lookup_index import lookup_index
+from .services.feedback_drafts import feedback_drafts
+from .services.jobs import job_runner
+from .services.traffic_capture import traffic_capture, TrafficCaptureMiddleware
+from .services.knowledge_base import load_knowledge_base
+
+from .services.session_store import ServerSessionMiddleware, create_session_store, STATIC_PREFIXES
+from .services.health import HealthMonitor
+from .services.admission import AdmissionController, AdmissionMiddleware
+from .services.prompt_router import preload_prompts
+from .api.auth import router as auth_router, get_oauth
+from .config import settings, frontend_dir
 
-from starlette.middleware.sessions import SessionMiddleware
-from .api.auth import router as auth_router
-from .config import settings
-
-# Professional logging setup
-setup_logging()
 logger = logging.getLogger(__name__)
 
 STARTUP_ERRORS = []
 
-# Middleware to force UTF-8 on all static files
-# Middleware definition moved below app initialization
+def warmup():
+    """
+    Loads the heavy SDKs (anthropic, authlib) after the server is already accepting
+    connections, so a cold start doesn't wait for them. Runs in a worker thread.
+    """
+    try:
+        claude_client.warmup()
+        get_oauth()
+        logger.info("Warmup finished: Anthropic client and OAuth ready.")
+    except Exception as e:
+        logger.exception("Warmup failed: %s", e)
+        STARTUP_ERRORS.append(f"Warmup Failed: {str(e)}")
+
+async def delayed_warmup():
+    # Give the server a moment to bind and answer its first requests before
+    # the imports start competing for the GIL
+    await asyncio.sleep(settings.WARMUP_DELAY_SECONDS)
+    await asyncio.to_thread(warmup)
+    # Don't wait for the next periodic refresh to report ready
+    await asyncio.to_thread(health_monitor.refresh)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup logic
+    # Professional logging setup (queued: stdout writes happen off the event loop)
+    setup_logging()
     logger.info("Starting En Claro API...")
+    traffic_capture.start() # No-op unless TRAFFIC_CAPTURE_ENABLED
     try:
-        from .config import settings
-        logger.info(f"Database URL Configured: {'postgres' in settings.DATABASE_URL if settings.DATABASE_URL else 'sqlite (default)'}")
+        preload_prompts()
+    except Exception as e:
+        logger.exception("CRITICAL: Prompt loading failed: %s", e)
+        STARTUP_ERRORS.append(f"Prompt Load Failed: {str(e)}")
+
+    try:
+        if settings.KB_PATH.is_file():
+            load_knowledge_base(settings.KB_PATH)
+        else:
+            logger.info("No idiom knowledge base at %s (built offline by tools/build_kb.py and committed)", settings.KB_PATH)
+    except Exception as e:
+        # The KB is an optimization; keep serving without it
+        logger.exception("Idiom knowledge base could not be loaded: %s", e)
+
+    try:
+        logger.info("Database URL Configured: %s", 'postgres' in settings.DATABASE_URL if settings.DATABASE_URL else 'sqlite (default)')
         
         init_db()
         logger.info("Database initialized successfully.")
+
+        # Warm the entitlement cache so premium checks never wait on the DB
+        from .config import premium_seed_emails
+        db = SessionLocal()
+        try:
+            entitlements.seed(db, premium_seed_emails())
+            entitlements.preload(db)
+            if settings.LOOKUP_INDEX_ENABLED:
+                lookup_index.build(db)
+        finally:
+            db.close()
     except Exception as e:
-        logger.exception(f"CRITICAL: Database initialization failed: {e}")
+        logger.exception("CRITICAL: Database initialization failed: %s", e)
         STARTUP_ERRORS.append(f"DB Init Failed: {str(e)}")
         # We continue letting the app start so we can at least serve the frontend/debug endpoints
         # This prevents the "No open HTTP ports" error if DB is the cause of the hang
+
+    # Don't block startup on SDK imports: the port is bound as soon as we yield
+    warmup_task = asyncio.create_task(delayed_warmup()) if settings.WARMUP_ON_STARTUP else None
+    health_task = asyncio.create_task(health_monitor.run())
+    lag_task = asyncio.create_task(admission.lag_monitor.run())
+    session_purge_task = asyncio.create_task(session_store.run(settings.SESSION_PURGE_SECONDS))
+    # Async analyses (POST /api/jobs); also resumes jobs a previous process left unfinished
+    job_runner.start(run_job)
         
     yield
     # Shutdown logic
     logger.info("Shutting down En Claro API...")
+    health_task.cancel()
+    lag_task.cancel()
+    session_purge_task.cancel()
+    if warmup_task:
+        warmup_task.cancel()
+    feedback_drafts.close()
+    await job_runner.close()
     await close_client()
+    traffic_capture.stop()
+    stop_logging()
+
+# Backend serves Frontend. The location comes from settings.FRONTEND_DIR
+# (defaults to ../frontend next to backend/, which is also where it lives on Render).
+FRONTEND_DIR = frontend_dir()
+
+admission = AdmissionController(
+    limits={"analyze": settings.ADMISSION_MAX_ANALYZE, "stream": settings.ADMISSION_MAX_STREAMS,
+            "api": settings.ADMISSION_MAX_API},
+    max_loop_lag_ms=settings.ADMISSION_MAX_LOOP_LAG_MS,
+    max_upstream=settings.ADMISSION_MAX_UPSTREAM,
+    upstream_depth=lambda: claude_client.upstream_inflight,
+    retry_after=settings.ADMISSION_RETRY_AFTER_SECONDS,
+    enabled=settings.ADMISSION_ENABLED
+)
 
-# Use relative path for production (Render) - Backend serves Frontend
-# We need to know where the frontend files are.
-# In production structure: /opt/render/project/src/frontend
-# Local structure: ../frontend (relative to backend/app/main.py)
-
-# Robustly find the frontend directory
-def find_frontend_dir():
-    # 1. Check if on Render and use absolute path
-    if os.environ.get("RENDER"):
-        render_path = Path("/opt/render/project/src/frontend")
-        if render_path.exists():
-            return render_path
-            
-    # 2. Walk up tree for local dev or if absolute path failed
-    current = Path(__file__).resolve().parent
-    for _ in range(5):
-        if (current / "frontend").exists() and (current / "frontend").is_dir():
-            return current / "frontend"
-        current = current.parent
-        if current == current.parent: # Reached root
-            break
-            
-    return None
-
-frontend_path = find_frontend_dir()
-
-if not frontend_path:
-    # Last ditch effort for Render: maybe it's just 'frontend'?
-    if Path("frontend").exists():
-        frontend_path = Path("frontend").resolve()
-    else:
-        logger.error(f"CRITICAL: Frontend directory NOT found. CWD: {os.getcwd()}")
-else:
-    logger.info(f"Frontend found at: {frontend_path}")
-
-logger.info(f"Serving frontend from: {frontend_path}")
+health_monitor = HealthMonitor(
+    interval=settings.HEALTH_REFRESH_SECONDS,
+    frontend_dir=FRONTEND_DIR,
+    startup_errors=STARTUP_ERRORS,
+    admission=admission
+)
 
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
-# ... (rest of imports)
-
-# ...
-
 app = FastAPI(
     title="En Claro API",
     description="Backend for En Claro cognitive support app",
@@ -111,8 +164,20 @@ async def force_utf8_middleware(request: Request, call_next):
 app.add_middleware(ProxyHeadersMiddleware, trusted_hosts="*")
 
 # Add Session Middleware for OAuth
+# The cookie only carries an opaque id; user data stays server-side.
 # https_only=True ensures cookies are only sent over HTTPS (critical for Production)
-app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY, https_only=settings.RENDER)
+session_store = create_session_store(
+    settings.SESSION_BACKEND,
+    ttl_seconds=settings.SESSION_TTL_SECONDS,
+    max_entries=settings.SESSION_MAX_ENTRIES
+)
+app.add_middleware(
+    ServerSessionMiddleware,
+    store=session_store,
+    max_age=settings.SESSION_TTL_SECONDS,
+    skip_prefixes=STATIC_PREFIXES + ("/healthz", "/readyz"),
+    https_only=settings.RENDER
+)
 
 # Configure CORS
 app.add_middleware(
@@ -121,58 +186,91 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Sync-Full"], # History/wellbeing sync version, full list instead of a delta
 )
 
+# Load shedding: runs before sessions/DB so rejected requests cost almost nothing
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# Opt-in workload capture; outside admission so shed requests are recorded too
+app.add_middleware(TrafficCaptureMiddleware, capture=traffic_capture)
+
+# Outermost: request id + latency for every log record of the request
+app.add_middleware(RequestContextMiddleware)
+
 # API routes
 app.include_router(router, prefix="/api")
 app.include_router(auth_router, prefix="/auth")
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.exception(f"Unhandled exception: {exc}")
+    logger.exception("Unhandled exception: %s", exc)
     return JSONResponse(
         status_code=500,
         content={"detail": "Ocurrió un error inesperado en el servidor. Por favor, inténtalo de nuevo más tarde."}
     )
 
-# Define paths
-# Define paths
-BASE_DIR = Path(__file__).resolve().parent.parent.parent
-# Use the robustly found path, or fallback to relative for local dev if find_frontend_dir failed (which shouldn't happen if structure is right)
-FRONTEND_DIR = frontend_path if frontend_path else (BASE_DIR / "frontend")
-
 # Serve Frontend Static Files
-if FRONTEND_DIR and FRONTEND_DIR.exists():
+HASHED_ASSET = re.compile(r"\.[0-9a-f]{8}\.(js|css)$")
+
+class CachedStaticFiles(StaticFiles):
+    """Content-hashed files from tools/build_assets.py never change, so browsers can keep them forever."""
+    def file_response(self, full_path, *args, **kwargs):
+        response = super().file_response(full_path, *args, **kwargs)
+        if HASHED_ASSET.search(str(full_path)):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+if FRONTEND_DIR.is_dir():
     # Mount specific directories to specific paths
-    app.mount("/css", StaticFiles(directory=FRONTEND_DIR / "css"), name="css")
-    app.mount("/js", StaticFiles(directory=FRONTEND_DIR / "js"), name="js")
+    app.mount("/css", CachedStaticFiles(directory=FRONTEND_DIR / "css"), name="css")
+    app.mount("/js", CachedStaticFiles(directory=FRONTEND_DIR / "js"), name="js")
     
-    # Mount images/assets if they exist
-    if (FRONTEND_DIR / "assets").exists():
+    # Mount images/assets if they exist (logo)
+    if (FRONTEND_DIR / "assets").is_dir():
         app.mount("/assets", StaticFiles(directory=FRONTEND_DIR / "assets"), name="assets")
 
-    # Mount assets if they exist (newly added for logo)
-    assets_dir = FRONTEND_DIR / "assets"
-    if assets_dir.exists():
-        app.mount("/assets", StaticFiles(directory=assets_dir), name="assets")
-
     # One single root handler
     @app.get("/")
     async def serve_index():
-        return FileResponse(FRONTEND_DIR / "index.html")
+        # Always revalidated, so a deploy picks up the new hashed bundles
+        return FileResponse(FRONTEND_DIR / "index.html", headers={"Cache-Control": "no-cache"})
 
     # Catch-all for other static files or client-side routing
     # catch_all moved to end
 
 else:
-    logger.warning(f"Frontend directory not found at {FRONTEND_DIR}")
+    logger.warning("Frontend directory not found at %s", FRONTEND_DIR)
     @app.get("/")
     async def root():
         return {"message": "API running, but frontend files not found. Check server logs."}
 
+# --- HEALTH PROBES ---
+HEALTHZ_BODY = b'{"status":"ok"}'
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: touches nothing, only proves the event loop answers."""
+    return Response(content=HEALTHZ_BODY, media_type="application/json")
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness: returns the snapshot refreshed in the background by HealthMonitor.
+    Errors and metrics only with ENABLE_DIAGNOSTICS, the checks are enough for a probe.
+    """
+    snapshot = health_monitor.snapshot
+    content = snapshot if settings.ENABLE_DIAGNOSTICS else {
+        "ready": snapshot["ready"],
+        "checks": {name: bool(ok) for name, ok in snapshot["checks"].items()}
+    }
+    return JSONResponse(status_code=200 if snapshot["ready"] else 503, content=content)
+
 @app.get("/debug-system")
 async def debug_system():
-    """Diagnostic endpoint to find where files are hidden"""
+    """Diagnostic endpoint to find where files are hidden (only with ENABLE_DIAGNOSTICS)"""
+    if not settings.ENABLE_DIAGNOSTICS:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
     import os
     cwd = os.getcwd()
     
@@ -1,8 +1,13 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON
+import tempfile
+import zlib
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, inspect, text, Insert, Update, Delete, Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session, sessionmaker, relationship
 from datetime import datetime
+from pathlib import Path
 from ..config import settings
 
 # --- Database Config ---
@@ -14,10 +19,63 @@ if os.getenv("RENDER"):
 else:
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./enclaro.db")
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def _sqlite_pragmas(engine, read_only: bool) -> None:
+    """Applied to every new connection (pragmas are per connection, except journal_mode)."""
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy's "begin" event emit BEGIN instead of the driver
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL") # Readers don't block the writer and vice versa
+        cursor.execute("PRAGMA synchronous=NORMAL") # Safe with WAL; fsync only at checkpoints
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}") # Wait for locks, don't fail
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON") # A misrouted write fails loudly
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def on_begin(connection):
+        # Writers take the write lock up front, so busy_timeout applies
+        # instead of failing with "database is locked" when upgrading a read lock
+        connection.exec_driver_sql("BEGIN" if read_only else "BEGIN IMMEDIATE")
+
+def create_engines(url: str):
+    """
+    Returns (writer, reader) engines. For a SQLite file: one serialized writer
+    connection (pool of 1) and a pool of read-only connections, both in WAL
+    mode. Any other database gets one engine for both.
+    """
+    if not url.startswith("sqlite") or ":memory:" in url or url.rstrip("/") == "sqlite:":
+        engine = create_engine(url, connect_args={"check_same_thread": False} if url.startswith("sqlite") else {})
+        return engine, engine
+
+    connect_args = {"check_same_thread": False}
+    writer = create_engine(url, connect_args=connect_args, pool_size=1, max_overflow=0,
+                           pool_timeout=settings.SQLITE_WRITER_TIMEOUT_SECONDS)
+    reader = create_engine(url, connect_args=connect_args, pool_size=settings.SQLITE_READ_POOL_SIZE, max_overflow=16)
+    _sqlite_pragmas(writer, read_only=False)
+    _sqlite_pragmas(reader, read_only=True)
+    return writer, reader
+
+class RoutingSession(Session):
+    """Flushes and bulk UPDATE/DELETE/INSERT go to the writer engine, everything else to the read pool."""
+
+    def __init__(self, *args, writer=None, reader=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writer = writer
+        self.reader = reader
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            return self.writer
+        return self.reader
+
+engine, read_engine = create_engines(DATABASE_URL)
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False,
+                            writer=engine, reader=read_engine)
 
 Base = declarative_base()
 
@@ -28,7 +86,7 @@ class User(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
-    is_premium = Column(Boolean, default=False)
+    is_premium = Column(Boolean, default=False, index=True) # Premium users are preloaded at startup
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationship
@@ -48,6 +106,11 @@ class AnalysisHistory(Base):
     # Relationship
     user = relationship("User", back_populates="history")
 
+    __table_args__ = (
+        Index("ix_history_user_email_timestamp", "user_email", "timestamp"), # A user's history, newest first
+        Index("ix_history_module_id", "module", "id"), # Latest answers per module (lookup index, stale fallback)
+    )
+
 class WellbeingLog(Base):
     __tablename__ = "wellbeing_logs"
 
@@ -56,13 +119,46 @@ class WellbeingLog(Base):
     battery_level = Column(Integer) # 0-100
     date = Column(DateTime, default=datetime.utcnow) # We will normalize to date in logic
     notes = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) # Sync version (GET /api/wellbeing?since=)
 
     # Relationship
     user = relationship("User", back_populates="wellbeing_logs")
 
+    __table_args__ = (
+        Index("ix_wellbeing_logs_user_email_date", "user_email", "date"),
+        Index("ix_wellbeing_logs_user_email_updated_at", "user_email", "updated_at"), # A user's latest change
+    )
+
 # Update User relationship
 User.wellbeing_logs = relationship("WellbeingLog", back_populates="user")
 
+class ServerSession(Base):
+    __tablename__ = "sessions"
+
+    id = Column(String, primary_key=True) # Opaque id stored in the browser cookie
+    data = Column(JSON, default={})
+    expires_at = Column(DateTime, index=True)
+
+class AnalysisJob(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True) # Opaque id returned by POST /api/jobs
+    idempotency_key = Column(String, unique=True, index=True, nullable=True) # Hash of the caller and their Idempotency-Key: a retried POST gets the same job
+    module = Column(String)
+    request = Column(JSON) # The TextRequest to run
+    status = Column(String, default="queued") # queued -> running -> done | error
+    result = Column(JSON, nullable=True) # AIResponse when done
+    error = Column(Text, nullable=True)
+    error_status = Column(Integer, nullable=True) # Status the same request would have got from /api/analyze
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_created_at", "status", "created_at"), # Sweeps: queued/stale jobs, purge of old ones
+    )
+
 # --- Dependency ---
 def get_db():
     db = SessionLocal()
@@ -71,6 +167,82 @@ def get_db():
     finally:
         db.close()
 
+# --- Migrations ---
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent.parent / "migrations"
+# Latest revision in migrations/versions (tests check they agree). Lets startup
+# on an up-to-date or empty database skip importing Alembic (~150 ms).
+HEAD_REVISION = "0004"
+
+def alembic_config(connection=None):
+    from alembic.config import Config
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
 # --- Init DB ---
-def init_db():
-    Base.metadata.create_all(bind=engine)
+@contextmanager
+def bootstrap_lock(bind):
+    """
+    Cross-process lock for schema setup: gunicorn starts all its workers at
+    once and each one runs init_db. A file lock next to the SQLite file (or in
+    the temp dir for other databases); no-op where fcntl doesn't exist.
+    """
+    try:
+        import fcntl
+    except ImportError: # Windows dev machines run a single process anyway
+        yield
+        return
+    database = bind.url.database if bind.url.get_backend_name() == "sqlite" else None
+    if database and database != ":memory:":
+        path = Path(f"{database}.init.lock")
+    else:
+        path = Path(tempfile.gettempdir()) / f"enclaro-init-{zlib.crc32(str(bind.url).encode()):08x}.lock"
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def init_db(bind=None):
+    """
+    Upgrades the schema to the latest Alembic migration (backend/migrations).
+    Databases created by the old create_all() are picked up by the first
+    migration, which only creates the tables that are missing.
+    Safe to run from several processes at once: the first one does the work.
+    """
+    bind = bind or engine
+    if current_revision(bind) == HEAD_REVISION:
+        return
+    with bootstrap_lock(bind):
+        revision = current_revision(bind) # Re-read: another worker may have just finished
+        if revision == HEAD_REVISION:
+            return
+        if revision is None and not inspect(bind).get_table_names():
+            # Brand-new database (every deploy with SQLite in /tmp): the models are the
+            # head schema (tests check they match the migrations), so skip Alembic
+            try:
+                with bind.begin() as connection:
+                    Base.metadata.create_all(connection)
+                    connection.execute(text(
+                        "CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL, "
+                        "CONSTRAINT alembic_version_pkc PRIMARY KEY (version_num))"
+                    ))
+                    connection.execute(text("INSERT INTO alembic_version (version_num) VALUES (:v)"), {"v": HEAD_REVISION})
+            except (OperationalError, ProgrammingError):
+                # Lost the race to a process the file lock doesn't cover (e.g. another host)
+                if current_revision(bind) != HEAD_REVISION:
+                    raise
+            return
+        from alembic import command
+        with bind.begin() as connection:
+            command.upgrade(alembic_config(connection), "head")
+
+def current_revision(bind) -> str | None:
+    try:
+        with bind.connect() as connection:
+            return connection.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except (OperationalError, ProgrammingError): # Postgres raises the latter
+        return None # Not migrated yet
@@ -6,9 +6,12 @@ class TextRequest(BaseModel):
     user_profile: dict = {} # e.g. {"name": "Andrea", "gender": "femenino"}
     user_email: str | None = None # For premium checks
     scenario_context: dict = {} # e.g. {"character_name": "Sofía", "role": "Amiga"}
+    conversation_id: str | None = None # Roleplay session: links its turns to the final feedback request
 
 class AIResponse(BaseModel):
     result: str
+    degraded: bool = False # True when served from a stale cached answer because the AI is unavailable
+    kb_version: str | None = None # Set when answered from the precomputed idiom knowledge base
 
 class WellbeingRequest(BaseModel):
     user_email: str
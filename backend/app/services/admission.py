@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import Callable
+from .session_store import STATIC_PREFIXES
+
+logger = logging.getLogger(__name__)
+
+# Traffic classes, each with its own in-flight limit:
+# - analyze: Claude-backed, slow and expensive; shed first (includes submitting a job)
+# - stream: SSE job watches, long-lived but idle; own limit so they can't starve "api"
+# - api: other API/auth calls (history, login...)
+# - light: static files, health probes, the SPA shell and wellbeing reads/writes; never shed
+ANALYZE_PREFIXES = ("/api/analyze",)
+JOB_SUBMIT_PATH = "/api/jobs"
+JOB_EVENTS = re.compile(r"^/api/jobs/[^/]+/events$")
+LIGHT_PREFIXES = STATIC_PREFIXES + ("/healthz", "/readyz", "/api/wellbeing")
+API_PREFIXES = ("/api", "/auth")
+
+REJECT_BODY = json.dumps(
+    {"detail": "El servicio está muy ocupado ahora mismo. Inténtalo de nuevo en unos segundos."},
+    ensure_ascii=False
+).encode("utf-8")
+
+
+def classify(path: str, method: str = "GET") -> str:
+    if path.startswith(ANALYZE_PREFIXES) or (method == "POST" and path == JOB_SUBMIT_PATH):
+        return "analyze"
+    if JOB_EVENTS.match(path):
+        return "stream"
+    if path.startswith(LIGHT_PREFIXES) or not path.startswith(API_PREFIXES):
+        return "light"
+    return "api"
+
+
+class LoopLagMonitor:
+    """Measures how late a short sleep wakes up: a direct reading of event-loop saturation."""
+
+    def __init__(self, interval: float = 0.1, smoothing: float = 0.3):
+        self.interval = interval
+        self.smoothing = smoothing
+        self.lag_ms = 0.0
+
+    async def run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, (time.perf_counter() - start - self.interval) * 1000)
+            self.lag_ms += self.smoothing * (lag - self.lag_ms)
+
+
+class AdmissionController:
+    """
+    Decides per request whether to admit it, from in-flight counts per class,
+    event-loop lag and how many Claude calls are already waiting upstream.
+    Everything is read and updated on the event loop, so no locking.
+    """
+
+    def __init__(self, limits: dict, max_loop_lag_ms: float, max_upstream: int,
+                 upstream_depth: Callable[[], int], retry_after: int, enabled: bool = True):
+        self.enabled = enabled
+        self.limits = limits
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.max_upstream = max_upstream
+        self.upstream_depth = upstream_depth
+        self.retry_after = retry_after
+        self.lag_monitor = LoopLagMonitor()
+        self.in_flight = {name: 0 for name in ("analyze", "stream", "api", "light")}
+        self.metrics = {"admitted": 0, "rejected": {}}
+
+    def rejection_reason(self, traffic_class: str):
+        if not self.enabled or traffic_class == "light":
+            return None
+        limit = self.limits.get(traffic_class)
+        if limit is not None and self.in_flight[traffic_class] >= limit:
+            return "in_flight"
+        if traffic_class == "analyze":
+            if self.lag_monitor.lag_ms > self.max_loop_lag_ms:
+                return "loop_lag"
+            if self.upstream_depth() >= self.max_upstream:
+                return "upstream_queue"
+        return None
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": dict(self.in_flight),
+            "loop_lag_ms": round(self.lag_monitor.lag_ms, 2),
+            "upstream_depth": self.upstream_depth(),
+            **self.metrics,
+            "rejected": dict(self.metrics["rejected"]),
+        }
+
+
+class AdmissionMiddleware:
+    """Rejects requests the controller won't admit with 503 + Retry-After before any work is done."""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        controller = self.controller
+        traffic_class = classify(scope["path"], scope["method"])
+        reason = controller.rejection_reason(traffic_class)
+        if reason:
+            key = f"{traffic_class}:{reason}"
+            controller.metrics["rejected"][key] = controller.metrics["rejected"].get(key, 0) + 1
+            logger.warning("Shedding %s request (%s)", traffic_class, reason)
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(REJECT_BODY)).encode()),
+                    (b"retry-after", str(controller.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": REJECT_BODY})
+            return
+
+        controller.metrics["admitted"] += 1
+        controller.in_flight[traffic_class] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.in_flight[traffic_class] -= 1
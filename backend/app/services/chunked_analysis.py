@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable, Optional
+from ..models.enums import AnalysisModule
+from ..config import settings
+from .prompt_router import get_prompts
+from .token_budget import estimate_tokens, fit_to_budget, DEFAULT_OUTPUT_TOKENS, MODULE_OUTPUT_TOKENS, MESSAGE_OVERHEAD_TOKENS
+from . import claude_client
+
+logger = logging.getLogger(__name__)
+
+# Long transcripts / messages that can be analyzed piece by piece and merged
+CHUNKED_MODULES = {AnalysisModule.MESSAGE, AnalysisModule.AUDIO}
+
+# "Ana: ..." / "SPEAKER 1: ..." at the start of a line starts a new speaker turn
+_SPEAKER_TURN = re.compile(r"\n(?=[^\n:]{1,40}:\s)")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+CHUNK_NOTE = "(Fragmento {index} de {total} de un texto más largo. Analiza solo este fragmento.)\n\n"
+
+REDUCE_INSTRUCTIONS = (
+    "\n\nAhora vas a recibir varias interpretaciones parciales de fragmentos consecutivos "
+    "de un mismo texto. Combínalas en una única interpretación coherente del texto completo, "
+    "usando el mismo formato de respuesta. Elimina repeticiones y no menciones los fragmentos."
+)
+
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+def _split_long(segment: str, max_chars: int) -> list[str]:
+    """Last resort for a single sentence longer than a chunk: cut at whitespace."""
+    pieces = []
+    while len(segment) > max_chars:
+        cut = segment.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(segment[:cut])
+        segment = segment[cut:].lstrip()
+    if segment:
+        pieces.append(segment)
+    return pieces
+
+
+def split_into_chunks(text: str, max_chars: int) -> list[str]:
+    """
+    Splits at speaker turns, then sentences, and greedily packs the pieces into
+    chunks of at most `max_chars` so no sentence is cut in half.
+    """
+    segments = []
+    for turn in _SPEAKER_TURN.split(text):
+        if len(turn) <= max_chars:
+            segments.append(turn)
+            continue
+        for sentence in _SENTENCE_END.split(turn):
+            segments.extend(_split_long(sentence, max_chars))
+
+    chunks, current = [], ""
+    for segment in segments:
+        separator = "\n" if current else ""
+        if current and len(current) + len(separator) + len(segment) > max_chars:
+            chunks.append(current)
+            current, separator = "", ""
+        current += separator + segment
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+async def _call(module: str, text: str, system_prompt: str, user_prompt: str) -> str:
+    """One Claude call with the module's output budget, like the /analyze path."""
+    budgeted = fit_to_budget(module, text, system_prompt, user_prompt)
+    return await claude_client.call_claude(
+        system_prompt=budgeted.system_prompt,
+        user_prompt=budgeted.user_prompt,
+        max_tokens=budgeted.max_tokens,
+        estimated_input_tokens=budgeted.estimated_input_tokens,
+        module=module
+    )
+
+
+async def _reduce(module: str, parts: list[str], semaphore: asyncio.Semaphore) -> str:
+    """
+    Merges partial interpretations; merges in groups first if they don't fit one prompt.
+    Raises ValueError if a round doesn't bring the number of parts down.
+    """
+    system_prompt, _ = get_prompts(module, "")
+    system_prompt += REDUCE_INSTRUCTIONS
+    max_tokens = MODULE_OUTPUT_TOKENS.get(module, DEFAULT_OUTPUT_TOKENS)
+    budget = settings.CONTEXT_TOKEN_TARGET - max_tokens - estimate_tokens(system_prompt) - MESSAGE_OVERHEAD_TOKENS
+
+    while True:
+        groups, current = [], []
+        for part in parts:
+            if current and estimate_tokens("\n\n".join(current + [part])) > budget:
+                groups.append(current)
+                current = []
+            current.append(part)
+        groups.append(current)
+
+        async def merge(group: list[str]) -> str:
+            user_prompt = "\n\n".join(f"--- Interpretación parcial {i} ---\n{p}" for i, p in enumerate(group, 1))
+            async with semaphore:
+                return await _call(module, user_prompt, system_prompt, user_prompt)
+
+        if len(groups) == 1:
+            return await merge(groups[0])
+        if len(groups) >= len(parts):
+            # Partial results too long to pair up: another round would never finish
+            raise ValueError("El texto es demasiado largo para combinar su análisis. Por favor, acórtalo.")
+        logger.info("Reducing %d partial results in %d groups", len(parts), len(groups))
+        parts = await asyncio.gather(*(merge(g) for g in groups))
+
+
+async def analyze_chunked(module: str, text: str, user_profile: dict = None,
+                          on_progress: Optional[ProgressCallback] = None) -> str:
+    """
+    Map-reduce analysis of a long input: chunks are analyzed concurrently
+    (at most CHUNK_CONCURRENCY calls in flight), then merged in a reduce pass.
+    `on_progress(done, total)` is awaited as each chunk finishes.
+    """
+    chunks = split_into_chunks(text, settings.CHUNK_MAX_CHARS)
+    if len(chunks) == 1:
+        system_prompt, user_prompt = get_prompts(module, text, user_profile=user_profile)
+        return await _call(module, text, system_prompt, user_prompt)
+
+    logger.info("Chunked %s analysis: %d chars in %d chunks", module, len(text), len(chunks))
+    semaphore = asyncio.Semaphore(settings.CHUNK_CONCURRENCY)
+    total = len(chunks) + 1 # +1 for the reduce step
+    done = 0
+
+    async def analyze(index: int, chunk: str) -> str:
+        nonlocal done
+        note = CHUNK_NOTE.format(index=index, total=len(chunks))
+        system_prompt, user_prompt = get_prompts(module, note + chunk, user_profile=user_profile)
+        async with semaphore:
+            result = await _call(module, chunk, system_prompt, user_prompt)
+        done += 1
+        if on_progress:
+            await on_progress(done, total)
+        return result
+
+    tasks = [asyncio.ensure_future(analyze(i, c)) for i, c in enumerate(chunks, 1)]
+    try:
+        parts = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    result = await _reduce(module, parts, semaphore)
+    if on_progress:
+        await on_progress(total, total)
+    return result
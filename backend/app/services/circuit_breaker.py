@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+from .shared_state import SharedValue
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while its circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit for {name} is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+    After `failure_threshold` consecutive upstream failures the circuit opens and
+    calls fail immediately for `recovery_timeout` seconds. Then up to
+    `half_open_max_calls` trial calls go through: one success closes it again,
+    one failure re-opens it.
+    With `shared` state, opening the circuit is published (until when) so the
+    other workers open theirs too instead of each paying for its own failures.
+    The shared value is read from a local copy refreshed in the background,
+    so a call never waits on the store.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float, half_open_max_calls: int = 1,
+                 shared=None):
+        self.name = name
+        self.shared = shared
+        self.shared_key = f"circuit:{name}:open_until"
+        self.shared_open_until = SharedValue(shared, self.shared_key) if shared else None
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.metrics = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning("Circuit %s: %s -> %s", self.name, self.state, state)
+            self.state = state
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError when the call must not reach the upstream."""
+        open_until = self.shared_open_until.get() if self.shared_open_until and self.state == CLOSED else None
+        with self._lock:
+            if open_until is not None and self.state == CLOSED:
+                remaining = open_until - time.time()
+                if remaining > 0: # Opened by another worker
+                    self.opened_at = time.monotonic() - (self.recovery_timeout - remaining)
+                    self._set_state(OPEN)
+
+            if self.state == OPEN:
+                if self.retry_after() > 0:
+                    self.metrics["rejected"] += 1
+                    raise CircuitOpenError(self.name, self.retry_after())
+                self._set_state(HALF_OPEN)
+                self.half_open_calls = 0
+
+            if self.state == HALF_OPEN:
+                if self.half_open_calls >= self.half_open_max_calls:
+                    self.metrics["rejected"] += 1
+                    raise CircuitOpenError(self.name, self.recovery_timeout)
+                self.half_open_calls += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.metrics["successes"] += 1
+            self.consecutive_failures = 0
+            recovered = self.state != CLOSED
+            self._set_state(CLOSED)
+        if recovered and self.shared:
+            self.shared_open_until.set_local(None)
+            self.shared.run_soon(self.shared.delete, self.shared_key)
+
+    def record_failure(self) -> None:
+        opened = False
+        with self._lock:
+            self.metrics["failures"] += 1
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.metrics["opened"] += 1
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+                opened = True
+        if opened and self.shared:
+            open_until = time.time() + self.recovery_timeout
+            self.shared_open_until.set_local(open_until)
+            self.shared.run_soon(self.shared.set, self.shared_key, open_until, self.recovery_timeout)
+
+    def release(self) -> None:
+        """A trial call ended without telling us anything about upstream health (e.g. a 400)."""
+        with self._lock:
+            if self.state == HALF_OPEN and self.half_open_calls > 0:
+                self.half_open_calls -= 1
+
+    def snapshot(self) -> dict:
+        return {"state": self.state, **self.metrics}
+
+
+class BreakerRegistry:
+    """One breaker per upstream model."""
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float, half_open_max_calls: int = 1, shared=None):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.shared = shared
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(
+                    name, self.failure_threshold, self.recovery_timeout, self.half_open_max_calls, shared=self.shared
+                )
+            return self._breakers[name]
+
+    def snapshot(self) -> dict:
+        return {name: breaker.snapshot() for name, breaker in self._breakers.items()}
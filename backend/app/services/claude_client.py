@@ -1,58 +1,174 @@
+import asyncio
 import logging
-from typing import Optional
-from anthropic import AsyncAnthropic, APIError, APIStatusError
+import time
+from typing import Optional, TYPE_CHECKING
 from ..config import settings
+from .token_budget import record_usage
+from .hedging import Hedger
+from .circuit_breaker import BreakerRegistry
+from .rate_limit import RateLimitExceeded, UpstreamRateLimiter
+from .shared_state import shared_state
+from .traffic_capture import record_upstream
+
+# The anthropic SDK takes well over a second to import, so it is only loaded
+# on first use (or by warmup() right after startup), never at import time.
+if TYPE_CHECKING:
+    from anthropic import AsyncAnthropic
 
 logger = logging.getLogger(__name__)
 
 # Global client
-_client: Optional[AsyncAnthropic] = None
+_client: Optional["AsyncAnthropic"] = None
+
+# Claude calls waiting on the API right now (read by admission control)
+upstream_inflight = 0
+
+# Optional request hedging to cut tail latency (off unless HEDGE_ENABLED)
+hedger = Hedger(
+    enabled=settings.HEDGE_ENABLED,
+    percentile=settings.HEDGE_PERCENTILE,
+    min_samples=settings.HEDGE_MIN_SAMPLES,
+    max_rate=settings.HEDGE_MAX_RATE
+)
+
+# One circuit breaker per model: fail fast while Anthropic is down
+# (an opened circuit is published to shared state so every worker fails fast)
+breakers = BreakerRegistry(
+    failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+    recovery_timeout=settings.CIRCUIT_RECOVERY_SECONDS,
+    shared=shared_state
+)
+
+# Upstream rate limit and 429 back-off, counted across all workers
+upstream_limiter = UpstreamRateLimiter(
+    shared_state,
+    max_per_minute=settings.UPSTREAM_MAX_CALLS_PER_MINUTE,
+    backoff_seconds=settings.UPSTREAM_BACKOFF_SECONDS
+)
 
-def get_client() -> AsyncAnthropic:
+def is_upstream_failure(error: Exception) -> bool:
+    """True for errors that say Anthropic is unhealthy (not that our request was bad)."""
+    from anthropic import APIConnectionError, APIStatusError
+    if isinstance(error, APIConnectionError): # Includes timeouts
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def get_client() -> "AsyncAnthropic":
     global _client
     if _client is None:
         if not settings.CLAUDE_API_KEY:
             raise ValueError("CLAUDE_API_KEY is not configured.")
-        _client = AsyncAnthropic(api_key=settings.CLAUDE_API_KEY)
+        from anthropic import AsyncAnthropic
+        _client = AsyncAnthropic(
+            api_key=settings.CLAUDE_API_KEY,
+            base_url=settings.ANTHROPIC_BASE_URL,
+            timeout=settings.CLAUDE_TIMEOUT_SECONDS,
+            max_retries=settings.CLAUDE_MAX_RETRIES
+        )
     return _client
 
+def warmup():
+    """Imports the SDK and builds the client ahead of the first request. Blocking."""
+    import anthropic  # noqa: F401
+    if settings.CLAUDE_API_KEY:
+        get_client()
+
 async def close_client():
     global _client
     if _client:
         await _client.close()
         _client = None
 
-async def call_claude(system_prompt: str, user_prompt: str) -> str:
+async def admit_hedge() -> bool:
+    """A hedge is one more upstream call: it goes through the global rate limit too."""
+    try:
+        await upstream_limiter.acquire()
+    except RateLimitExceeded:
+        return False
+    return True
+
+async def call_claude(system_prompt: str, user_prompt: str, max_tokens: int = 1024,
+                      estimated_input_tokens: Optional[int] = None, module: Optional[str] = None) -> str:
     """
     Calls the Anthropic API using the official SDK.
+    When `estimated_input_tokens` is given, it is compared with the real usage.
+    `module` selects the latency profile used for hedging.
     """
     client = get_client()
-    
+    from anthropic import APIError, APIStatusError
+
+    await upstream_limiter.acquire() # Raises RateLimitExceeded over the global limit or after a 429
+    breaker = breakers.get(settings.CLAUDE_MODEL)
+    breaker.before_call() # Raises CircuitOpenError while the model is failing
+
+    async def create():
+        # Counted per request sent, so a hedge shows up in admission / feedback draft back-pressure too
+        global upstream_inflight
+        upstream_inflight += 1
+        try:
+            return await client.messages.create(
+                model=settings.CLAUDE_MODEL,
+                max_tokens=max_tokens,
+                system=system_prompt,
+                messages=[
+                    {"role": "user", "content": user_prompt}
+                ]
+            )
+        finally:
+            upstream_inflight -= 1
+
+    start = time.perf_counter()
     try:
-        message = await client.messages.create(
-            model=settings.CLAUDE_MODEL,
-            max_tokens=1024,
-            system=system_prompt,
-            messages=[
-                {"role": "user", "content": user_prompt}
-            ]
-        )
+        try:
+            message = await hedger.run(module, create, admit_hedge=admit_hedge)
+        except Exception as e:
+            if is_upstream_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        breaker.record_success()
+
+        usage = getattr(message, "usage", None)
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info("Claude call finished", extra={
+            "analysis_module": module,
+            "latency_ms": latency_ms,
+            "input_tokens": getattr(usage, "input_tokens", None),
+            "output_tokens": getattr(usage, "output_tokens", None),
+            "sample": True,
+        })
+        record_upstream(getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None), latency_ms)
+
+        if estimated_input_tokens is not None and getattr(message, "usage", None):
+            record_usage(estimated_input_tokens, message.usage.input_tokens, len(system_prompt) + len(user_prompt))
+
         # Content is a list of blocks, usually text.
         if message.content and len(message.content) > 0:
             return message.content[0].text
         return ""
 
     except APIStatusError as e:
-        logger.error(f"Anthropic API Status Error: {e.status_code} - {e.message}")
+        logger.error("Anthropic API Status Error: %s - %s", e.status_code, e.message)
         if e.status_code == 429:
-             # SDK handles some retries, but if it bubbles up, we can log it.
-             # In a real app we might want more complex backoff, 
-             # but the SDK default is usually sufficient for standard usage.
-             pass
+             # The SDK already retried; pause every worker instead of each one finding out on its own
+             upstream_limiter.back_off(retry_after_seconds(e))
         raise e
     except APIError as e:
-        logger.error(f"Anthropic API Error: {str(e)}")
+        logger.error("Anthropic API Error: %s", e)
         raise e
     except Exception as e:
-        logger.error(f"Unexpected error calling Claude: {str(e)}")
+        logger.error("Unexpected error calling Claude: %s", e)
         raise e
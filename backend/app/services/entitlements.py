@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+from sqlalchemy.orm import Session
+from ..models.db import User
+from ..config import settings
+from .shared_state import SharedState, SharedValue, shared_state
+
+logger = logging.getLogger(__name__)
+
+_UNSEEN = object() # No generation read yet
+
+
+class EntitlementService:
+    """
+    Premium entitlement checks backed by `User.is_premium`.
+    Answers come from an in-process TTL cache; unknown users are cached as
+    non-premium (negative caching) so repeated checks don't reach the DB.
+    Every grant/revoke bumps a generation counter in shared state; a worker
+    that sees a new generation drops its cache, so a change made through one
+    worker is not hidden by another worker's cache until the TTL runs out.
+    The counter is read from a local copy refreshed in the background, so a
+    change shows up in the other workers within about a second.
+    """
+
+    GENERATION_KEY = "entitlements:generation"
+
+    def __init__(self, ttl_seconds: int, negative_ttl_seconds: int, shared: SharedState | None = None):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.shared = shared
+        self._cache: dict[str, tuple[float, bool]] = {}
+        self._generation_view = SharedValue(shared, self.GENERATION_KEY) if shared else None
+        self._generation = _UNSEEN # Generation our cache matches; set from the first value read
+        self._lock = threading.Lock()
+
+    def _sync(self) -> None:
+        if self._generation_view is None:
+            return
+        generation = self._generation_view.get()
+        if not self._generation_view.loaded:
+            return
+        with self._lock:
+            if self._generation is _UNSEEN:
+                self._generation = generation
+            elif generation != self._generation:
+                self._cache.clear()
+                self._generation = generation
+
+    def _bump_generation(self) -> None:
+        generation = self.shared.incr(self.GENERATION_KEY)
+        with self._lock:
+            if self._generation is not _UNSEEN and generation == (self._generation or 0) + 1:
+                # Nobody else changed anything: keep our cache
+                self._generation = generation
+                self._generation_view.set_local(generation)
+
+    def _remember(self, email: str, is_premium: bool) -> None:
+        ttl = self.ttl_seconds if is_premium else self.negative_ttl_seconds
+        with self._lock:
+            self._cache[email] = (time.monotonic() + ttl, is_premium)
+
+    def is_premium(self, email: str | None, db: Session) -> bool:
+        if not email:
+            return False
+
+        self._sync()
+        entry = self._cache.get(email)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        user = db.query(User.is_premium).filter(User.email == email).first()
+        is_premium = bool(user and user.is_premium)
+        self._remember(email, is_premium)
+        return is_premium
+
+    def preload(self, db: Session) -> int:
+        """Loads every premium user into the cache. Returns how many were loaded."""
+        self._sync() # Start reading the generation this cache is built against
+        emails = [row.email for row in db.query(User.email).filter(User.is_premium == True).all()]  # noqa: E712
+        for email in emails:
+            self._remember(email, True)
+        logger.info("Preloaded %d premium entitlements", len(emails))
+        return len(emails)
+
+    def invalidate(self, email: str | None = None) -> None:
+        """Drops one cached entry, or the whole cache when no email is given."""
+        with self._lock:
+            if email is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(email, None)
+
+    def set_premium(self, db: Session, email: str, is_premium: bool) -> None:
+        """Grants or revokes premium access and invalidates the cached answer."""
+        user = db.query(User).filter(User.email == email).first()
+        if user is None:
+            user = User(email=email, is_premium=is_premium)
+            db.add(user)
+        else:
+            user.is_premium = is_premium
+        db.commit()
+        self.invalidate(email)
+        if self.shared:
+            self.shared.run_soon(self._bump_generation)
+
+    def seed(self, db: Session, emails: list[str]) -> None:
+        """Makes sure the configured bootstrap emails are premium in the DB."""
+        for email in emails:
+            if not self.is_premium(email, db):
+                self.set_premium(db, email, True)
+
+
+entitlements = EntitlementService(
+    ttl_seconds=settings.ENTITLEMENT_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=settings.ENTITLEMENT_NEGATIVE_TTL_SECONDS,
+    shared=shared_state
+)
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from ..models.enums import AnalysisModule
+from ..config import settings
+from .prompt_router import get_prompts
+from . import claude_client
+
+logger = logging.getLogger(__name__)
+
+UPDATE_INSTRUCTIONS = (
+    "\n\nVas a recibir un borrador de feedback sobre la conversación hasta ahora y los turnos "
+    "nuevos que se han producido después. Devuelve el feedback completo actualizado, con la "
+    "misma estructura, incorporando lo que aportan los turnos nuevos. Si no cambian nada "
+    "relevante, devuelve el borrador tal cual. No menciones que es un borrador."
+)
+
+
+def transcript_after_turn(history_json: str, reply: str) -> Optional[str]:
+    """
+    The transcript the frontend will send to roleplay_feedback once `reply` is
+    shown: non-system turns as 'Tú: ...' / 'IA: ...' lines.
+    """
+    try:
+        history = json.loads(history_json)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(history, list):
+        return None
+    lines = [
+        f"{'Tú' if turn.get('role') == 'user' else 'IA'}: {turn.get('content', '')}"
+        for turn in history if isinstance(turn, dict) and turn.get("role") != "system"
+    ]
+    lines.append(f"IA: {reply}")
+    return "\n".join(lines)
+
+
+@dataclass
+class _Draft:
+    latest: str = "" # Newest transcript seen for the conversation
+    covered: str = "" # Transcript the draft was written from
+    draft: str = ""
+    task: Optional[asyncio.Task] = None
+    in_flight: bool = False # The background task is waiting on Claude (not debouncing)
+    touched_at: float = 0.0
+
+
+class FeedbackDrafts:
+    """
+    Keeps a running roleplay_feedback draft per conversation while it happens.
+    After each roleplay turn a background task (debounced, and only while few
+    Claude calls are in flight) folds the new turns into the draft. The final
+    feedback request is then answered from the draft, or with one short update
+    call covering the last turns.
+    Per worker: a request landing on another worker just takes the normal path.
+    """
+
+    def __init__(self, enabled: bool, debounce_seconds: float, max_upstream: int, concurrency: int,
+                 max_conversations: int, ttl_seconds: float):
+        self.enabled = enabled
+        self.debounce_seconds = debounce_seconds
+        self.max_upstream = max_upstream
+        self.concurrency = concurrency
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self._drafts: "OrderedDict[str, _Draft]" = OrderedDict()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.metrics = {"background_updates": 0, "served_from_draft": 0, "finalized": 0, "full_analysis": 0}
+
+    def _get(self, conversation_id: str) -> _Draft:
+        now = time.monotonic()
+        entry = self._drafts.get(conversation_id)
+        if entry is None:
+            entry = self._drafts[conversation_id] = _Draft()
+        entry.touched_at = now
+        self._drafts.move_to_end(conversation_id)
+        # Drop idle and least recently used conversations
+        while self._drafts:
+            oldest_id, oldest = next(iter(self._drafts.items()))
+            if len(self._drafts) <= self.max_conversations and now - oldest.touched_at < self.ttl_seconds:
+                break
+            if oldest.task:
+                oldest.task.cancel()
+            del self._drafts[oldest_id]
+        return entry
+
+    def record_turn(self, conversation_id: Optional[str], history_json: str, reply: str) -> None:
+        """Called after a roleplay turn is answered; schedules a background draft update."""
+        if not self.enabled or not conversation_id:
+            return
+        transcript = transcript_after_turn(history_json, reply)
+        if transcript is None:
+            return
+        entry = self._get(conversation_id)
+        entry.latest = transcript
+        if entry.task is None or entry.task.done():
+            entry.task = asyncio.create_task(self._background(entry))
+
+    async def _wait_for_idle_capacity(self) -> None:
+        while claude_client.upstream_inflight >= self.max_upstream:
+            await asyncio.sleep(self.debounce_seconds)
+
+    async def _background(self, entry: _Draft) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            # Keep going while turns arrive faster than drafts are written
+            while entry.latest != entry.covered:
+                await asyncio.sleep(self.debounce_seconds)
+                await self._wait_for_idle_capacity()
+                async with self._semaphore:
+                    entry.in_flight = True
+                    try:
+                        await self._update(entry, entry.latest)
+                    finally:
+                        entry.in_flight = False
+                self.metrics["background_updates"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A failed draft only means the final request does more work
+            logger.warning("Feedback draft update failed: %s", e)
+
+    async def _update(self, entry: _Draft, transcript: str) -> str:
+        """Brings the draft up to `transcript` with one Claude call."""
+        module = AnalysisModule.ROLEPLAY_FEEDBACK.value
+        if entry.draft and transcript.startswith(entry.covered):
+            system_prompt, _ = get_prompts(module, "")
+            new_turns = transcript[len(entry.covered):].lstrip("\n")
+            user_prompt = f"--- Borrador actual ---\n{entry.draft}\n\n--- Turnos nuevos ---\n{new_turns}"
+            system_prompt += UPDATE_INSTRUCTIONS
+        else:
+            system_prompt, user_prompt = get_prompts(module, transcript)
+        draft = await claude_client.call_claude(system_prompt=system_prompt, user_prompt=user_prompt, module=module)
+        if draft:
+            entry.draft, entry.covered = draft, transcript
+        return draft
+
+    async def finalize(self, conversation_id: Optional[str], transcript: str) -> Optional[str]:
+        """
+        Feedback for the finished conversation from its draft: as is when it
+        already covers the whole transcript, else after one short update.
+        None when there is nothing usable (caller runs the full analysis).
+        """
+        if not self.enabled or not conversation_id or conversation_id not in self._drafts:
+            return None
+        entry = self._get(conversation_id)
+        if entry.task and not entry.task.done():
+            if entry.in_flight and transcript.startswith(entry.latest):
+                # Already writing a draft for (most of) this transcript: waiting beats starting over
+                try:
+                    await asyncio.shield(entry.task)
+                except Exception:
+                    pass
+            else:
+                entry.task.cancel() # Still debouncing; the update below replaces it
+
+        if entry.draft and entry.covered == transcript:
+            self.metrics["served_from_draft"] += 1
+            return entry.draft
+        if entry.draft and transcript.startswith(entry.covered):
+            self.metrics["finalized"] += 1
+            return await self._update(entry, transcript)
+        self.metrics["full_analysis"] += 1
+        return None
+
+    def close(self) -> None:
+        for entry in self._drafts.values():
+            if entry.task:
+                entry.task.cancel()
+        self._drafts.clear()
+        self._semaphore = None
+
+    def snapshot(self) -> dict:
+        return {"conversations": len(self._drafts), **self.metrics}
+
+
+feedback_drafts = FeedbackDrafts(
+    enabled=settings.FEEDBACK_DRAFTS_ENABLED,
+    debounce_seconds=settings.FEEDBACK_DRAFT_DEBOUNCE_SECONDS,
+    max_upstream=settings.FEEDBACK_DRAFT_MAX_UPSTREAM,
+    concurrency=settings.FEEDBACK_DRAFT_CONCURRENCY,
+    max_conversations=settings.FEEDBACK_DRAFT_MAX_CONVERSATIONS,
+    ttl_seconds=settings.FEEDBACK_DRAFT_TTL_SECONDS
+)
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import text
+from ..models.db import read_engine
+from ..config import settings
+from . import claude_client, prompt_router, knowledge_base
+from .token_budget import usage_stats
+from .lookup_index import lookup_index
+from .feedback_drafts import feedback_drafts
+from .jobs import job_runner
+from .traffic_capture import traffic_capture
+from .shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """
+    Keeps a cached readiness snapshot. The checks (DB ping, file stats) run in a
+    background task every `interval` seconds; /readyz only reads the last result.
+    """
+
+    def __init__(self, interval: float, frontend_dir: Path, startup_errors: list, admission=None):
+        self.interval = interval
+        self.admission = admission
+        self.frontend_dir = frontend_dir
+        self.startup_errors = startup_errors
+        self.snapshot = {"ready": False, "checks": {}, "startup_errors": [], "updated_at": None}
+
+    def _check_db(self) -> bool:
+        try:
+            with read_engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return True
+        except Exception as e:
+            logger.warning("Health check: database ping failed: %s", e)
+            return False
+
+    def refresh(self) -> dict:
+        """Runs every check once. Blocking; call it from a worker thread."""
+        start = time.perf_counter()
+        checks = {
+            "database": self._check_db(),
+            "anthropic_client": claude_client._client is not None,
+            "prompts_loaded": prompt_router.prompts_loaded(),
+            "frontend_index": (self.frontend_dir / "index.html").is_file(),
+        }
+        # Without an API key there is no client to wait for
+        required = [k for k in checks if k != "anthropic_client" or settings.CLAUDE_API_KEY]
+        self.snapshot = {
+            "ready": all(checks[k] for k in required) and not self.startup_errors,
+            "checks": checks,
+            "startup_errors": list(self.startup_errors),
+            "updated_at": datetime.utcnow().isoformat(),
+            "check_ms": round((time.perf_counter() - start) * 1000, 2),
+            "metrics": {
+                "hedging": claude_client.hedger.snapshot(),
+                "circuit_breakers": claude_client.breakers.snapshot(),
+                "upstream_rate_limit": claude_client.upstream_limiter.snapshot(),
+                "token_usage": usage_stats.snapshot(),
+                "lookup_index": lookup_index.snapshot(),
+                "knowledge_base": knowledge_base.knowledge_base.snapshot() if knowledge_base.knowledge_base else None,
+                "admission": self.admission.snapshot() if self.admission else None,
+                "feedback_drafts": feedback_drafts.snapshot(),
+                "jobs": job_runner.snapshot(),
+                "traffic_capture": traffic_capture.snapshot(),
+                "shared_state": shared_state.snapshot(),
+            },
+        }
+        return self.snapshot
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.exception("Health refresh failed: %s", e)
+            await asyncio.sleep(self.interval)
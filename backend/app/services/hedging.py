@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Sliding window of observed upstream latencies per module."""
+
+    def __init__(self, window: int = 200):
+        self._samples: dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, module: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[module].append(seconds)
+
+    def percentile(self, module: str, q: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(module, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class Hedger:
+    """
+    Request hedging: if the first call hasn't answered within the module's
+    p`percentile` latency, fire an identical second call and keep whichever
+    finishes first. Hedges are capped at `max_rate` of all calls, and
+    `admit_hedge` (e.g. the upstream rate limit) can turn one down.
+    """
+
+    def __init__(self, enabled: bool, percentile: float, min_samples: int, max_rate: float):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_rate = max_rate
+        self.latencies = LatencyTracker()
+        self.metrics = {"calls": 0, "hedges_fired": 0, "hedges_won": 0, "hedges_skipped_budget": 0,
+                        "hedges_skipped_limit": 0}
+
+    def delay_for(self, module: Optional[str]) -> Optional[float]:
+        if not self.enabled or not module:
+            return None
+        return self.latencies.percentile(module, self.percentile, self.min_samples)
+
+    def _within_budget(self) -> bool:
+        # +1 lets the very first slow call hedge on a fresh process
+        return self.metrics["hedges_fired"] + 1 <= self.max_rate * self.metrics["calls"] + 1
+
+    def _record_primary(self, module: Optional[str], primary: asyncio.Future, start: float) -> None:
+        # Always the primary's time, so the delay follows un-hedged latency. If the
+        # hedge won, the primary is still running: its time so far is a lower bound.
+        if module and not (primary.done() and primary.exception() is not None):
+            self.latencies.record(module, time.perf_counter() - start)
+
+    async def run(self, module: Optional[str], make_call: Callable[[], Awaitable[T]],
+                  admit_hedge: Optional[Callable[[], Awaitable[bool]]] = None) -> T:
+        self.metrics["calls"] += 1
+        start = time.perf_counter()
+        delay = self.delay_for(module)
+
+        primary = asyncio.ensure_future(make_call())
+        tasks = [primary]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done:
+                    if not self._within_budget():
+                        self.metrics["hedges_skipped_budget"] += 1
+                    elif admit_hedge is not None and not await admit_hedge():
+                        self.metrics["hedges_skipped_limit"] += 1
+                    else:
+                        self.metrics["hedges_fired"] += 1
+                        logger.info("Hedging %s request after %.2fs", module, delay)
+                        tasks.append(asyncio.ensure_future(make_call()))
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.metrics["hedges_won"] += 1
+                        self._record_primary(module, primary, start)
+                        return task.result()
+            # Every attempt failed: surface the primary's error
+            return primary.result()
+        finally:
+            # Cancel the loser (or everything, if we were cancelled ourselves)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def snapshot(self) -> dict:
+        return dict(self.metrics)
@@ -0,0 +1,312 @@
+import asyncio
+import hashlib
+import logging
+import secrets
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from ..models.schemas import TextRequest, AIResponse
+from ..config import settings
+from .traffic_capture import traffic_capture
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("done", "error")
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class IdempotencyKeyReused(Exception):
+    """The Idempotency-Key was already used by this caller for a different request."""
+
+
+def scoped_key(idempotency_key: str, user_email: Optional[str]) -> str:
+    """What is stored for an Idempotency-Key: the same key from another user is another job."""
+    return hashlib.sha256(f"{user_email or ''}\n{idempotency_key}".encode("utf-8")).hexdigest()
+
+
+def job_view(job) -> dict:
+    """What GET /api/jobs/{id} returns."""
+    return {
+        "id": job.id,
+        "status": job.status,
+        "module": job.module,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "result": job.result,
+        "error": {"status_code": job.error_status, "detail": job.error} if job.status == "error" else None,
+    }
+
+
+class JobRunner:
+    """
+    Runs analyses submitted through POST /api/jobs on a pool of `concurrency`
+    tasks per worker. Jobs live in the `jobs` table, so the result is still
+    there when the client reconnects, and jobs left behind by a worker that
+    stopped are picked up by the periodic sweep of any worker. Claiming is
+    an UPDATE ... WHERE status = 'queued', so a job runs once even when
+    several workers have it queued.
+    """
+
+    def __init__(self, concurrency: int, max_queued: int, stale_seconds: float, max_attempts: int,
+                 sweep_seconds: float, ttl_seconds: float):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self.sweep_seconds = sweep_seconds
+        self.ttl_seconds = ttl_seconds
+        self.execute: Optional[Callable[[TextRequest], Awaitable[AIResponse]]] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: set = set() # Ids in this worker's queue
+        self._running: set = set()
+        self._changed: dict = {} # Job id -> Event set on its next status change (for SSE watchers)
+        self._tasks: list = []
+        self.metrics = {"submitted": 0, "done": 0, "error": 0, "requeued": 0, "purged": 0}
+
+    # --- Lifecycle ---
+
+    def start(self, execute: Callable[[TextRequest], Awaitable[AIResponse]]) -> None:
+        self.execute = execute
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Hand interrupted jobs back right away instead of waiting for them to go stale
+        if self._running:
+            try:
+                await run_in_threadpool(self._release, list(self._running))
+            except Exception as e:
+                logger.warning("Could not requeue %s interrupted jobs: %s", len(self._running), e)
+        self._queued.clear()
+        self._running.clear()
+        self._queue = None
+
+    # --- Database (sync, run in the threadpool) ---
+
+    def _create(self, request: TextRequest, idempotency_key: Optional[str]):
+        from ..models.db import SessionLocal, AnalysisJob
+        db = SessionLocal()
+        payload = request.model_dump()
+
+        def same_job(key):
+            existing = db.query(AnalysisJob).filter(AnalysisJob.idempotency_key == key).first()
+            if existing is not None and existing.request != payload:
+                raise IdempotencyKeyReused()
+            return existing
+
+        try:
+            key = scoped_key(idempotency_key, request.user_email) if idempotency_key else None
+            if key:
+                existing = same_job(key)
+                if existing:
+                    return existing, False
+            job = AnalysisJob(id=secrets.token_urlsafe(16), idempotency_key=key, module=request.module,
+                              request=payload, status="queued", attempts=0)
+            db.add(job)
+            try:
+                db.commit()
+            except IntegrityError: # Same key submitted twice at once
+                db.rollback()
+                return same_job(key), False
+            db.refresh(job)
+            return job, True
+        finally:
+            db.close()
+
+    def _get(self, job_id: str):
+        from ..models.db import SessionLocal, AnalysisJob
+        db = SessionLocal()
+        try:
+            return db.get(AnalysisJob, job_id)
+        finally:
+            db.close()
+
+    def _claim(self, job_id: str) -> Optional[TextRequest]:
+        """Marks the job as running here. None if someone else got it first."""
+        from ..models.db import SessionLocal, AnalysisJob
+        db = SessionLocal()
+        try:
+            claimed = db.query(AnalysisJob).filter(AnalysisJob.id == job_id, AnalysisJob.status == "queued").update(
+                {"status": "running", "started_at": datetime.utcnow(), "attempts": AnalysisJob.attempts + 1},
+                synchronize_session=False
+            )
+            db.commit()
+            if not claimed:
+                return None
+            return TextRequest(**db.get(AnalysisJob, job_id).request)
+        finally:
+            db.close()
+
+    def _finish(self, job_id: str, result: Optional[dict], error: Optional[str], error_status: Optional[int]) -> None:
+        from ..models.db import SessionLocal, AnalysisJob
+        db = SessionLocal()
+        try:
+            db.query(AnalysisJob).filter(AnalysisJob.id == job_id).update({
+                "status": "error" if error else "done",
+                "result": result,
+                "error": error,
+                "error_status": error_status,
+                "finished_at": datetime.utcnow(),
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _release(self, job_ids: list) -> None:
+        from ..models.db import SessionLocal, AnalysisJob
+        db = SessionLocal()
+        try:
+            db.query(AnalysisJob).filter(AnalysisJob.id.in_(job_ids), AnalysisJob.status == "running").update(
+                {"status": "queued"}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def sweep(self) -> list:
+        """
+        Requeues (or fails, after max_attempts) jobs whose worker went away,
+        purges finished jobs past their TTL and returns the queued job ids.
+        """
+        from ..models.db import SessionLocal, AnalysisJob
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            stale = (AnalysisJob.status == "running", AnalysisJob.started_at < now - timedelta(seconds=self.stale_seconds))
+            self.metrics["requeued"] += db.query(AnalysisJob).filter(
+                *stale, AnalysisJob.attempts < self.max_attempts
+            ).update({"status": "queued"}, synchronize_session=False)
+            db.query(AnalysisJob).filter(*stale).update({
+                "status": "error",
+                "error": "El análisis no pudo completarse. Por favor, inténtalo de nuevo.",
+                "error_status": 500,
+                "finished_at": now,
+            }, synchronize_session=False)
+            self.metrics["purged"] += db.query(AnalysisJob).filter(
+                AnalysisJob.status.in_(FINISHED),
+                AnalysisJob.created_at < now - timedelta(seconds=self.ttl_seconds)
+            ).delete(synchronize_session=False)
+            db.commit()
+            queued = db.query(AnalysisJob.id).filter(AnalysisJob.status == "queued").order_by(
+                AnalysisJob.created_at).limit(self.max_queued).all()
+            return [job_id for job_id, in queued]
+        finally:
+            db.close()
+
+    # --- API ---
+
+    async def submit(self, request: TextRequest, idempotency_key: Optional[str] = None) -> dict:
+        if len(self._queued) >= self.max_queued:
+            raise JobQueueFull()
+        job, created = await run_in_threadpool(self._create, request, idempotency_key)
+        if created:
+            self.metrics["submitted"] += 1
+            self._enqueue(job.id)
+        return job_view(job)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = await run_in_threadpool(self._get, job_id)
+        return job_view(job) if job else None
+
+    async def wait(self, job_id: str, timeout: float) -> None:
+        """Returns when the job changes status on this worker, or after `timeout`."""
+        event = self._changed.get(job_id)
+        if event is None and (job_id in self._queued or job_id in self._running):
+            event = self._changed[job_id] = asyncio.Event()
+        if event is None:
+            await asyncio.sleep(timeout) # Running elsewhere (or finished): the caller polls the DB
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def snapshot(self) -> dict:
+        return {"queued": len(self._queued), "running": len(self._running), **self.metrics}
+
+    # --- Workers ---
+
+    def _enqueue(self, job_id: str) -> None:
+        if self._queue is None or job_id in self._queued or job_id in self._running:
+            return
+        self._queued.add(job_id)
+        self._queue.put_nowait(job_id)
+
+    def _notify(self, job_id: str) -> None:
+        event = self._changed.pop(job_id, None)
+        if event:
+            event.set()
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                claim = asyncio.ensure_future(run_in_threadpool(self._claim, job_id))
+                try:
+                    request = await asyncio.shield(claim)
+                except asyncio.CancelledError:
+                    # Shutting down mid-claim: let the claim land so close() hands the job back
+                    if await claim is not None:
+                        self._running.add(job_id)
+                    raise
+                if request is None:
+                    continue
+                self._running.add(job_id)
+                self._notify(job_id)
+                await self._run(job_id, request)
+                self._running.discard(job_id)
+                self._notify(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The DB write failed; the sweep will retry the job once it goes stale
+                self._running.discard(job_id)
+                logger.exception("Job %s could not be run: %s", job_id, e)
+
+    async def _run(self, job_id: str, request: TextRequest) -> None:
+        result, error, error_status = None, None, None
+        with traffic_capture.job(request.model_dump()) as captured:
+            try:
+                result = (await self.execute(request)).model_dump()
+            except asyncio.CancelledError:
+                raise
+            except HTTPException as e:
+                error, error_status = str(e.detail), e.status_code
+            except Exception as e:
+                logger.exception("Job %s failed", job_id)
+                error, error_status = f"Error técnico: {str(e)}", 500
+            captured["status"] = error_status or 200
+        await run_in_threadpool(self._finish, job_id, result, error, error_status)
+        self.metrics["error" if error else "done"] += 1
+        logger.info("Job %s finished: %s", job_id, "error" if error else "done",
+                    extra={"analysis_module": request.module})
+
+    async def _sweeper(self) -> None:
+        while True:
+            try:
+                for job_id in await run_in_threadpool(self.sweep):
+                    self._enqueue(job_id)
+            except Exception as e:
+                logger.warning("Job sweep failed: %s", e)
+            await asyncio.sleep(self.sweep_seconds)
+
+
+job_runner = JobRunner(
+    concurrency=settings.JOBS_CONCURRENCY,
+    max_queued=settings.JOBS_MAX_QUEUED,
+    stale_seconds=settings.JOBS_STALE_SECONDS,
+    max_attempts=settings.JOBS_MAX_ATTEMPTS,
+    sweep_seconds=settings.JOBS_SWEEP_SECONDS,
+    ttl_seconds=settings.JOBS_TTL_SECONDS
+)
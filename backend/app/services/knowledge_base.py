@@ -0,0 +1,79 @@
+import logging
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+from .lookup_index import normalize
+
+logger = logging.getLogger(__name__)
+
+# On-disk format written by tools/build_kb.py
+SCHEMA = """
+CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+CREATE TABLE answers (
+    module TEXT NOT NULL,
+    key TEXT NOT NULL,
+    input_text TEXT NOT NULL,
+    result_text TEXT NOT NULL,
+    PRIMARY KEY (module, key)
+) WITHOUT ROWID;
+"""
+
+
+@dataclass
+class KBHit:
+    result_text: str
+    version: str
+
+
+class KnowledgeBase:
+    """
+    Read-only, precomputed answers for common idioms (see tools/build_kb.py).
+    The file is small (a few hundred rows), so it is read once into memory and
+    lookups are a dict access on the normalized key.
+    """
+
+    def __init__(self, answers: dict[tuple[str, str], str], version: str):
+        self.answers = answers
+        self.version = version
+        self.metrics = {"lookups": 0, "hits": 0}
+
+    @classmethod
+    def open(cls, path: Path) -> Optional["KnowledgeBase"]:
+        if not path.is_file():
+            logger.info("No idiom knowledge base at %s", path)
+            return None
+        # immutable=1: the file never changes while we run, so SQLite skips locking
+        conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+        try:
+            meta = dict(conn.execute("SELECT name, value FROM meta").fetchall())
+            answers = {
+                (module, key): result_text
+                for module, key, result_text in conn.execute("SELECT module, key, result_text FROM answers")
+            }
+        finally:
+            conn.close()
+        kb = cls(answers, meta.get("version", "unknown"))
+        logger.info("Loaded idiom knowledge base %s (%d answers)", kb.version, len(answers))
+        return kb
+
+    def lookup(self, module: str, text: str) -> Optional[KBHit]:
+        self.metrics["lookups"] += 1
+        result_text = self.answers.get((module, normalize(text)))
+        if result_text is None:
+            return None
+        self.metrics["hits"] += 1
+        return KBHit(result_text, self.version)
+
+    def snapshot(self) -> dict:
+        return {"version": self.version, "entries": len(self.answers), **self.metrics}
+
+
+# Loaded at startup (main.lifespan); None when there is no KB file
+knowledge_base: Optional[KnowledgeBase] = None
+
+
+def load_knowledge_base(path: Path) -> Optional[KnowledgeBase]:
+    global knowledge_base
+    knowledge_base = KnowledgeBase.open(path)
+    return knowledge_base
@@ -0,0 +1,216 @@
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy.orm import Session
+from ..models.db import AnalysisHistory
+from ..models.enums import AnalysisModule
+from ..config import settings
+from .shared_state import SharedState, SharedStateUnavailable, shared_state
+
+logger = logging.getLogger(__name__)
+
+# Short, user-independent inputs: the same idiom always gets the same answer
+INDEXED_MODULES = {AnalysisModule.GLOSSARY, AnalysisModule.TRANSLATOR}
+
+# Longest first so "iendo" wins over "o"
+SUFFIXES = sorted(["ando", "iendo", "ar", "er", "ir", "as", "es", "os", "a", "e", "o", "s"], key=len, reverse=True)
+MIN_STEM = 3
+
+NGRAM = 3
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+_PRIME = (1 << 61) - 1
+# Fixed (a, b) pairs so signatures are stable across processes
+_PERMUTATIONS = [((i * 0x9E3779B1 + 0x7F4A7C15) % _PRIME | 1, (i * 0x85EBCA77 + 0xC2B2AE3D) % _PRIME) for i in range(NUM_HASHES)]
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def _stem(token: str) -> str:
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM:
+            return token[:-len(suffix)]
+    return token
+
+
+def normalize(text: str) -> str:
+    """
+    Canonical key: lowercase, accents folded (NFKD), punctuation stripped,
+    whitespace collapsed and a light Spanish stemming per word.
+    "Está en las nubes." and "estar en las nubes" give the same key.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _PUNCTUATION.sub(" ", text)
+    return " ".join(_stem(token) for token in text.split())
+
+
+def _ngrams(key: str) -> set:
+    padded = f" {key} "
+    if len(padded) <= NGRAM:
+        return {padded}
+    return {padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1)}
+
+
+def _minhash(grams: set) -> tuple:
+    hashes = [zlib.crc32(g.encode("utf-8")) for g in grams]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+@dataclass
+class _Entry:
+    key: str
+    grams: frozenset
+    result_text: str
+
+
+@dataclass
+class LookupHit:
+    result_text: str
+    similarity: float
+    exact: bool
+
+
+class ModuleIndex:
+    """Exact-key dict plus MinHash/LSH buckets for near duplicates, for one module."""
+
+    def __init__(self):
+        self.entries: dict[str, _Entry] = {}
+        self.buckets: dict[tuple, set] = {}
+
+    def add(self, key: str, result_text: str) -> None:
+        if key in self.entries:
+            self.entries[key].result_text = result_text # Newer answer wins
+            return
+        grams = frozenset(_ngrams(key))
+        self.entries[key] = _Entry(key, grams, result_text)
+        signature = _minhash(grams)
+        for band in range(BANDS):
+            band_key = (band,) + signature[band * ROWS:(band + 1) * ROWS]
+            self.buckets.setdefault(band_key, set()).add(key)
+
+    def lookup(self, key: str, threshold: float) -> Optional[LookupHit]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            return LookupHit(entry.result_text, 1.0, exact=True)
+
+        grams = _ngrams(key)
+        signature = _minhash(grams)
+        candidates = set()
+        for band in range(BANDS):
+            candidates |= self.buckets.get((band,) + signature[band * ROWS:(band + 1) * ROWS], set())
+
+        # Character n-grams can't tell "estar en las nubes" from "no estar en las
+        # nubes" (or one word swapped for another): only reuse an answer whose
+        # words are the same, e.g. reordered or repeated
+        tokens = frozenset(key.split())
+        best, best_score = None, 0.0
+        for candidate in candidates:
+            if frozenset(candidate.split()) != tokens:
+                continue
+            other = self.entries[candidate].grams
+            score = len(grams & other) / len(grams | other)
+            if score > best_score:
+                best, best_score = candidate, score
+        if best is not None and best_score >= threshold:
+            return LookupHit(self.entries[best].result_text, best_score, exact=False)
+        return None
+
+
+class LookupIndex:
+    """
+    Local answer index over previous glossary/translator results.
+    High-confidence matches are answered without calling Claude.
+    With `shared` state, new answers are also published by exact key so the
+    other workers can answer them (lookup_shared) before their next rebuild.
+    """
+
+    def __init__(self, threshold: float, shared: Optional[SharedState] = None, shared_ttl: Optional[float] = None):
+        self.threshold = threshold
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self.modules = {module.value: ModuleIndex() for module in INDEXED_MODULES}
+        self.metrics = {"lookups": 0, "exact_hits": 0, "similar_hits": 0, "shared_hits": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _shared_key(module: str, key: str) -> str:
+        return f"lookup:{module}:{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+
+    def add(self, module: str, text: str, result_text: str, share: bool = True) -> None:
+        index = self.modules.get(module)
+        key = normalize(text)
+        if index is None or not key or not result_text:
+            return
+        with self._lock:
+            index.add(key, result_text)
+        if share and self.shared:
+            self.shared.run_soon(self.shared.set, self._shared_key(module, key), result_text, self.shared_ttl)
+
+    def lookup(self, module: str, text: str) -> Optional[LookupHit]:
+        index = self.modules.get(module)
+        if index is None:
+            return None
+        key = normalize(text)
+        with self._lock:
+            self.metrics["lookups"] += 1
+            hit = index.lookup(key, self.threshold) if key else None
+            if hit:
+                self.metrics["exact_hits" if hit.exact else "similar_hits"] += 1
+        return hit
+
+    async def lookup_shared(self, module: str, text: str) -> Optional[LookupHit]:
+        """After a local miss: exact answer published by another worker since our index was built."""
+        index = self.modules.get(module)
+        key = normalize(text)
+        if index is None or not key or self.shared is None:
+            return None
+        try:
+            result_text = await self.shared.call(self.shared.get, self._shared_key(module, key))
+        except SharedStateUnavailable as e:
+            logger.warning("Shared lookup skipped: %s", e)
+            return None
+        if not result_text:
+            return None
+        with self._lock:
+            index.add(key, result_text)
+            self.metrics["shared_hits"] += 1
+            self.metrics["exact_hits"] += 1
+        return LookupHit(result_text, 1.0, exact=True)
+
+    def build(self, db: Session, limit: int = 50000) -> int:
+        """Loads the most recent `limit` answers of each indexed module. Returns how many were indexed."""
+        total = 0
+        for module in INDEXED_MODULES:
+            # One query per module so it is a range read of ix_history_module_id
+            rows = db.query(AnalysisHistory.module, AnalysisHistory.input_text, AnalysisHistory.result_text).filter(
+                AnalysisHistory.module == module.value
+            ).order_by(AnalysisHistory.id.desc()).limit(limit).all()
+            # Oldest first so the newest answer for a key is the one kept
+            for row in reversed(rows):
+                self.add(row.module, row.input_text or "", row.result_text or "", share=False)
+            total += len(rows)
+        logger.info("Lookup index built with %d answers", total)
+        return total
+
+    def snapshot(self) -> dict:
+        lookups = self.metrics["lookups"]
+        hits = self.metrics["exact_hits"] + self.metrics["similar_hits"] # shared_hits are counted as exact
+        return {
+            **self.metrics,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "entries": {name: len(index.entries) for name, index in self.modules.items()},
+        }
+
+
+lookup_index = LookupIndex(
+    threshold=settings.LOOKUP_SIMILARITY_THRESHOLD,
+    shared=shared_state,
+    shared_ttl=settings.LOOKUP_SHARED_TTL_SECONDS
+)
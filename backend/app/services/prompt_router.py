@@ -8,13 +8,21 @@ logger = logging.getLogger(__name__)
 # Base path for prompts
 PROMPT_PATH = Path(__file__).resolve().parent.parent / "prompts"
 
+# Prompt files never change at runtime, so each one is read from disk only once
+_prompt_cache: dict[str, str] = {}
+
 def load_prompt(name: str) -> str:
     """Loads a prompt file from the prompts directory."""
+    cached = _prompt_cache.get(name)
+    if cached is not None:
+        return cached
     file_path = PROMPT_PATH / name
     if not file_path.exists():
-        logger.error(f"Prompt file not found: {file_path}")
+        logger.error("Prompt file not found: %s", file_path)
         raise FileNotFoundError(f"Prompt file {name} not found.")
-    return file_path.read_text(encoding="utf-8")
+    prompt = file_path.read_text(encoding="utf-8")
+    _prompt_cache[name] = prompt
+    return prompt
 
 # Mapping of module to prompt file
 PROMPT_MAPPING = {
@@ -42,6 +50,14 @@ USER_PROMPT_TEMPLATES = {
     AnalysisModule.TRANSLATOR: "Desglosa literalmente la siguiente expresión:\n\n{text}"
 }
 
+def preload_prompts():
+    """Reads every module prompt into the cache (called at startup)."""
+    for name in PROMPT_MAPPING.values():
+        load_prompt(name)
+
+def prompts_loaded() -> bool:
+    return all(name in _prompt_cache for name in PROMPT_MAPPING.values())
+
 def get_prompts(module: str, text: str, user_profile: dict = None, scenario_context: dict = None) -> Tuple[str, str]:
     """
     Returns the system prompt and formatted user prompt for a given module.
@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+from typing import Optional
+from .circuit_breaker import CircuitOpenError
+from .shared_state import SharedState, SharedStateUnavailable
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_KEY = "upstream:backoff_until"
+
+
+class RateLimitExceeded(CircuitOpenError):
+    """No call goes upstream right now. Handled like an open circuit (stale answer or 503 + Retry-After)."""
+
+
+class UpstreamRateLimiter:
+    """
+    Global limit on Claude calls. Calls are counted in fixed one-minute
+    windows in shared state, so the limit holds for all workers together
+    instead of once per worker. A 429 from Anthropic pauses every worker
+    until its Retry-After has passed. The store is used from a worker thread,
+    and if it can't be reached the call goes ahead (fail open).
+    """
+
+    def __init__(self, state: SharedState, max_per_minute: int, backoff_seconds: float, window_seconds: float = 60.0):
+        self.state = state
+        self.max_per_minute = max_per_minute
+        self.backoff_seconds = backoff_seconds
+        self.window_seconds = window_seconds
+        self.metrics = {"allowed": 0, "limited": 0, "backed_off": 0, "backoffs": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.metrics[name] += 1
+
+    async def acquire(self) -> None:
+        """Raises RateLimitExceeded when this call must not reach the upstream."""
+        try:
+            await self.state.call(self._acquire)
+        except SharedStateUnavailable as e:
+            logger.warning("Upstream rate limit not checked: %s", e)
+
+    def _acquire(self) -> None:
+        now = time.time()
+        until = self.state.get(BACKOFF_KEY)
+        if until is not None and until > now:
+            self._count("backed_off")
+            raise RateLimitExceeded("upstream_backoff", until - now)
+
+        if self.max_per_minute > 0:
+            window = int(now // self.window_seconds)
+            calls = self.state.incr(f"upstream:calls:{window}", ttl=self.window_seconds * 2)
+            if calls > self.max_per_minute:
+                self._count("limited")
+                raise RateLimitExceeded("upstream_rate_limit", (window + 1) * self.window_seconds - now)
+        self._count("allowed")
+
+    def back_off(self, retry_after: Optional[float] = None) -> None:
+        """
+        Tells every worker to stop calling for `retry_after` seconds (keeps a
+        later deadline if one is set). Written in the background.
+        """
+        seconds = retry_after if retry_after and retry_after > 0 else self.backoff_seconds
+        self.state.run_soon(self._back_off, time.time() + seconds, seconds)
+
+    def _back_off(self, until: float, seconds: float) -> None:
+        while True:
+            current = self.state.get(BACKOFF_KEY)
+            if current is not None and current >= until:
+                return
+            if self.state.compare_and_set(BACKOFF_KEY, current, until, ttl=seconds):
+                break
+        self._count("backoffs")
+        logger.warning("Upstream rate limited, pausing Claude calls for %.1fs", seconds)
+
+    def snapshot(self) -> dict:
+        return {"max_per_minute": self.max_per_minute, **self.metrics}
@@ -0,0 +1,238 @@
+import asyncio
+import json
+import logging
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Static prefixes never touch the session store (no cookie parsing, no lookup, no Set-Cookie)
+STATIC_PREFIXES = ("/css", "/js", "/assets")
+
+
+class SessionStore(ABC):
+    """
+    Server-side session backend. The browser only holds an opaque session id;
+    the data itself lives here.
+    """
+
+    @abstractmethod
+    async def load(self, session_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def save(self, session_id: str, data: dict) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None:
+        ...
+
+    async def run(self, interval: float) -> None:
+        """Background housekeeping, started by the app's lifespan. Nothing to do by default."""
+
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process LRU with TTL. Fast, but every worker has its own copy,
+    so use DatabaseSessionStore when running more than one worker.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def load(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at < time.monotonic():
+                del self._data[session_id]
+                return None
+            self._data.move_to_end(session_id)
+            return data
+
+    async def save(self, session_id: str, data: dict) -> None:
+        with self._lock:
+            self._data[session_id] = (time.monotonic() + self.ttl_seconds, data)
+            self._data.move_to_end(session_id)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    async def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._data.pop(session_id, None)
+
+
+class DatabaseSessionStore(SessionStore):
+    """
+    Sessions stored in the `sessions` table so every worker sees the same login.
+    Queries run in the threadpool to keep the event loop free.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+
+    def _load(self, session_id: str) -> Optional[dict]:
+        from ..models.db import SessionLocal, ServerSession
+        db = SessionLocal()
+        try:
+            row = db.get(ServerSession, session_id)
+            if row is None:
+                return None
+            if row.expires_at < datetime.utcnow():
+                db.delete(row)
+                db.commit()
+                return None
+            return row.data
+        finally:
+            db.close()
+
+    def _save(self, session_id: str, data: dict) -> None:
+        from ..models.db import SessionLocal, ServerSession
+        db = SessionLocal()
+        try:
+            expires_at = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+            row = db.get(ServerSession, session_id)
+            if row is None:
+                db.add(ServerSession(id=session_id, data=data, expires_at=expires_at))
+            else:
+                row.data = data
+                row.expires_at = expires_at
+            db.commit()
+        finally:
+            db.close()
+
+    def _delete(self, session_id: str) -> None:
+        from ..models.db import SessionLocal, ServerSession
+        db = SessionLocal()
+        try:
+            db.query(ServerSession).filter(ServerSession.id == session_id).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def purge_expired(self) -> int:
+        """Removes expired rows. Returns how many were deleted."""
+        from ..models.db import SessionLocal, ServerSession
+        db = SessionLocal()
+        try:
+            deleted = db.query(ServerSession).filter(ServerSession.expires_at < datetime.utcnow()).delete()
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    async def load(self, session_id: str) -> Optional[dict]:
+        return await run_in_threadpool(self._load, session_id)
+
+    async def save(self, session_id: str, data: dict) -> None:
+        await run_in_threadpool(self._save, session_id, data)
+
+    async def delete(self, session_id: str) -> None:
+        await run_in_threadpool(self._delete, session_id)
+
+    async def run(self, interval: float) -> None:
+        """Deletes expired rows every `interval` seconds (abandoned cookies are never loaded again)."""
+        while True:
+            try:
+                deleted = await run_in_threadpool(self.purge_expired)
+                if deleted:
+                    logger.info("Purged %d expired sessions", deleted)
+            except Exception as e:
+                logger.warning("Session purge failed: %s", e)
+            await asyncio.sleep(interval)
+
+
+def create_session_store(backend: str, ttl_seconds: int, max_entries: int = 10000) -> SessionStore:
+    """Builds the configured session backend ('memory' or 'db')."""
+    if backend == "memory":
+        return MemorySessionStore(ttl_seconds=ttl_seconds, max_entries=max_entries)
+    if backend == "db":
+        return DatabaseSessionStore(ttl_seconds=ttl_seconds)
+    raise ValueError(f"Unknown session backend: {backend}")
+
+
+class ServerSessionMiddleware:
+    """
+    Drop-in replacement for Starlette's SessionMiddleware.
+    The cookie only carries a random session id, nothing is signed or serialized
+    per request, and static routes skip sessions entirely. The id is replaced
+    whenever the session changes.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        store: SessionStore,
+        session_cookie: str = "session",
+        max_age: int = 14 * 24 * 60 * 60,
+        https_only: bool = False,
+        skip_prefixes: tuple = STATIC_PREFIXES,
+    ):
+        self.app = app
+        self.store = store
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.skip_prefixes = skip_prefixes
+        self.security_flags = "httponly; samesite=lax"
+        if https_only:
+            self.security_flags += "; secure"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket") or scope["path"].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        session_id = connection.cookies.get(self.session_cookie)
+        initial = None
+        if session_id:
+            initial = await self.store.load(session_id)
+            if initial is None:
+                # Unknown or expired id: forget it so we never reuse a client-chosen id
+                session_id = None
+
+        scope["session"] = dict(initial) if initial else {}
+        initial_dump = json.dumps(initial or {}, sort_keys=True, default=str)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal session_id
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                if json.dumps(session, sort_keys=True, default=str) != initial_dump:
+                    headers = MutableHeaders(scope=message)
+                    if session:
+                        # Fresh id on every change (login included): an id known before can't be fixated
+                        previous_id, session_id = session_id, secrets.token_urlsafe(32)
+                        await self.store.save(session_id, dict(session))
+                        if previous_id:
+                            await self.store.delete(previous_id)
+                        headers.append(
+                            "Set-Cookie",
+                            f"{self.session_cookie}={session_id}; path=/; Max-Age={self.max_age}; {self.security_flags}"
+                        )
+                    elif session_id:
+                        # The session has been cleared (logout)
+                        await self.store.delete(session_id)
+                        headers.append(
+                            "Set-Cookie",
+                            f"{self.session_cookie}=null; path=/; expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.security_flags}"
+                        )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
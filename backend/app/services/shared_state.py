@@ -0,0 +1,374 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Optional
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Small key/value store for state that must be the same in every worker
+# (entitlement invalidations, circuit state, upstream rate-limit counters,
+# lookup answers). Values are anything JSON-serializable; `ttl` is in seconds
+# and expiry uses the wall clock so every process agrees on it.
+#
+# The methods are blocking. Code on the event loop goes through call()
+# (awaits a worker thread), run_soon() (fire and forget on a background
+# thread) or SharedValue (local copy refreshed in the background).
+
+
+class SharedStateUnavailable(Exception):
+    """The store could not be read or written (e.g. locked for longer than the busy timeout)."""
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+
+def _background() -> ThreadPoolExecutor:
+    # One thread keeps writes in order; rebuilt in each forked worker
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-state")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _log_failure(future) -> None:
+    error = future.exception()
+    if error is not None:
+        logger.warning("Shared state update failed: %s", error)
+
+
+class SharedState(ABC):
+    """Key/value backend with TTL, atomic counters and compare-and-set."""
+
+    name = "base"
+    blocking = True # Whether calls do I/O that must stay off the event loop
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Sets the key only if it is missing (or expired). True if it was set."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """
+        Atomically adds `amount` and returns the new value. A missing key
+        starts at 0 and gets `ttl`; an existing key keeps its expiry, so a
+        counter with a TTL works as a fixed window.
+        """
+
+    @abstractmethod
+    def compare_and_set(self, key: str, expected: Any, value: Any, ttl: Optional[float] = None) -> bool:
+        """Sets the key only if it currently holds `expected` (None = missing). True if it was set."""
+
+    def purge_expired(self) -> int:
+        return 0
+
+    def snapshot(self) -> dict:
+        return {"backend": self.name}
+
+    async def call(self, fn: Callable, *args) -> Any:
+        """Runs a blocking function that uses the store without blocking the event loop."""
+        if not self.blocking:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    def run_soon(self, fn: Callable, *args) -> None:
+        """Runs `fn` on the background thread without waiting for it (failures are logged)."""
+        if not self.blocking:
+            try:
+                fn(*args)
+            except SharedStateUnavailable as e:
+                logger.warning("Shared state update failed: %s", e)
+            return
+        _background().submit(fn, *args).add_done_callback(_log_failure)
+
+
+class SharedValue:
+    """
+    Local copy of one shared key for hot paths that can't wait on I/O.
+    get() returns the last value read and, once it is older than `max_age`
+    seconds, starts a refresh on the background thread.
+    """
+
+    def __init__(self, state: SharedState, key: str, max_age: float = 1.0):
+        self.state = state
+        self.key = key
+        self.max_age = max_age
+        self.value: Optional[Any] = None
+        self.loaded = False # Whether value has been read (or set) at least once
+        self._read_at = float("-inf")
+        self._refreshing = False
+
+    def _refresh(self) -> None:
+        try:
+            self.value = self.state.get(self.key)
+            self.loaded = True
+            self._read_at = time.monotonic()
+        finally:
+            self._refreshing = False
+
+    def get(self) -> Optional[Any]:
+        if not self._refreshing and time.monotonic() - self._read_at >= self.max_age:
+            self._refreshing = True
+            self.state.run_soon(self._refresh)
+        return self.value
+
+    def set_local(self, value: Any) -> None:
+        """Our own write: no need to wait for the next refresh to see it."""
+        self.value = value
+        self.loaded = True
+        self._read_at = time.monotonic()
+
+
+class MemorySharedState(SharedState):
+    """In-process store: fine for a single worker and for tests."""
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self, purge_every: int = 1000):
+        self.purge_every = purge_every
+        self._data: dict[str, tuple[Any, Optional[float]]] = {}
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _store(self, key: str, value: Any, expires_at: Optional[float]) -> None:
+        # Called with the lock held
+        self._data[key] = (value, expires_at)
+        self._writes += 1
+        if self.purge_every and self._writes % self.purge_every == 0:
+            self._purge()
+
+    def _purge(self) -> int:
+        now = time.time()
+        expired = [key for key, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+    def _live(self, key: str) -> Optional[tuple[Any, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[float]:
+        return time.time() + ttl if ttl is not None else None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, self._expiry(ttl))
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._store(key, value, self._expiry(ttl))
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key, amount=1, ttl=None):
+        with self._lock:
+            entry = self._live(key)
+            value = (entry[0] if entry else 0) + amount
+            self._store(key, value, entry[1] if entry else self._expiry(ttl))
+            return value
+
+    def compare_and_set(self, key, expected, value, ttl=None):
+        with self._lock:
+            entry = self._live(key)
+            if (entry[0] if entry else None) != expected:
+                return False
+            self._store(key, value, self._expiry(ttl))
+            return True
+
+    def purge_expired(self):
+        with self._lock:
+            return self._purge()
+
+    def snapshot(self):
+        return {"backend": self.name, "keys": len(self._data)}
+
+
+def _unavailable_on_error(method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except sqlite3.Error as e:
+            raise SharedStateUnavailable(str(e)) from e
+    return wrapper
+
+
+class SqliteSharedState(SharedState):
+    """
+    Store in a local SQLite file in WAL mode, shared by every worker process
+    on the machine without an extra service. Reads are a single indexed
+    SELECT; read-modify-write operations run inside BEGIN IMMEDIATE so they
+    are atomic across processes. Expired rows are skipped on read and
+    deleted every `purge_every` writes. The busy timeout is kept short: a
+    locked store raises SharedStateUnavailable instead of holding a request.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Path, busy_timeout_ms: int = 100, purge_every: int = 1000):
+        self.path = Path(path)
+        self.busy_timeout_ms = busy_timeout_ms
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread, and never one inherited from the gunicorn master
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL") # Losing the last writes on power loss is fine for this data
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_state "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL) WITHOUT ROWID"
+        )
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE") # Takes the write lock up front: no upgrade deadlocks
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self._wrote()
+
+    def _wrote(self) -> None:
+        self._writes += 1
+        if self.purge_every and self._writes % self.purge_every == 0:
+            self.purge_expired()
+
+    @staticmethod
+    def _read(conn: sqlite3.Connection, key: str) -> tuple[bool, Any]:
+        row = conn.execute("SELECT value, expires_at FROM shared_state WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return False, None
+        return True, json.loads(row[0])
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, key: str, value: Any, expires_at: Optional[float]) -> None:
+        conn.execute("INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                     (key, json.dumps(value, ensure_ascii=False), expires_at))
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[float]:
+        return time.time() + ttl if ttl is not None else None
+
+    @_unavailable_on_error
+    def get(self, key):
+        return self._read(self._connect(), key)[1]
+
+    @_unavailable_on_error
+    def set(self, key, value, ttl=None):
+        self._write(self._connect(), key, value, self._expiry(ttl))
+        self._wrote()
+
+    @_unavailable_on_error
+    def add(self, key, value, ttl=None):
+        with self._transaction() as conn:
+            if self._read(conn, key)[0]:
+                return False
+            self._write(conn, key, value, self._expiry(ttl))
+            return True
+
+    @_unavailable_on_error
+    def delete(self, key):
+        self._connect().execute("DELETE FROM shared_state WHERE key = ?", (key,))
+
+    @_unavailable_on_error
+    def incr(self, key, amount=1, ttl=None):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value, expires_at FROM shared_state WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] <= time.time()):
+                value, expires_at = amount, self._expiry(ttl)
+            else:
+                value, expires_at = json.loads(row[0]) + amount, row[1]
+            self._write(conn, key, value, expires_at)
+            return value
+
+    @_unavailable_on_error
+    def compare_and_set(self, key, expected, value, ttl=None):
+        with self._transaction() as conn:
+            if self._read(conn, key)[1] != expected:
+                return False
+            self._write(conn, key, value, self._expiry(ttl))
+            return True
+
+    @_unavailable_on_error
+    def purge_expired(self):
+        cursor = self._connect().execute("DELETE FROM shared_state WHERE expires_at <= ?", (time.time(),))
+        return cursor.rowcount
+
+    def snapshot(self):
+        try:
+            keys = self._connect().execute("SELECT count(*) FROM shared_state").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning("Shared state unavailable: %s", e)
+            keys = None
+        return {"backend": self.name, "path": str(self.path), "keys": keys}
+
+
+def create_shared_state(backend: str, path: Optional[Path] = None, busy_timeout_ms: int = 100) -> SharedState:
+    """Builds the configured shared-state backend ('memory' or 'sqlite')."""
+    if backend == "memory":
+        return MemorySharedState()
+    if backend == "sqlite":
+        return SqliteSharedState(path, busy_timeout_ms=busy_timeout_ms)
+    raise ValueError(f"Unknown shared state backend: {backend}")
+
+
+shared_state = create_shared_state(
+    settings.SHARED_STATE_BACKEND,
+    path=settings.SHARED_STATE_PATH,
+    busy_timeout_ms=settings.SHARED_STATE_BUSY_TIMEOUT_MS
+)
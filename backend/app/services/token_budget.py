@@ -0,0 +1,198 @@
+import json
+import logging
+import math
+import threading
+from dataclasses import dataclass
+from ..models.enums import AnalysisModule
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Output tokens reserved (and sent as max_tokens) per module, sized from the
+# format each prompt asks for (~3.5 chars/token in Spanish) with some headroom
+DEFAULT_OUTPUT_TOKENS = 1024
+MODULE_OUTPUT_TOKENS = {
+    AnalysisModule.ROLEPLAY: 256, # One in-character reply of 2-3 sentences (feedback mode: see output_tokens)
+    AnalysisModule.GLOSSARY: 512, # Five short sections about one expression
+    AnalysisModule.TRANSLATOR: 768, # Word by word breakdown plus three short sections
+    AnalysisModule.MESSAGE: 768, # Five sections about one message
+    AnalysisModule.RESPONSE: 768, # Advice plus a ready-to-send reply and a shorter alternative
+    AnalysisModule.DECODER: 768,
+    AnalysisModule.AUDIO: 1024, # Summarizes a whole transcript
+    AnalysisModule.ROUTINE: 1536, # Markdown table of the day plus tips
+    AnalysisModule.ROLEPLAY_FEEDBACK: 1536, # Feedback on a whole conversation
+}
+
+# The roleplay prompt switches to feedback mode when the user asks for it, and
+# that answer is as long as a roleplay_feedback one
+ROLEPLAY_FEEDBACK_TRIGGERS = ("finalizar_sesion", "feedback")
+
+# Modules whose input is a conversation we can shorten by dropping the oldest turns
+TRIMMABLE_MODULES = {AnalysisModule.ROLEPLAY, AnalysisModule.ROLEPLAY_FEEDBACK}
+
+# Fixed overhead of the messages envelope (roles, separators)
+MESSAGE_OVERHEAD_TOKENS = 8
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast local token estimate. Spanish averages ~3.5 characters per token on
+    Claude's tokenizer; the ratio is recalibrated from real usage (see record_usage).
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / usage_stats.chars_per_token)
+
+
+@dataclass
+class BudgetedPrompt:
+    system_prompt: str
+    user_prompt: str
+    max_tokens: int
+    estimated_input_tokens: int
+    trimmed_turns: int = 0
+
+
+class UsageStats:
+    """Estimated vs actual input tokens, used for reporting and to calibrate the estimate."""
+
+    def __init__(self, chars_per_token: float):
+        self.chars_per_token = chars_per_token
+        self.calls = 0
+        self.estimated_tokens = 0
+        self.actual_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, estimated: int, actual: int, prompt_chars: int) -> None:
+        with self._lock:
+            self.calls += 1
+            self.estimated_tokens += estimated
+            self.actual_tokens += actual
+            if actual > 0 and prompt_chars > 0:
+                # Exponential moving average so the heuristic follows real traffic
+                observed = prompt_chars / actual
+                self.chars_per_token = 0.9 * self.chars_per_token + 0.1 * observed
+
+    def snapshot(self) -> dict:
+        error = (self.estimated_tokens - self.actual_tokens) / self.actual_tokens if self.actual_tokens else 0.0
+        return {
+            "calls": self.calls,
+            "estimated_input_tokens": self.estimated_tokens,
+            "actual_input_tokens": self.actual_tokens,
+            "estimate_error": round(error, 3),
+            "chars_per_token": round(self.chars_per_token, 2),
+        }
+
+
+usage_stats = UsageStats(chars_per_token=settings.CHARS_PER_TOKEN)
+
+
+def record_usage(estimated: int, actual: int, prompt_chars: int) -> None:
+    usage_stats.record(estimated, actual, prompt_chars)
+    logger.debug("Input tokens: estimated %d, actual %d (%+.1f%% cumulative error)",
+                 estimated, actual, usage_stats.snapshot()["estimate_error"] * 100)
+
+
+def _trim_json_history(text: str, drop: int) -> str | None:
+    """Drops the `drop` oldest non-system turns from a JSON roleplay history."""
+    try:
+        history = json.loads(text)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(history, list):
+        return None
+
+    system_turns = [m for m in history if isinstance(m, dict) and m.get("role") == "system"]
+    turns = [m for m in history if not (isinstance(m, dict) and m.get("role") == "system")]
+    # Always keep the latest turn, it is what the model has to answer
+    drop = min(drop, len(turns) - 1)
+    if drop <= 0:
+        return None
+    note = {"role": "system", "content": f"({drop} mensajes anteriores omitidos)"}
+    return json.dumps(system_turns + [note] + turns[drop:], ensure_ascii=False)
+
+
+def _trim_transcript(text: str, drop: int) -> str | None:
+    """Drops the `drop` oldest lines from a 'Tú: ... / IA: ...' transcript."""
+    lines = text.split("\n")
+    drop = min(drop, len(lines) - 1)
+    if drop <= 0:
+        return None
+    return f"[... {drop} turnos anteriores omitidos ...]\n" + "\n".join(lines[drop:])
+
+
+def _count_turns(text: str) -> int:
+    try:
+        history = json.loads(text)
+        if isinstance(history, list):
+            return len(history)
+    except (ValueError, TypeError):
+        pass
+    return text.count("\n") + 1
+
+
+def _last_turn(text: str) -> str:
+    try:
+        history = json.loads(text)
+    except (ValueError, TypeError):
+        return text.rsplit("\n", 1)[-1]
+    if isinstance(history, list) and history and isinstance(history[-1], dict):
+        return str(history[-1].get("content", ""))
+    return text
+
+
+def output_tokens(module: str, text: str) -> int:
+    """max_tokens for one request: the module's budget, or the feedback one when a roleplay asks for feedback."""
+    module_enum = AnalysisModule(module)
+    if module_enum == AnalysisModule.ROLEPLAY:
+        last = _last_turn(text).lower()
+        if any(trigger in last for trigger in ROLEPLAY_FEEDBACK_TRIGGERS):
+            module_enum = AnalysisModule.ROLEPLAY_FEEDBACK
+    return MODULE_OUTPUT_TOKENS.get(module_enum, DEFAULT_OUTPUT_TOKENS)
+
+
+def fit_to_budget(module: str, text: str, system_prompt: str, user_prompt: str) -> BudgetedPrompt:
+    """
+    Budget stage between get_prompts and call_claude.
+    Reserves the module's output tokens out of CONTEXT_TOKEN_TARGET and, for
+    conversations, drops the oldest turns until the prompt fits.
+    Raises ValueError when the prompt can't fit, so we fail before calling Claude.
+    """
+    module_enum = AnalysisModule(module)
+    max_tokens = output_tokens(module, text)
+    input_budget = settings.CONTEXT_TOKEN_TARGET - max_tokens
+
+    system_tokens = estimate_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+    estimated = system_tokens + estimate_tokens(user_prompt)
+    if estimated <= input_budget:
+        return BudgetedPrompt(system_prompt, user_prompt, max_tokens, estimated)
+
+    if module_enum not in TRIMMABLE_MODULES or not user_prompt.endswith(text):
+        raise ValueError(
+            f"El texto es demasiado largo para analizarlo de una vez (aprox. {estimated} tokens, máx {input_budget})."
+        )
+
+    prefix = user_prompt[:len(user_prompt) - len(text)]
+    trim = _trim_json_history if text.lstrip().startswith("[") else _trim_transcript
+
+    # Binary search for the smallest number of dropped turns that fits
+    low, high, best = 1, _count_turns(text), None
+    while low <= high:
+        drop = (low + high) // 2
+        trimmed = trim(text, drop)
+        if trimmed is None:
+            high = drop - 1
+            continue
+        trimmed_estimate = system_tokens + estimate_tokens(prefix + trimmed)
+        if trimmed_estimate <= input_budget:
+            best = (drop, trimmed, trimmed_estimate)
+            high = drop - 1
+        else:
+            low = drop + 1
+
+    if best is None:
+        raise ValueError("El último mensaje es demasiado largo. Por favor, acórtalo.")
+
+    drop, trimmed, trimmed_estimate = best
+    logger.info("Trimmed %d oldest turns from %s (%d -> %d estimated tokens)", drop, module, estimated, trimmed_estimate)
+    return BudgetedPrompt(system_prompt, prefix + trimmed, max_tokens, trimmed_estimate, trimmed_turns=drop)
@@ -0,0 +1,218 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+from ..config import settings
+from ..utils.logging_config import NonBlockingQueueHandler
+
+logger = logging.getLogger(__name__)
+
+# Opt-in capture of the API workload for capacity planning (tools/replay_traffic.py).
+# Only the shape of each request is kept: endpoint, module, input length, which
+# optional fields were set, status, latency and the Claude calls it made
+# ([input_tokens, output_tokens, latency_ms] each). Never text, emails or ids.
+
+CAPTURED_PREFIX = "/api/"
+BODY_PATHS = ("/api/analyze", "/api/analyze/stream", "/api/jobs") # POSTs whose JSON body gives the shape
+MAX_BODY_BYTES = 512 * 1024 # Larger bodies (over the input limits anyway) are passed through unparsed
+ID_SEGMENT = re.compile(r"^/api/jobs/[^/]+")
+
+_upstream_calls: ContextVar[Optional[list]] = ContextVar("upstream_calls", default=None)
+
+
+def record_upstream(input_tokens: Optional[int], output_tokens: Optional[int], latency_ms: float) -> None:
+    """Called by claude_client after each call; no-op outside a captured request."""
+    calls = _upstream_calls.get()
+    if calls is not None:
+        calls.append([input_tokens, output_tokens, latency_ms])
+
+
+def request_shape(payload: dict) -> dict:
+    """Anonymized shape of a TextRequest body."""
+    text = payload.get("text")
+    shape = {"module": payload.get("module"), "chars": len(text) if isinstance(text, str) else 0}
+    if payload.get("module") == "roleplay" and isinstance(text, str):
+        try:
+            history = json.loads(text)
+            shape["turns"] = len(history) if isinstance(history, list) else 0
+        except ValueError:
+            pass
+    scenario = payload.get("scenario_context") or {}
+    flags = [name for name, present in (
+        ("user", payload.get("user_email")),
+        ("profile", payload.get("user_profile")),
+        ("scenario", scenario),
+        ("premium", isinstance(scenario, dict) and scenario.get("is_premium")),
+        ("conversation", payload.get("conversation_id")),
+    ) if present]
+    if flags:
+        shape["flags"] = flags
+    return shape
+
+
+class CaptureFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, ensure_ascii=False, separators=(",", ":"))
+
+
+class TrafficCapture:
+    """
+    Writes one compact JSON line per captured request to a size-rotated file
+    (one per process: `<path stem>-<pid>.jsonl`). Serializing and writing
+    happen on a listener thread, as with the logs; records are dropped when
+    its queue is full.
+    """
+
+    def __init__(self, enabled: bool, path: Path, max_bytes: int, backups: int, sample_rate: float, queue_size: int = 10000):
+        self.enabled = enabled
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.sample_rate = sample_rate
+        self.queue_size = queue_size
+        self.file: Optional[Path] = None
+        self._handler: Optional[NonBlockingQueueHandler] = None
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self.written = 0
+
+    def start(self) -> None:
+        if not self.enabled or self._listener:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = self.path.with_name(f"{self.path.stem}-{os.getpid()}{self.path.suffix or '.jsonl'}")
+        output = logging.handlers.RotatingFileHandler(self.file, maxBytes=self.max_bytes, backupCount=self.backups,
+                                                      encoding="utf-8")
+        output.setFormatter(CaptureFormatter())
+        self._handler = NonBlockingQueueHandler(queue.Queue(maxsize=self.queue_size))
+        self._listener = logging.handlers.QueueListener(self._handler.queue, output)
+        self._listener.start()
+        logger.info("Capturing traffic shapes to %s", self.file)
+
+    def stop(self) -> None:
+        if self._listener:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+        self._listener = self._handler = None
+
+    @property
+    def active(self) -> bool:
+        return self._handler is not None
+
+    def sampled(self) -> bool:
+        return self.active and (self.sample_rate >= 1.0 or random.random() < self.sample_rate)
+
+    def write(self, entry: dict) -> None:
+        if self._handler is None:
+            return
+        self._handler.enqueue(logging.LogRecord("enclaro.traffic", logging.INFO, "", 0, entry, None, None))
+        self.written += 1
+
+    @contextmanager
+    def job(self, payload: dict):
+        """
+        Captures an async job run (its Claude calls happen outside the POST
+        /api/jobs request). The caller sets entry["status"].
+        """
+        if not self.sampled():
+            yield {}
+            return
+        entry = {"ts": round(time.time(), 3), "method": "JOB", "path": "job", **request_shape(payload)}
+        calls = []
+        token = _upstream_calls.set(calls)
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            _upstream_calls.reset(token)
+            entry["ms"] = round((time.perf_counter() - start) * 1000, 1)
+            entry["up"] = list(calls)
+            self.write(entry)
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.active,
+            "file": str(self.file) if self.file else None,
+            "written": self.written,
+            "dropped": self._handler.dropped if self._handler else 0,
+        }
+
+
+class TrafficCaptureMiddleware:
+    """Records the shape, status and latency of /api requests while capture is active."""
+
+    def __init__(self, app, capture: TrafficCapture):
+        self.app = app
+        self.capture = capture
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(CAPTURED_PREFIX) or not self.capture.sampled():
+            return await self.app(scope, receive, send)
+
+        entry = {"ts": round(time.time(), 3), "method": scope["method"], "path": ID_SEGMENT.sub("/api/jobs/{id}", scope["path"])}
+        start = time.perf_counter()
+
+        if scope["method"] == "POST" and scope["path"] in BODY_PATHS:
+            # Read the body to get its shape, then hand the same bytes to the app
+            chunks, more_body, size = [], True, 0
+            while more_body:
+                message = await receive()
+                if message["type"] != "http.request":
+                    break
+                chunks.append(message.get("body", b""))
+                size += len(chunks[-1])
+                more_body = message.get("more_body", False)
+            body = b"".join(chunks)
+            if size <= MAX_BODY_BYTES:
+                try:
+                    payload = json.loads(body)
+                    if isinstance(payload, dict):
+                        entry.update(request_shape(payload))
+                except ValueError:
+                    pass
+            replayed = False
+
+            async def receive_body():
+                nonlocal replayed
+                if not replayed:
+                    replayed = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+                return await receive()
+        else:
+            receive_body = receive
+
+        status = 500
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        calls = []
+        token = _upstream_calls.set(calls)
+        try:
+            await self.app(scope, receive_body, send_with_status)
+        finally:
+            _upstream_calls.reset(token)
+            entry["status"] = status
+            entry["ms"] = round((time.perf_counter() - start) * 1000, 1)
+            if calls:
+                entry["up"] = list(calls) # Background work started by the request may still append
+            self.capture.write(entry)
+
+
+traffic_capture = TrafficCapture(
+    enabled=settings.TRAFFIC_CAPTURE_ENABLED,
+    path=settings.TRAFFIC_CAPTURE_PATH,
+    max_bytes=settings.TRAFFIC_CAPTURE_MAX_BYTES,
+    backups=settings.TRAFFIC_CAPTURE_BACKUPS,
+    sample_rate=settings.TRAFFIC_CAPTURE_SAMPLE_RATE
+)
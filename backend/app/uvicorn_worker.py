@@ -0,0 +1,23 @@
+import importlib.util
+
+try:
+    from uvicorn_worker import UvicornWorker
+except ImportError:
+    from uvicorn.workers import UvicornWorker
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+class FastUvicornWorker(UvicornWorker):
+    """
+    Gunicorn worker running uvicorn on uvloop + httptools.
+    Falls back to the stock asyncio loop / h11 parser when the C extensions
+    are not installed (e.g. on Windows dev machines).
+    """
+    CONFIG_KWARGS = {
+        "loop": "uvloop" if _available("uvloop") else "asyncio",
+        "http": "httptools" if _available("httptools") else "h11",
+        "proxy_headers": True,
+    }
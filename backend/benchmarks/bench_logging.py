@@ -0,0 +1,116 @@
+"""
+Event-loop latency during a log burst: direct StreamHandler vs the queued setup.
+
+    cd backend && python benchmarks/bench_logging.py --records 2000 --write-delay-ms 0.5
+
+stdout is simulated by a stream whose writes take --write-delay-ms (what a
+backed-up pipe on Render looks like). A probe task sleeps 1 ms in a loop and
+records how late it wakes up while request-like coroutines log; the lag
+percentiles are what every in-flight request would feel.
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.utils.logging_config import setup_logging, stop_logging
+
+
+class SlowStream:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, data: str) -> None:
+        time.sleep(self.delay)
+        self.lines += data.count("\n")
+
+    def flush(self) -> None:
+        pass
+
+
+def install_direct(stream) -> logging.Handler:
+    """The previous setup: logging.basicConfig with a StreamHandler, formatting on the caller."""
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    logging.getLogger().addHandler(handler)
+    return handler
+
+
+async def burst(records: int, workers: int) -> None:
+    logger = logging.getLogger("bench")
+
+    async def worker(n: int):
+        for i in range(records // workers):
+            logger.info("Claude call finished", extra={"analysis_module": "glossary", "latency_ms": 812.0,
+                                                       "input_tokens": 950, "output_tokens": 310})
+            if i % 100 == 0:
+                try:
+                    raise ValueError("upstream said no")
+                except ValueError:
+                    logger.exception("Unexpected error during text analysis")
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(worker(n) for n in range(workers)))
+
+
+async def measure(records: int, workers: int) -> dict:
+    lags = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append((time.perf_counter() - start - 0.001) * 1000)
+
+    probe_task = asyncio.create_task(probe())
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    await burst(records, workers)
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe_task
+    lags.sort()
+    return {
+        "burst_s": elapsed,
+        "p50": statistics.median(lags),
+        "p99": lags[int(len(lags) * 0.99) - 1],
+        "max": lags[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=20)
+    parser.add_argument("--write-delay-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    results = {}
+
+    stream = SlowStream(args.write_delay_ms / 1000)
+    handler = install_direct(stream)
+    results["direct StreamHandler"] = asyncio.run(measure(args.records, args.workers))
+    logging.getLogger().removeHandler(handler)
+
+    stream = SlowStream(args.write_delay_ms / 1000)
+    setup_logging(stream=stream)
+    results["QueueHandler + listener"] = asyncio.run(measure(args.records, args.workers))
+    stop_logging() # Drains the queue
+    logging.getLogger().setLevel(logging.INFO)
+
+    print(f"{args.records} records, {args.write_delay_ms} ms per stdout write")
+    print(f"{'setup':<26}{'burst s':>9}{'lag p50 ms':>12}{'lag p99 ms':>12}{'lag max ms':>12}")
+    for name, r in results.items():
+        print(f"{name:<26}{r['burst_s']:>9.2f}{r['p50']:>12.2f}{r['p99']:>12.2f}{r['max']:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compares the old single-process uvicorn command with the gunicorn launcher.
+
+    cd backend && python benchmarks/bench_server.py --requests 2000 --concurrency 64
+
+Both servers are started on free local ports, warmed up, then hit with the same
+load on a cheap endpoint. Prints throughput and latency percentiles for each.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def commands(port: int) -> dict:
+    return {
+        "uvicorn (current)": [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        "gunicorn launcher": [sys.executable, "-m", "gunicorn", "-c", str(BACKEND_DIR / "gunicorn_conf.py"),
+                              "--bind", f"127.0.0.1:{port}", "app.main:app"],
+    }
+
+
+async def wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not come up")
+
+
+async def run_load(url: str, total: int, concurrency: int) -> dict:
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async def worker(client):
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            await client.get(url)
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--path", default="/")
+    args = parser.parse_args()
+
+    env = {**os.environ, "PYTHONPATH": str(BACKEND_DIR)}
+    port = free_port()
+    for name, cmd in commands(port).items():
+        proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            url = f"http://127.0.0.1:{port}{args.path}"
+            await wait_ready(url)
+            await run_load(url, min(200, args.requests), args.concurrency) # warm-up
+            result = await run_load(url, args.requests, args.concurrency)
+            print(f"{name:20s} {result['rps']:8.0f} req/s  p50 {result['p50_ms']:6.1f} ms  p99 {result['p99_ms']:6.1f} ms")
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
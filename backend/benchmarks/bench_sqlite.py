@@ -0,0 +1,127 @@
+"""
+SQLite under concurrent read/write mixes: the old engine (rollback journal,
+one pool for everything) vs the WAL profile from models.db.create_engines.
+
+    cd backend && python benchmarks/bench_sqlite.py --processes 4 --threads 8 --seconds 5
+
+Each process stands for a gunicorn worker with its own engines; each thread
+loops on the same operations the API runs: reading a user's history and
+wellbeing (reads) and saving an analysis (writes). Prints throughput, latency
+percentiles and "database is locked" errors per mix.
+"""
+import argparse
+import multiprocessing
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.models.db import AnalysisHistory, RoutingSession, WellbeingLog, create_engines, init_db
+
+USERS = 200
+
+
+def old_sessionmaker(url: str):
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    init_db(engine)
+    return sessionmaker(bind=engine), [engine]
+
+
+def wal_sessionmaker(url: str):
+    writer, reader = create_engines(url)
+    init_db(writer)
+    return sessionmaker(class_=RoutingSession, writer=writer, reader=reader), [writer, reader]
+
+
+def run_process(args) -> tuple:
+    factory, url, threads, seconds, write_ratio = args
+    Session, engines = factory(url)
+    latencies, errors = run(Session, threads, seconds, write_ratio)
+    for engine in engines:
+        engine.dispose()
+    return latencies, errors
+
+
+def run(Session, threads: int, seconds: float, write_ratio: float) -> tuple:
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(n: int):
+        i = 0
+        local = []
+        while time.perf_counter() < deadline:
+            i += 1
+            email = f"user{(n * 7919 + i) % USERS}@example.com"
+            start = time.perf_counter()
+            db = Session()
+            try:
+                if (i % 100) < write_ratio * 100:
+                    db.add(AnalysisHistory(user_email=email, module="message", input_text="hola " * 50,
+                                           result_text="respuesta " * 200, meta_data={}))
+                    db.commit()
+                else:
+                    db.query(AnalysisHistory).filter(AnalysisHistory.user_email == email).order_by(
+                        AnalysisHistory.timestamp.desc()).limit(50).all()
+                    db.query(WellbeingLog).filter(WellbeingLog.user_email == email).order_by(
+                        WellbeingLog.date.asc()).limit(30).all()
+                local.append(time.perf_counter() - start)
+            except OperationalError as e:
+                db.rollback()
+                with lock:
+                    errors.append(str(e.orig))
+            finally:
+                db.close()
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    return latencies, errors
+
+
+def summarize(latencies: list, errors: list, seconds: float) -> dict:
+    latencies.sort()
+    return {
+        "ops_s": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0,
+        "locked": sum("locked" in e for e in errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--mixes", type=float, nargs="+", default=[0.05, 0.2, 0.5], help="Write ratios")
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes x {args.threads} threads, {args.seconds}s per run")
+    print(f"{'profile':<22}{'writes':>7}{'ops/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'locked':>8}")
+    for write_ratio in args.mixes:
+        for name, factory in (("rollback journal", old_sessionmaker), ("WAL + writer/readers", wal_sessionmaker)):
+            with tempfile.TemporaryDirectory() as tmp:
+                url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+                factory(url)[1][0].dispose() # Create the schema once
+                with multiprocessing.Pool(args.processes) as pool:
+                    results = pool.map(run_process, [(factory, url, args.threads, args.seconds, write_ratio)] * args.processes)
+                r = summarize([l for lat, _ in results for l in lat], [e for _, err in results for e in err], args.seconds)
+            print(f"{name:<22}{write_ratio:>7.0%}{r['ops_s']:>9.0f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['locked']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Gunicorn configuration for production:
+#
+#     gunicorn -c backend/gunicorn_conf.py app.main:app
+#
+# Every value can be overridden with an environment variable of the same name
+# (WEB_CONCURRENCY, PORT, MAX_REQUESTS, ...). Send SIGHUP to the master for a
+# graceful reload: new workers boot before the old ones finish their requests.
+import multiprocessing
+import os
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+# Rough resident size of one worker (FastAPI + SQLAlchemy + anthropic SDK)
+WORKER_MEMORY_MB = int(os.getenv("WORKER_MEMORY_MB", "160"))
+
+
+def available_cpus() -> int:
+    """CPUs we can actually use, honouring cgroup quotas (containers) and affinity."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = multiprocessing.cpu_count()
+
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def available_memory_mb() -> int | None:
+    """Memory limit of the container, or of the machine when there is no cgroup limit."""
+    try:
+        limit = Path("/sys/fs/cgroup/memory.max").read_text().strip()
+        if limit != "max":
+            return int(limit) // (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    try:
+        for line in Path("/proc/meminfo").read_text().splitlines():
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def default_workers() -> int:
+    # Workers are mostly waiting on Anthropic, so 2 * cores + 1 is a good start,
+    # capped so we don't get OOM-killed on small instances.
+    workers = 2 * available_cpus() + 1
+    memory_mb = available_memory_mb()
+    if memory_mb:
+        workers = min(workers, max(1, memory_mb // WORKER_MEMORY_MB))
+    return workers
+
+
+# --- Server socket ---
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+backlog = int(os.getenv("BACKLOG", "2048"))
+
+# --- Workers ---
+workers = int(os.getenv("WEB_CONCURRENCY", default_workers()))
+if workers > 1:
+    # In-process sessions and shared state would differ per worker (an OAuth state saved
+    # by one worker is missing in the one handling /auth/callback). Read by app.config.
+    os.environ.setdefault("SESSION_BACKEND", "db")
+    os.environ.setdefault("SHARED_STATE_BACKEND", "sqlite")
+worker_class = "app.uvicorn_worker.FastUvicornWorker"
+pythonpath = str(BACKEND_DIR)
+preload_app = True # Import the app once in the master; workers fork with it loaded
+
+# Recycle workers periodically to contain slow leaks; jitter avoids restarting all at once
+max_requests = int(os.getenv("MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "200"))
+
+# Claude calls can take a while, don't kill workers mid-analysis
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("KEEPALIVE", "5")) # Render's proxy keeps upstream connections open
+
+# --- Logging ---
+accesslog = None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+forwarded_allow_ips = "*"
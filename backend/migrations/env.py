@@ -0,0 +1,32 @@
+from logging.config import fileConfig
+from alembic import context
+from app.models.db import Base, engine
+
+config = context.config
+
+# Only when run from the alembic CLI; the app configures logging itself
+if config.config_file_name is not None and config.attributes.get("connection") is None:
+    fileConfig(config.config_file_name)
+
+
+def run_migrations_online() -> None:
+    # init_db() hands us its connection; the CLI uses the app's engine (DATABASE_URL)
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=Base.metadata, render_as_batch=True)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=Base.metadata, render_as_batch=True)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    context.configure(url=str(engine.url), target_metadata=Base.metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+else:
+    run_migrations_online()
@@ -0,0 +1,69 @@
+"""Initial schema (the tables init_db used to create with create_all)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing databases were built by Base.metadata.create_all: only create what is missing
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("email", sa.String(), nullable=True),
+            sa.Column("is_premium", sa.Boolean(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    if "history" not in existing:
+        op.create_table(
+            "history",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_email", sa.String(), sa.ForeignKey("users.email"), nullable=True),
+            sa.Column("module", sa.String(), nullable=True),
+            sa.Column("input_text", sa.Text(), nullable=True),
+            sa.Column("result_text", sa.Text(), nullable=True),
+            sa.Column("timestamp", sa.DateTime(), nullable=True),
+            sa.Column("meta_data", sa.JSON(), nullable=True),
+        )
+        op.create_index("ix_history_id", "history", ["id"])
+
+    if "wellbeing_logs" not in existing:
+        op.create_table(
+            "wellbeing_logs",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_email", sa.String(), sa.ForeignKey("users.email"), nullable=True),
+            sa.Column("battery_level", sa.Integer(), nullable=True),
+            sa.Column("date", sa.DateTime(), nullable=True),
+            sa.Column("notes", sa.Text(), nullable=True),
+        )
+        op.create_index("ix_wellbeing_logs_id", "wellbeing_logs", ["id"])
+
+    if "sessions" not in existing:
+        op.create_table(
+            "sessions",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("data", sa.JSON(), nullable=True),
+            sa.Column("expires_at", sa.DateTime(), nullable=True),
+        )
+        op.create_index("ix_sessions_expires_at", "sessions", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_table("sessions")
+    op.drop_table("wellbeing_logs")
+    op.drop_table("history")
+    op.drop_table("users")
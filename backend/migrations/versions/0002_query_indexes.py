@@ -0,0 +1,31 @@
+"""Indexes for the columns every read filters or sorts on
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # if_not_exists: databases made by create_all() with the current models already have them
+    # GET /api/history: WHERE user_email = ? ORDER BY timestamp DESC
+    op.create_index("ix_history_user_email_timestamp", "history", ["user_email", "timestamp"], if_not_exists=True)
+    # Lookup index build and stale fallback: WHERE module ... ORDER BY id DESC
+    op.create_index("ix_history_module_id", "history", ["module", "id"], if_not_exists=True)
+    # /api/wellbeing: WHERE user_email = ? AND date in a range / ORDER BY date
+    op.create_index("ix_wellbeing_logs_user_email_date", "wellbeing_logs", ["user_email", "date"], if_not_exists=True)
+    # Entitlement preload: WHERE is_premium
+    op.create_index("ix_users_is_premium", "users", ["is_premium"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_is_premium", table_name="users")
+    op.drop_index("ix_wellbeing_logs_user_email_date", table_name="wellbeing_logs")
+    op.drop_index("ix_history_module_id", table_name="history")
+    op.drop_index("ix_history_user_email_timestamp", table_name="history")
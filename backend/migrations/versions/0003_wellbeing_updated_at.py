@@ -0,0 +1,28 @@
+"""Last-change timestamp on wellbeing logs, for conditional GETs and delta sync
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("wellbeing_logs") as batch:
+        batch.add_column(sa.Column("updated_at", sa.DateTime(), nullable=True))
+    # Existing logs: last written when they were created (or we can't tell better)
+    op.execute("UPDATE wellbeing_logs SET updated_at = date WHERE updated_at IS NULL")
+    # GET /api/wellbeing: MAX(updated_at) WHERE user_email = ? and WHERE updated_at > since
+    op.create_index("ix_wellbeing_logs_user_email_updated_at", "wellbeing_logs", ["user_email", "updated_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_wellbeing_logs_user_email_updated_at", table_name="wellbeing_logs")
+    with op.batch_alter_table("wellbeing_logs") as batch:
+        batch.drop_column("updated_at")
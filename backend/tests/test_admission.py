@@ -0,0 +1,92 @@
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+from app.main import app, admission
+from app.services.admission import AdmissionController, AdmissionMiddleware, classify
+
+def test_classify():
+    assert classify("/api/analyze") == "analyze"
+    assert classify("/api/analyze/stream") == "analyze"
+    assert classify("/api/history") == "api"
+    assert classify("/auth/login") == "api"
+    assert classify("/api/wellbeing") == "light"
+    assert classify("/js/app.js") == "light"
+    assert classify("/healthz") == "light"
+    assert classify("/") == "light"
+    assert classify("/api/jobs", "POST") == "analyze" # Submitting a job starts Claude work
+    assert classify("/api/jobs/abc123") == "api"
+    assert classify("/api/jobs/abc123/events") == "stream"
+
+def make_controller(**overrides):
+    options = dict(limits={"analyze": 1, "api": 1}, max_loop_lag_ms=100, max_upstream=10,
+                   upstream_depth=lambda: 0, retry_after=3)
+    options.update(overrides)
+    return AdmissionController(**options)
+
+def slow_app(release: asyncio.Event):
+    async def app(scope, receive, send):
+        if scope["path"].startswith("/api/analyze") or scope["path"].endswith("/events"):
+            await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+    return app
+
+def test_sheds_excess_analyze_but_not_light_traffic():
+    async def scenario():
+        release = asyncio.Event()
+        controller = make_controller()
+        transport = httpx.ASGITransport(app=AdmissionMiddleware(slow_app(release), controller))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = asyncio.create_task(client.post("/api/analyze"))
+            await asyncio.sleep(0.05)
+            assert controller.in_flight["analyze"] == 1
+
+            rejected = await client.post("/api/analyze")
+            assert rejected.status_code == 503
+            assert rejected.headers["retry-after"] == "3"
+            # Other classes keep their own budget
+            assert (await client.get("/api/history")).status_code == 200
+            assert (await client.get("/api/wellbeing")).status_code == 200
+            assert (await client.get("/healthz")).status_code == 200
+
+            release.set()
+            assert (await first).status_code == 200
+        assert controller.in_flight == {"analyze": 0, "stream": 0, "api": 0, "light": 0}
+        assert controller.metrics["rejected"] == {"analyze:in_flight": 1}
+    asyncio.run(scenario())
+
+def test_job_watches_have_their_own_budget():
+    async def scenario():
+        release = asyncio.Event()
+        controller = make_controller(limits={"analyze": 1, "stream": 2, "api": 1})
+        transport = httpx.ASGITransport(app=AdmissionMiddleware(slow_app(release), controller))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            watches = [asyncio.create_task(client.get(f"/api/jobs/{i}/events")) for i in range(2)]
+            await asyncio.sleep(0.05)
+            assert (await client.get("/api/jobs/2/events")).status_code == 503
+            assert (await client.get("/api/history")).status_code == 200 # Not starved by the watches
+            release.set()
+            assert [(await watch).status_code for watch in watches] == [200, 200]
+        assert controller.metrics["rejected"] == {"stream:in_flight": 1}
+    asyncio.run(scenario())
+
+def test_sheds_analyze_on_loop_lag_and_upstream_depth():
+    depth = {"value": 0}
+    controller = make_controller(limits={"analyze": 10, "api": 10}, upstream_depth=lambda: depth["value"])
+    controller.lag_monitor.lag_ms = 500
+    assert controller.rejection_reason("analyze") == "loop_lag"
+    assert controller.rejection_reason("api") is None
+    controller.lag_monitor.lag_ms = 0
+    depth["value"] = 10
+    assert controller.rejection_reason("analyze") == "upstream_queue"
+    assert controller.rejection_reason("light") is None
+    assert controller.rejection_reason("stream") is None # No limit configured
+
+def test_app_returns_503_with_retry_after(monkeypatch):
+    monkeypatch.setitem(admission.limits, "analyze", 0)
+    with TestClient(app) as client:
+        response = client.post("/api/analyze", json={"module": "glossary", "text": "hola"})
+        assert response.status_code == 503
+        assert response.headers["retry-after"]
+        assert "ocupado" in response.json()["detail"]
+        assert client.get("/healthz").status_code == 200
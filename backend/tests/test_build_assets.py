@@ -0,0 +1,33 @@
+import re
+from tools.build_assets import FRONTEND_DIR, build, minify_js
+
+def test_minify_keeps_literals():
+    source = """
+    // comment
+    const a = "// not a comment";   /* block */
+    const b = `line
+        ${a}`;
+    const c = text.replace(/`(.*?)`/g, '<code>$1</code>'); // trailing
+    return /[/]/.test(c) ? a / 2 : b;
+    """
+    out = minify_js(source)
+    assert "comment\n" not in out and "block" not in out and "trailing" not in out
+    assert '"// not a comment"' in out
+    assert "`line\n        ${a}`" in out
+    assert "/`(.*?)`/g" in out
+    assert "/[/]/.test(c) ? a / 2 : b" in out
+
+def test_build_bundles_only_used_icons(tmp_path):
+    dist = tmp_path / "dist"
+    report = build(FRONTEND_DIR, dist)
+
+    html = (dist / "index.html").read_text(encoding="utf-8")
+    assert "lucide.min.js" not in html and "unpkg.com/lucide" not in html
+    assert not re.search(r"<script>\s*\S", html) # No inline scripts left
+    assert not (dist / "js" / "app_v7.js").exists()
+
+    icons = next(dist.glob("js/icons.*.js")).read_text(encoding="utf-8")
+    assert '"languages":' in icons and "window.lucide=" in icons
+    assert '"zap":' not in icons # Not used by the app
+    js_size = sum(size for url, size in report["files"].items() if url.endswith(".js"))
+    assert js_size < report["before_bytes"] / 4
@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.config import settings
+from app.services import claude_client
+from app.models.enums import AnalysisModule
+from app.services.chunked_analysis import REDUCE_INSTRUCTIONS, split_into_chunks, analyze_chunked
+from app.services.prompt_router import get_prompts
+from app.services.token_budget import MODULE_OUTPUT_TOKENS, estimate_tokens
+
+def test_split_respects_sentences_and_speakers():
+    text = "\n".join(f"Ana: Frase número {i}. Otra frase más." for i in range(50))
+    chunks = split_into_chunks(text, max_chars=200)
+    assert len(chunks) > 1
+    assert all(len(c) <= 200 for c in chunks)
+    assert all(c.startswith("Ana:") for c in chunks)
+    assert "\n".join(chunks) == text
+
+def test_split_cuts_oversized_sentence_at_whitespace():
+    chunks = split_into_chunks("palabra " * 100, max_chars=50)
+    assert all(len(c) <= 50 for c in chunks)
+    assert all(not c.startswith(" ") for c in chunks)
+
+@pytest.fixture
+def fake_claude(monkeypatch):
+    calls = []
+    in_flight = {"now": 0, "max": 0}
+
+    async def call(system_prompt, user_prompt, **kwargs):
+        calls.append(user_prompt)
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        return "Resumen combinado" if "Interpretación parcial" in user_prompt else "Parcial"
+
+    monkeypatch.setattr(claude_client, "call_claude", call)
+    monkeypatch.setattr(settings, "CHUNK_MAX_CHARS", 500)
+    monkeypatch.setattr(settings, "CHUNK_CONCURRENCY", 2)
+    return calls, in_flight
+
+def test_map_reduce_with_bounded_parallelism(fake_claude):
+    calls, in_flight = fake_claude
+    progress = []
+
+    async def on_progress(done, total):
+        progress.append((done, total))
+
+    text = "Hola. " * 500
+    result = asyncio.run(analyze_chunked("audio", text, on_progress=on_progress))
+
+    chunks = len(split_into_chunks(text, 500))
+    assert result == "Resumen combinado"
+    assert len(calls) == chunks + 1
+    assert in_flight["max"] == 2
+    assert progress[-1] == (chunks + 1, chunks + 1)
+
+def test_reduce_uses_the_module_budget_and_gives_up_when_it_cannot_shrink(monkeypatch):
+    calls = []
+
+    async def call(system_prompt, user_prompt, **kwargs):
+        calls.append(kwargs["max_tokens"])
+        return "Interpretación muy larga. " * 40 # Never shorter than what it merges
+
+    monkeypatch.setattr(claude_client, "call_claude", call)
+    monkeypatch.setattr(settings, "CHUNK_MAX_CHARS", 500)
+    text = "Hola. " * 500
+    asyncio.run(analyze_chunked("audio", text)) # Default budget: one merge
+    assert set(calls) == {MODULE_OUTPUT_TOKENS[AnalysisModule.AUDIO]}
+
+    calls.clear()
+    system_tokens = estimate_tokens(get_prompts("audio", "")[0] + REDUCE_INSTRUCTIONS)
+    monkeypatch.setattr(settings, "CONTEXT_TOKEN_TARGET", system_tokens + 1500)
+    with pytest.raises(ValueError):
+        asyncio.run(analyze_chunked("audio", text))
+    assert len(calls) == len(split_into_chunks(text, 500)) # Only the map calls, no endless merge rounds
+
+def test_stream_endpoint_reports_progress(fake_claude):
+    client = TestClient(app)
+    with client.stream("POST", "/api/analyze/stream", json={"text": "Hola. " * 500, "module": "message"}) as response:
+        body = "".join(response.iter_text())
+    assert response.status_code == 200
+    assert body.count("event: progress") >= 2
+    assert 'event: result\ndata: {"result": "Resumen combinado"}' in body
@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.api import routes
+from app.config import settings
+from app.models.db import Base, get_db, AnalysisHistory
+from app.services import claude_client
+from app.services.circuit_breaker import BreakerRegistry, CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+from tools.fake_anthropic import FakeAnthropic, fake_client
+
+def test_breaker_opens_and_recovers():
+    breaker = CircuitBreaker("model", failure_threshold=2, recovery_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    asyncio.run(asyncio.sleep(0.06))
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError): # Only one trial call at a time
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+def test_overloaded_upstream_opens_circuit(monkeypatch):
+    fake = FakeAnthropic(status_code=529)
+    monkeypatch.setattr(claude_client, "_client", fake_client(fake))
+    monkeypatch.setattr(claude_client, "breakers", BreakerRegistry(failure_threshold=2, recovery_timeout=60))
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(Exception):
+                await claude_client.call_claude("sys", "hola")
+        with pytest.raises(CircuitOpenError):
+            await claude_client.call_claude("sys", "hola")
+
+    asyncio.run(scenario())
+    assert fake.calls == 2 # The third call never reached the upstream
+
+@pytest.fixture
+def degraded_client(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'degraded.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    db.add(AnalysisHistory(module="glossary", input_text="estar en las nubes", result_text="Estar distraído."))
+    db.commit()
+    db.close()
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def open_circuit(*args, **kwargs):
+        raise CircuitOpenError(settings.CLAUDE_MODEL, retry_after=12.3)
+
+    monkeypatch.setattr(routes, "call_claude", open_circuit)
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    return TestClient(app)
+
+def test_open_circuit_serves_stale_glossary_answer(degraded_client):
+    response = degraded_client.post("/api/analyze", json={"text": "estar en las nubes", "module": "glossary"})
+    assert response.status_code == 200
+    assert response.json()["result"] == "Estar distraído."
+    assert response.json()["degraded"] is True
+
+def test_open_circuit_without_fallback_asks_to_retry(degraded_client):
+    response = degraded_client.post("/api/analyze", json={"text": "Hola", "module": "message"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "13"
@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.api import routes
+from app.models.db import AnalysisHistory, WellbeingLog, get_db, init_db
+
+EMAIL = "sync@example.com"
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sync.db'}", connect_args={"check_same_thread": False})
+    init_db(engine)
+    Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def fake_call_claude(*args, **kwargs):
+        return "Respuesta simulada"
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    monkeypatch.setattr(routes, "call_claude", fake_call_claude)
+    monkeypatch.setattr(routes.settings, "LOOKUP_INDEX_ENABLED", False)
+    client = TestClient(app)
+    client.engine = engine
+    yield client
+    engine.dispose()
+
+def analyze(client, text):
+    response = client.post("/api/analyze", json={"module": "message", "text": text, "user_email": EMAIL})
+    assert response.status_code == 200
+
+def version(response) -> str:
+    return response.headers["etag"].strip('"')
+
+def test_history_etag_and_304_without_loading_rows(client):
+    analyze(client, "Primero")
+    first = client.get("/api/history", params={"email": EMAIL})
+    assert first.status_code == 200 and len(first.json()) == 1
+    assert first.headers["cache-control"] == "private, no-cache"
+    assert "last-modified" in first.headers
+
+    statements = []
+    event.listen(client.engine, "before_cursor_execute", lambda *a, **k: statements.append(a[2]))
+    repeat = client.get("/api/history", params={"email": EMAIL}, headers={"If-None-Match": first.headers["etag"]})
+    assert repeat.status_code == 304
+    assert repeat.content == b""
+    assert repeat.headers["etag"] == first.headers["etag"]
+    selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+    assert len(selects) == 1 and "max(" in selects[0].lower() # Just the version lookup
+
+    by_date = client.get("/api/history", params={"email": EMAIL},
+                         headers={"If-Modified-Since": first.headers["last-modified"]})
+    assert by_date.status_code == 304
+
+def test_history_since_returns_only_new_items(client):
+    analyze(client, "Primero")
+    first = client.get("/api/history", params={"email": EMAIL})
+    analyze(client, "Segundo")
+    analyze(client, "Tercero")
+
+    stale = client.get("/api/history", params={"email": EMAIL, "since": version(first)},
+                       headers={"If-None-Match": first.headers["etag"]})
+    assert stale.status_code == 200
+    assert [h["input_text"] for h in stale.json()] == ["Tercero", "Segundo"]
+    assert int(version(stale)) > int(version(first))
+
+    caught_up = client.get("/api/history", params={"email": EMAIL, "since": version(stale)})
+    assert caught_up.status_code == 200 and caught_up.json() == []
+
+def test_history_of_unknown_user(client):
+    response = client.get("/api/history", params={"email": "nobody@example.com"})
+    assert response.json() == []
+    again = client.get("/api/history", params={"email": "nobody@example.com"}, headers={"If-None-Match": response.headers["etag"]})
+    assert again.status_code == 304
+
+def test_wellbeing_since_includes_updated_logs(client):
+    Session = sessionmaker(bind=client.engine)
+    db = Session()
+    now = datetime.utcnow()
+    db.add_all([WellbeingLog(user_email=EMAIL, battery_level=40 + i, date=now - timedelta(days=i)) for i in range(1, 35)])
+    db.commit()
+    db.close()
+
+    first = client.get("/api/wellbeing", params={"email": EMAIL})
+    logs = first.json()
+    assert len(logs) == 30
+    assert logs == sorted(logs, key=lambda log: log["date"]) and logs[-1]["battery_level"] == 41 # Newest 30, oldest first
+
+    assert client.post("/api/wellbeing", json={"user_email": EMAIL, "battery_level": 80}).status_code == 200
+    created = client.get("/api/wellbeing", params={"email": EMAIL, "since": version(first)},
+                         headers={"If-None-Match": first.headers["etag"]})
+    assert [log["battery_level"] for log in created.json()] == [80]
+
+    # Today's log is updated in place: it comes back again with the new level
+    assert client.post("/api/wellbeing", json={"user_email": EMAIL, "battery_level": 20}).json()["status"] == "updated"
+    updated = client.get("/api/wellbeing", params={"email": EMAIL, "since": version(created)})
+    assert [(log["id"], log["battery_level"]) for log in updated.json()] == [(created.json()[0]["id"], 20)]
+
+    unchanged = client.get("/api/wellbeing", params={"email": EMAIL, "since": version(updated)},
+                           headers={"If-None-Match": updated.headers["etag"]})
+    assert unchanged.status_code == 304
+
+def test_delta_bigger_than_the_limit_sends_the_full_list(client):
+    Session = sessionmaker(bind=client.engine)
+    db = Session()
+    db.add(AnalysisHistory(user_email=EMAIL, module="message", input_text="Viejo", result_text="r"))
+    db.commit()
+    first = client.get("/api/history", params={"email": EMAIL})
+    start = datetime.utcnow()
+    db.add_all([AnalysisHistory(user_email=EMAIL, module="message", input_text=f"Nuevo {i}", result_text="r",
+                                timestamp=start + timedelta(seconds=i)) for i in range(routes.HISTORY_LIMIT + 5)])
+    db.commit()
+    db.close()
+
+    delta = client.get("/api/history", params={"email": EMAIL, "since": version(first)})
+    assert delta.headers["x-sync-full"] == "1"
+    items = delta.json()
+    assert len(items) == routes.HISTORY_LIMIT and items[0]["input_text"] == f"Nuevo {routes.HISTORY_LIMIT + 4}"
+    assert int(version(delta)) == max(item["id"] for item in items) # Nothing newer than the version was left out
+
+    small = client.get("/api/history", params={"email": EMAIL, "since": int(version(delta)) - 2})
+    assert len(small.json()) == 2 and "x-sync-full" not in small.headers
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import pytest
+from app.services import claude_client
+from app.services.feedback_drafts import FeedbackDrafts, transcript_after_turn
+
+def make_drafts(**overrides):
+    options = dict(enabled=True, debounce_seconds=0.01, max_upstream=8, concurrency=2,
+                   max_conversations=100, ttl_seconds=3600)
+    options.update(overrides)
+    return FeedbackDrafts(**options)
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+    async def fake_call_claude(system_prompt, user_prompt, **kwargs):
+        calls.append(user_prompt)
+        await asyncio.sleep(0.01)
+        return f"feedback #{len(calls)}"
+    monkeypatch.setattr(claude_client, "call_claude", fake_call_claude)
+    return calls
+
+def history(*turns):
+    return json.dumps([{"role": "system", "content": "Escenario: Cita Médica"}] +
+                      [{"role": role, "content": content} for role, content in turns])
+
+def test_transcript_matches_frontend_format():
+    text = transcript_after_turn(history(("assistant", "Hola, ¿qué te trae?"), ("user", "Me duele la cabeza")), "¿Desde cuándo?")
+    assert text == "IA: Hola, ¿qué te trae?\nTú: Me duele la cabeza\nIA: ¿Desde cuándo?"
+    assert transcript_after_turn("no es json", "x") is None
+
+def test_final_feedback_served_from_background_draft(calls):
+    async def scenario():
+        drafts = make_drafts()
+        drafts.record_turn("c1", history(), "Hola, ¿qué te trae?")
+        await asyncio.sleep(0.1)
+        turns = [("assistant", "Hola, ¿qué te trae?"), ("user", "Me duele la cabeza")]
+        drafts.record_turn("c1", history(*turns), "¿Desde cuándo?")
+        await asyncio.sleep(0.1)
+        assert len(calls) == 2
+        # The second update only carries the new turns
+        assert "Me duele la cabeza" in calls[1] and "Hola, ¿qué te trae?" not in calls[1].split("Turnos nuevos")[1]
+
+        transcript = "IA: Hola, ¿qué te trae?\nTú: Me duele la cabeza\nIA: ¿Desde cuándo?"
+        assert await drafts.finalize("c1", transcript) == "feedback #2"
+        assert len(calls) == 2
+        assert drafts.metrics["served_from_draft"] == 1
+    asyncio.run(scenario())
+
+def test_finalize_folds_in_turns_not_drafted_yet(calls):
+    async def scenario():
+        drafts = make_drafts(debounce_seconds=60) # Background updates never get to run
+        drafts.record_turn("c1", history(), "Hola")
+        assert await drafts.finalize("c1", "IA: Hola") is None # No draft yet: full analysis
+
+        drafts = make_drafts()
+        drafts.record_turn("c2", history(), "Hola")
+        await asyncio.sleep(0.1)
+        result = await drafts.finalize("c2", "IA: Hola\nTú: Adiós")
+        assert result == "feedback #2"
+        assert calls[1].endswith("--- Turnos nuevos ---\nTú: Adiós")
+        assert drafts.metrics["finalized"] == 1
+    asyncio.run(scenario())
+
+def test_waits_for_idle_upstream_capacity(calls, monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(claude_client, "upstream_inflight", 8)
+        drafts = make_drafts()
+        drafts.record_turn("c1", history(), "Hola")
+        await asyncio.sleep(0.1)
+        assert calls == []
+        monkeypatch.setattr(claude_client, "upstream_inflight", 0)
+        await asyncio.sleep(0.1)
+        assert len(calls) == 1
+        drafts.close()
+    asyncio.run(scenario())
+
+def test_unknown_conversation_and_eviction(calls):
+    async def scenario():
+        drafts = make_drafts(max_conversations=1)
+        assert await drafts.finalize(None, "IA: Hola") is None
+        assert await drafts.finalize("missing", "IA: Hola") is None
+        drafts.record_turn("c1", history(), "Hola")
+        drafts.record_turn("c2", history(), "Hola")
+        assert drafts.snapshot()["conversations"] == 1
+        drafts.close()
+    asyncio.run(scenario())
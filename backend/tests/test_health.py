@@ -0,0 +1,35 @@
+from fastapi.testclient import TestClient
+from app.main import app, health_monitor, settings
+
+client = TestClient(app)
+
+def test_healthz_is_static():
+    response = client.get("/healthz")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+    assert "set-cookie" not in response.headers
+
+def test_readyz_serves_cached_snapshot():
+    health_monitor.snapshot = {"ready": False, "checks": {}, "startup_errors": [], "updated_at": None}
+    assert client.get("/readyz").status_code == 503
+
+    snapshot = health_monitor.refresh()
+    assert snapshot["checks"]["database"] is True
+    assert snapshot["checks"]["frontend_index"] is True
+    response = client.get("/readyz")
+    assert response.json()["checks"] == snapshot["checks"]
+
+def test_readyz_keeps_details_behind_diagnostics_flag(monkeypatch):
+    health_monitor.snapshot = {
+        "ready": False, "checks": {"database": False},
+        "startup_errors": ["OperationalError: unable to open /srv/secret.db"],
+        "metrics": {"shared_state": {"path": "/srv/shared.db"}}, "updated_at": None
+    }
+    assert client.get("/readyz").json() == {"ready": False, "checks": {"database": False}}
+
+    monkeypatch.setattr(settings, "ENABLE_DIAGNOSTICS", True)
+    assert client.get("/readyz").json()["startup_errors"] == ["OperationalError: unable to open /srv/secret.db"]
+    health_monitor.refresh()
+
+def test_debug_system_requires_admin_flag():
+    assert client.get("/debug-system").status_code == 404
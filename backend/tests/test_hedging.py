@@ -0,0 +1,96 @@
+import asyncio
+from app.services import claude_client
+from app.services.hedging import Hedger
+from app.services.rate_limit import UpstreamRateLimiter
+from app.services.shared_state import MemorySharedState
+from tools.fake_anthropic import FakeAnthropic, fake_client
+
+def warmed_hedger(max_rate: float = 1.0) -> Hedger:
+    hedger = Hedger(enabled=True, percentile=0.95, min_samples=5, max_rate=max_rate)
+    for _ in range(20):
+        hedger.latencies.record("glossary", 0.05)
+    return hedger
+
+async def call_with(fake, hedger, monkeypatch):
+    monkeypatch.setattr(claude_client, "_client", fake_client(fake))
+    monkeypatch.setattr(claude_client, "hedger", hedger)
+    return await claude_client.call_claude("sys", "Explica: estar en las nubes", module="glossary")
+
+def test_slow_primary_is_hedged_and_cancelled(monkeypatch):
+    fake = FakeAnthropic(latency=lambda call: 5.0 if call == 1 else 0.01)
+    hedger = warmed_hedger()
+
+    result = asyncio.run(asyncio.wait_for(call_with(fake, hedger, monkeypatch), timeout=2))
+
+    assert "Respuesta simulada" in result
+    assert fake.calls == 2
+    assert fake.cancelled == 1
+    assert hedger.metrics["hedges_fired"] == 1
+    assert hedger.metrics["hedges_won"] == 1
+
+def test_fast_primary_is_not_hedged(monkeypatch):
+    fake = FakeAnthropic(latency=0.0)
+    hedger = warmed_hedger()
+    asyncio.run(call_with(fake, hedger, monkeypatch))
+    assert fake.calls == 1
+    assert hedger.metrics["hedges_fired"] == 0
+
+def test_hedge_rate_budget(monkeypatch):
+    fake = FakeAnthropic(latency=0.2)
+    hedger = warmed_hedger(max_rate=0.0)
+    hedger.metrics["calls"] = hedger.metrics["hedges_fired"] = 10
+    asyncio.run(call_with(fake, hedger, monkeypatch))
+    assert fake.calls == 1
+    assert hedger.metrics["hedges_skipped_budget"] == 1
+
+def test_hedge_goes_through_the_rate_limit_and_counts_in_flight(monkeypatch):
+    fake = FakeAnthropic(latency=0.2)
+    hedger = warmed_hedger()
+    monkeypatch.setattr(claude_client, "upstream_limiter", UpstreamRateLimiter(MemorySharedState(), 1, 5))
+    asyncio.run(call_with(fake, hedger, monkeypatch)) # The primary used the only call this minute
+    assert fake.calls == 1
+    assert hedger.metrics["hedges_skipped_limit"] == 1
+
+    peak = 0
+    async def watch():
+        nonlocal peak
+        while True:
+            peak = max(peak, claude_client.upstream_inflight)
+            await asyncio.sleep(0.005)
+
+    async def scenario():
+        monkeypatch.setattr(claude_client, "upstream_limiter", UpstreamRateLimiter(MemorySharedState(), 0, 5))
+        watcher = asyncio.ensure_future(watch())
+        await call_with(FakeAnthropic(latency=lambda call: 0.5 if call == 1 else 0.1), warmed_hedger(), monkeypatch)
+        watcher.cancel()
+
+    asyncio.run(scenario())
+    assert peak == 2 and claude_client.upstream_inflight == 0
+
+def test_latency_sample_is_the_primary_not_the_winner():
+    hedger = warmed_hedger()
+    calls = 0
+
+    async def primary_fails_after_the_hedge_fired():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await asyncio.sleep(0.08)
+            raise RuntimeError("primary failed")
+        await asyncio.sleep(0.1)
+        return "ok"
+
+    async def slow_primary():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.5 if calls == 1 else 0.01)
+        return "ok"
+
+    samples = hedger.latencies._samples["glossary"]
+    assert asyncio.run(hedger.run("glossary", primary_fails_after_the_hedge_fired)) == "ok"
+    assert hedger.metrics["hedges_won"] == 1 and len(samples) == 20 # No primary latency to learn from
+
+    calls = 0
+    asyncio.run(hedger.run("glossary", slow_primary))
+    assert hedger.metrics["hedges_won"] == 2
+    assert len(samples) == 21 and 0.05 <= samples[-1] < 0.5 # The primary's time so far, past the hedge delay
@@ -79,7 +79,14 @@ def test_premium_restriction(test_db):
     assert "Premium" in response.json()["detail"]
 
 def test_premium_access(test_db):
-    # Premium user (hardcoded in routes.py)
+    # Premium user (User.is_premium in the DB)
+    from app.services.entitlements import entitlements
+    db = TestingSessionLocal()
+    try:
+        entitlements.set_premium(db, "andrealan2003@gmail.com", True)
+    finally:
+        db.close()
+
     payload = {
         "text": "Roleplay test",
         "module": "roleplay",
@@ -100,3 +107,14 @@ def test_premium_access(test_db):
         assert response.status_code == 200
     finally:
         routes.call_claude = original_call_claude
+
+def test_premium_revocation_invalidates_cache(test_db):
+    from app.services.entitlements import entitlements
+    db = TestingSessionLocal()
+    try:
+        entitlements.set_premium(db, "revoked@example.com", True)
+        assert entitlements.is_premium("revoked@example.com", db)
+        entitlements.set_premium(db, "revoked@example.com", False)
+        assert not entitlements.is_premium("revoked@example.com", db)
+    finally:
+        db.close()
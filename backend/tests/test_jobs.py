@@ -0,0 +1,214 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.api import routes
+from app.models import db as db_module
+from app.models.db import AnalysisJob, init_db
+from app.models.schemas import TextRequest, AIResponse
+from app.services.jobs import IdempotencyKeyReused, JobRunner
+
+def make_runner(**overrides):
+    options = dict(concurrency=2, max_queued=100, stale_seconds=600, max_attempts=2, sweep_seconds=0.05, ttl_seconds=3600)
+    options.update(overrides)
+    return JobRunner(**options)
+
+def routine(text="Mañana tengo médico y compra"):
+    return TextRequest(module="routine", text=text, user_email="jobs@example.com")
+
+@pytest.fixture
+def Session(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    init_db(engine)
+    Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    monkeypatch.setattr(db_module, "SessionLocal", Session)
+    yield Session
+    engine.dispose()
+
+async def wait_for_status(runner, job_id, status, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while (job := await runner.get(job_id))["status"] != status:
+        assert asyncio.get_running_loop().time() < deadline, job
+        await runner.wait(job_id, timeout=0.05)
+    return job
+
+def test_job_runs_once_and_result_is_stored(Session):
+    calls = []
+    async def execute(request):
+        calls.append(request.text)
+        return AIResponse(result=f"Plan para: {request.text}")
+
+    async def scenario():
+        runner = make_runner()
+        runner.start(execute)
+        job = await runner.submit(routine(), idempotency_key="k1")
+        assert job["status"] == "queued"
+        # A client retrying after a dropped connection gets the same job
+        assert (await runner.submit(routine(), idempotency_key="k1"))["id"] == job["id"]
+        done = await wait_for_status(runner, job["id"], "done")
+        await runner.close()
+        return done
+
+    done = asyncio.run(scenario())
+    assert calls == ["Mañana tengo médico y compra"]
+    assert done["result"]["result"] == "Plan para: Mañana tengo médico y compra"
+    assert done["error"] is None and done["finished_at"]
+
+def test_idempotency_key_is_scoped_to_the_user_and_the_request(Session):
+    async def execute(request):
+        return AIResponse(result="ok")
+
+    async def scenario():
+        runner = make_runner()
+        runner.start(execute)
+        mine = await runner.submit(routine(), idempotency_key="k1")
+        theirs = await runner.submit(TextRequest(module="routine", text=routine().text, user_email="otro@example.com"),
+                                     idempotency_key="k1")
+        assert theirs["id"] != mine["id"] # Someone else's key never hands out this job
+        with pytest.raises(IdempotencyKeyReused):
+            await runner.submit(routine("Otra lista distinta"), idempotency_key="k1")
+        await runner.close()
+
+    asyncio.run(scenario())
+
+def test_http_errors_are_stored_on_the_job(Session):
+    async def execute(request):
+        raise HTTPException(status_code=403, detail="Esta función es exclusiva para usuarios Premium ⭐.")
+
+    async def scenario():
+        runner = make_runner()
+        runner.start(execute)
+        job = await runner.submit(routine())
+        failed = await wait_for_status(runner, job["id"], "error")
+        await runner.close()
+        return failed
+
+    failed = asyncio.run(scenario())
+    assert failed["error"] == {"status_code": 403, "detail": "Esta función es exclusiva para usuarios Premium ⭐."}
+
+def test_concurrency_is_bounded(Session):
+    running, peak = 0, 0
+    async def execute(request):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return AIResponse(result="ok")
+
+    async def scenario():
+        runner = make_runner(concurrency=2)
+        runner.start(execute)
+        jobs = [await runner.submit(routine(f"tarea {i}")) for i in range(6)]
+        for job in jobs:
+            await wait_for_status(runner, job["id"], "done")
+        await runner.close()
+
+    asyncio.run(scenario())
+    assert peak == 2
+
+def test_interrupted_job_is_resumed_by_the_next_worker(Session):
+    started = []
+    async def hang(request):
+        started.append(request.text)
+        await asyncio.sleep(60)
+
+    async def finish(request):
+        return AIResponse(result="terminado")
+
+    async def scenario():
+        first = make_runner()
+        first.start(hang)
+        job = await first.submit(routine())
+        await wait_for_status(first, job["id"], "running")
+        while not started:
+            await asyncio.sleep(0.01)
+        await first.close() # Worker shutting down mid-analysis
+
+        second = make_runner()
+        second.start(finish) # The startup sweep finds the job queued again
+        done = await wait_for_status(second, job["id"], "done")
+        await second.close()
+        return done
+
+    done = asyncio.run(scenario())
+    assert started and done["result"]["result"] == "terminado"
+
+def test_shutdown_during_claim_hands_the_job_back(Session):
+    async def execute(request):
+        return AIResponse(result="no debería ejecutarse")
+
+    async def scenario():
+        runner = make_runner(sweep_seconds=60)
+        claim = runner._claim
+        def slow_claim(job_id):
+            request = claim(job_id) # The row is 'running' from here on
+            time.sleep(0.2)
+            return request
+        runner._claim = slow_claim
+        runner.start(execute)
+        job = await runner.submit(routine())
+        await wait_for_status(runner, job["id"], "running")
+        await runner.close()
+        return job
+
+    job = asyncio.run(scenario())
+    db = Session()
+    assert db.get(AnalysisJob, job["id"]).status == "queued"
+    db.close()
+
+def test_sweep_requeues_stale_jobs_and_gives_up_after_max_attempts(Session):
+    db = Session()
+    old = datetime.utcnow() - timedelta(hours=1)
+    db.add_all([
+        AnalysisJob(id="stale", module="routine", request=routine().model_dump(), status="running", attempts=1, started_at=old),
+        AnalysisJob(id="hopeless", module="routine", request=routine().model_dump(), status="running", attempts=2, started_at=old),
+        AnalysisJob(id="expired", module="routine", status="done", created_at=datetime.utcnow() - timedelta(days=2)),
+    ])
+    db.commit()
+    db.close()
+
+    queued = make_runner().sweep()
+
+    db = Session()
+    assert queued == ["stale"]
+    assert db.get(AnalysisJob, "hopeless").status == "error"
+    assert db.get(AnalysisJob, "expired") is None
+    db.close()
+
+def test_jobs_api(Session, monkeypatch):
+    async def fake_call_claude(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return "Rutina estructurada"
+
+    monkeypatch.setattr(routes, "SessionLocal", Session)
+    monkeypatch.setattr(routes, "call_claude", fake_call_claude)
+    with TestClient(app) as client:
+        submitted = client.post("/api/jobs", json={"module": "routine", "text": "Lavar ropa, llamar al banco"},
+                                headers={"Idempotency-Key": "api-1"})
+        assert submitted.status_code == 202
+        job_id = submitted.json()["id"]
+        assert submitted.headers["location"] == f"/api/jobs/{job_id}"
+
+        with client.stream("GET", f"/api/jobs/{job_id}/events") as stream:
+            body = "".join(stream.iter_text())
+        events = [block.split("\n") for block in body.strip().split("\n\n")]
+        assert [e[0] for e in events][-1] == "event: result"
+        assert json.loads(events[-1][1][len("data: "):])["result"] == "Rutina estructurada"
+
+        polled = client.get(f"/api/jobs/{job_id}")
+        assert polled.json()["status"] == "done" and "retry-after" not in polled.headers
+        assert client.post("/api/jobs", json={"module": "routine", "text": "Lavar ropa, llamar al banco"},
+                           headers={"Idempotency-Key": "api-1"}).json()["id"] == job_id
+        reused = client.post("/api/jobs", json={"module": "routine", "text": "otra cosa"},
+                             headers={"Idempotency-Key": "api-1"})
+        assert reused.status_code == 422
+
+        assert client.get("/api/jobs/nope").status_code == 404
+        assert client.post("/api/jobs", json={"module": "nope", "text": "x"}).status_code == 400
@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api import routes
+from app.services import knowledge_base
+from app.services.knowledge_base import KnowledgeBase
+from tools.build_kb import IncompleteBuild, build_kb
+from tools.fake_anthropic import FakeAnthropic, fake_client
+
+@pytest.fixture
+def kb_path(tmp_path):
+    idioms = tmp_path / "idioms.txt"
+    idioms.write_text("# comentario\nmeter la pata\nMeter la pata.\ntomar el pelo\n", encoding="utf-8")
+    fake = FakeAnthropic(responder=lambda system, user: f"Explicación de: {user.splitlines()[-1]}")
+    out = tmp_path / "kb.sqlite"
+
+    written = asyncio.run(build_kb(idioms, out, fake_client(fake), "fake-model", version="kb-test"))
+
+    assert written == 4 # 2 unique idioms x (glossary, translator)
+    assert fake.calls == 4
+    return out
+
+def test_build_and_lookup(kb_path):
+    kb = KnowledgeBase.open(kb_path)
+    assert kb.version == "kb-test"
+    hit = kb.lookup("glossary", "¡Meter la PATA!")
+    assert hit.result_text == "Explicación de: meter la pata"
+    assert kb.lookup("translator", "Tomar el pelo.").version == "kb-test"
+    assert kb.lookup("message", "meter la pata") is None
+
+def test_analyze_serves_kb_answer_without_calling_claude(kb_path, monkeypatch):
+    async def fail(*args, **kwargs):
+        raise AssertionError("Claude should not be called")
+
+    monkeypatch.setattr(routes, "call_claude", fail)
+    monkeypatch.setattr(knowledge_base, "knowledge_base", KnowledgeBase.open(kb_path))
+
+    response = TestClient(app).post("/api/analyze", json={"text": "Tomar el pelo", "module": "translator"})
+    assert response.status_code == 200
+    assert response.json()["kb_version"] == "kb-test"
+
+def test_incomplete_build_keeps_the_previous_kb(kb_path, tmp_path):
+    idioms = tmp_path / "idioms.txt"
+    # Every translator call comes back empty: half of the answers are missing
+    fake = FakeAnthropic(responder=lambda system, user: "" if "traduc" in system.lower() else "Explicación")
+    with pytest.raises(IncompleteBuild):
+        asyncio.run(build_kb(idioms, kb_path, fake_client(fake), "fake-model", version="kb-partial"))
+    assert KnowledgeBase.open(kb_path).version == "kb-test"
+
+def test_deploy_ships_the_committed_kb_and_startup_tolerates_its_absence(tmp_path, monkeypatch, caplog):
+    from pathlib import Path
+    from app import main
+    render = (Path(__file__).resolve().parents[2] / "render.yaml").read_text()
+    assert "build_kb" not in render # No live Claude calls at build time
+
+    monkeypatch.setattr(main.settings, "KB_PATH", tmp_path / "missing.sqlite")
+    monkeypatch.setattr(knowledge_base, "knowledge_base", None)
+    with caplog.at_level("INFO"), TestClient(app):
+        pass
+    assert "No idiom knowledge base" in caplog.text
+    assert not [r for r in caplog.records if "knowledge base could not be loaded" in r.getMessage()]
@@ -0,0 +1,64 @@
+import io
+import json
+import logging
+import time
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils import logging_config
+from app.utils.logging_config import NonBlockingQueueHandler, SamplingFilter, request_id_var, setup_logging, stop_logging
+
+def read_records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+def test_json_records_carry_request_context(monkeypatch):
+    monkeypatch.setattr(logging_config.settings, "LOG_FORMAT", "json")
+    stream = io.StringIO()
+    setup_logging(stream=stream)
+    try:
+        token = request_id_var.set("req-1")
+        logging.getLogger("test").info("Claude call %s", "finished", extra={
+            "analysis_module": "glossary", "latency_ms": 12.5, "input_tokens": 100, "output_tokens": 20})
+        request_id_var.reset(token)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logging.getLogger("test").exception("Failed")
+    finally:
+        stop_logging()
+
+    first, second = read_records(stream)[-2:]
+    assert first["message"] == "Claude call finished"
+    assert first["request_id"] == "req-1"
+    assert first["analysis_module"] == "glossary" and first["input_tokens"] == 100
+    assert "request_id" not in second
+    assert "ValueError: boom" in second["exc_info"]
+
+def test_full_queue_drops_instead_of_blocking():
+    import queue
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=2))
+    logger = logging.getLogger("test.drop")
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        start = time.perf_counter()
+        for _ in range(5):
+            logger.warning("x")
+        assert time.perf_counter() - start < 0.1
+    finally:
+        logger.removeHandler(handler)
+        logger.propagate = True
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+def test_sampling_only_applies_to_marked_info_records():
+    sampler = SamplingFilter(rate=0.0)
+    record = lambda level, **extra: logging.makeLogRecord({"levelno": level, **extra})
+    assert not sampler.filter(record(logging.INFO, sample=True))
+    assert sampler.filter(record(logging.INFO))
+    assert sampler.filter(record(logging.ERROR, sample=True))
+
+def test_request_id_header():
+    with TestClient(app) as client:
+        response = client.get("/api/history", headers={"X-Request-ID": "abc123"})
+        assert response.headers["x-request-id"] == "abc123"
+        assert client.get("/healthz").headers["x-request-id"]
@@ -0,0 +1,37 @@
+from app.services.lookup_index import LookupIndex, normalize
+
+def test_normalize_folds_trivial_variation():
+    assert normalize("Está en las nubes.") == normalize("estar en las nubes")
+    assert normalize("  ¡Estar   EN las Nubes!  ") == normalize("estar en las nubes")
+
+def test_exact_and_near_duplicate_hits():
+    index = LookupIndex(threshold=0.8)
+    index.add("glossary", "estar en las nubes", "Estar distraído.")
+
+    exact = index.lookup("glossary", "Está en las nubes.")
+    assert exact.exact and exact.result_text == "Estar distraído."
+
+    similar = index.lookup("glossary", "estar en las nubes, en las nubes")
+    assert similar is not None and not similar.exact
+    assert similar.similarity >= 0.8
+
+    assert index.lookup("glossary", "meter la pata") is None
+    assert index.snapshot()["hit_rate"] == round(2 / 3, 3)
+
+def test_negated_or_changed_phrases_are_not_reused():
+    index = LookupIndex(threshold=0.5)
+    index.add("glossary", "estar en las nubes", "Estar distraído.")
+    index.add("translator", "no me importa nada lo que digan", "Le da igual la opinión de los demás.")
+    index.add("translator", "me cae muy bien tu hermano", "Le gusta tu hermano.")
+    assert index.lookup("glossary", "no estar en las nubes") is None
+    assert index.lookup("glossary", "estar en las nubes, ¿no?") is None
+    assert index.lookup("translator", "me importa nada lo que digan") is None
+    assert index.lookup("translator", "me cae muy mal tu hermano") is None
+
+def test_only_indexed_modules_are_answered():
+    index = LookupIndex(threshold=0.7)
+    index.add("message", "Hola", "Un saludo.")
+    index.add("translator", "Hola", "Un saludo.")
+    assert index.lookup("message", "Hola") is None
+    assert index.lookup("glossary", "Hola") is None
+    assert index.lookup("translator", "hola!").result_text == "Un saludo."
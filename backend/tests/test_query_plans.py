@@ -0,0 +1,213 @@
+"""
+Query-plan regression tests: every query the routes and services issue is
+captured on a seeded database and EXPLAINed; a full table scan fails the test.
+
+Runs on SQLite by default. Set TEST_DATABASE_URL to a throwaway Postgres
+database to check the same queries with Postgres' EXPLAIN.
+"""
+import json
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, inspect, insert, text
+from sqlalchemy.orm import sessionmaker
+
+from app.main import app
+from app.api import routes
+from app.models import db as db_module
+from app.models.db import (Base, AnalysisHistory, ServerSession, User, WellbeingLog, HEAD_REVISION,
+                           alembic_config, current_revision, get_db, init_db)
+from app.models.schemas import TextRequest
+from app.services.entitlements import EntitlementService
+from app.services.jobs import JobRunner
+from app.services.lookup_index import LookupIndex
+from app.services.session_store import DatabaseSessionStore
+
+USERS = 2000
+HISTORY_PER_USER = 10
+WELLBEING_PER_USER = 10
+MODULES = ["glossary", "translator", "message", "roleplay"]
+
+
+def seed(engine):
+    now = datetime.utcnow()
+    emails = [f"user{i}@example.com" for i in range(USERS)]
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"email": e, "is_premium": i % 100 == 0, "created_at": now} for i, e in enumerate(emails)])
+        conn.execute(insert(AnalysisHistory), [
+            {"user_email": e, "module": MODULES[j % len(MODULES)], "input_text": f"texto {i}-{j}",
+             "result_text": "respuesta", "timestamp": now - timedelta(hours=j), "meta_data": {}}
+            for i, e in enumerate(emails) for j in range(HISTORY_PER_USER)
+        ])
+        conn.execute(insert(WellbeingLog), [
+            {"user_email": e, "battery_level": 50, "date": now - timedelta(days=j)}
+            for e in emails for j in range(WELLBEING_PER_USER)
+        ])
+        conn.execute(insert(ServerSession), [
+            {"id": f"s{i}", "data": {}, "expires_at": now + timedelta(days=i % 3 - 1)} for i in range(USERS)
+        ])
+        conn.execute(text("ANALYZE")) # Planner statistics, as a long-running database would have
+
+
+@pytest.fixture(scope="module")
+def plan_engine(tmp_path_factory):
+    url = os.getenv("TEST_DATABASE_URL") or f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}"
+    engine = create_engine(url)
+    init_db(engine)
+    seed(engine)
+    yield engine
+    if os.getenv("TEST_DATABASE_URL"):
+        with engine.begin() as conn:
+            Base.metadata.drop_all(conn)
+            conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+    engine.dispose()
+
+
+@contextmanager
+def captured_queries(engine):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+def exercise_routes_and_services(engine, monkeypatch):
+    """Issues every query the app runs against its own tables."""
+    Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    def override_get_db():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    async def fake_call_claude(*args, **kwargs):
+        return "Respuesta simulada"
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    monkeypatch.setattr(routes, "call_claude", fake_call_claude)
+    monkeypatch.setattr(routes.entitlements, "_cache", {})
+    client = TestClient(app)
+    assert client.get("/api/history", params={"email": "user7@example.com"}).status_code == 200
+    assert client.get("/api/wellbeing", params={"email": "user7@example.com"}).status_code == 200
+    assert client.get("/api/history", params={"email": "user7@example.com", "since": 5}).status_code == 200
+    assert client.get("/api/wellbeing", params={"email": "user7@example.com", "since": 5}).status_code == 200
+    assert client.post("/api/wellbeing", json={"user_email": "user7@example.com", "battery_level": 80}).status_code == 200
+    assert client.post("/api/analyze", json={"module": "message", "text": "Hola, ¿qué tal?",
+                                             "user_email": "user8@example.com"}).status_code == 200
+
+    db = Session()
+    try:
+        service = EntitlementService(ttl_seconds=60, negative_ttl_seconds=60)
+        service.is_premium("user9@example.com", db)
+        service.preload(db)
+        service.set_premium(db, "user9@example.com", True)
+        LookupIndex(threshold=0.85).build(db, limit=500)
+        try:
+            routes.degraded_response(TextRequest(module="glossary", text="texto 3-0"), db, retry_after=1)
+        except HTTPException:
+            pass
+    finally:
+        db.close()
+
+    monkeypatch.setattr(db_module, "SessionLocal", Session)
+    store = DatabaseSessionStore(ttl_seconds=60)
+    store._save("s1", {"user": "x"})
+    store._load("s1")
+    store._delete("s2")
+    store.purge_expired()
+
+    runner = JobRunner(concurrency=1, max_queued=10, stale_seconds=600, max_attempts=2, sweep_seconds=30, ttl_seconds=3600)
+    job, _ = runner._create(TextRequest(module="routine", text="Comprar pan"), "plan-key")
+    runner._create(TextRequest(module="routine", text="Comprar pan"), "plan-key")
+    runner._claim(job.id)
+    runner._finish(job.id, {"result": "ok"}, None, None)
+    runner._get(job.id)
+    runner._release([job.id])
+    runner.sweep()
+
+
+def full_scans(conn, statement, parameters) -> list:
+    if conn.dialect.name == "sqlite":
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        # SEARCH = index lookup; SCAN <table> = reads every row (or every index entry)
+        return [row[-1] for row in rows if re.match(r"SCAN \w+", row[-1]) and "CONSTANT ROW" not in row[-1]]
+
+    # Postgres: with seq scans priced out, a Seq Scan in the plan means no usable index exists
+    conn.exec_driver_sql("SET enable_seqscan = off")
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    scans = []
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan":
+            scans.append(f"Seq Scan on {node['Relation Name']}")
+        nodes.extend(node.get("Plans", []))
+    return scans
+
+
+def test_no_query_does_a_full_table_scan(plan_engine, monkeypatch):
+    with captured_queries(plan_engine) as statements:
+        exercise_routes_and_services(plan_engine, monkeypatch)
+
+    queried = {re.search(r"FROM (\w+)", s).group(1) for s, _ in statements if "FROM" in s}
+    assert {"users", "history", "wellbeing_logs", "sessions", "jobs"} <= queried
+
+    offenders = []
+    with plan_engine.connect() as conn:
+        for statement, parameters in statements:
+            for scan in full_scans(conn, statement, parameters):
+                offenders.append(f"{scan}\n    {' '.join(statement.split())}")
+    assert not offenders, "Full table scans:\n" + "\n".join(offenders)
+
+
+def test_migrations_match_models(tmp_path):
+    assert ScriptDirectory.from_config(alembic_config()).get_current_head() == HEAD_REVISION
+
+    migrated = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    with migrated.begin() as conn:
+        command.upgrade(alembic_config(conn), "head")
+    with migrated.connect() as conn:
+        assert compare_metadata(MigrationContext.configure(conn), Base.metadata) == []
+
+    # A new database is built straight from the models and stamped at head
+    fresh = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    init_db(fresh)
+    assert current_revision(fresh) == HEAD_REVISION
+    with fresh.connect() as conn:
+        assert compare_metadata(MigrationContext.configure(conn), Base.metadata) == []
+
+
+def test_upgrade_from_create_all_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    # A database from before migrations: the old tables, no alembic_version
+    with engine.begin() as conn:
+        command.upgrade(alembic_config(conn), "0001")
+        conn.execute(text("DROP TABLE alembic_version"))
+        conn.execute(text("DROP TABLE sessions"))
+
+    init_db(engine)
+
+    inspector = inspect(engine)
+    assert "sessions" in inspector.get_table_names()
+    assert "ix_history_user_email_timestamp" in {i["name"] for i in inspector.get_indexes("history")}
+    assert "ix_wellbeing_logs_user_email_date" in {i["name"] for i in inspector.get_indexes("wellbeing_logs")}
+    assert "updated_at" in {c["name"] for c in inspector.get_columns("wellbeing_logs")}
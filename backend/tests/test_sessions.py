@@ -0,0 +1,131 @@
+import asyncio
+import os
+import runpy
+from datetime import datetime, timedelta
+from pathlib import Path
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import main
+from app.models import db as db_module
+from app.models.db import ServerSession, init_db
+from app.services.session_store import DatabaseSessionStore, MemorySessionStore, ServerSessionMiddleware, SessionStore
+
+def make_client(store):
+    app = FastAPI()
+    app.add_middleware(ServerSessionMiddleware, store=store)
+
+    @app.get("/login")
+    async def login(request: Request):
+        request.session["user"] = {"email": "test@example.com", "name": "Test"}
+        return {}
+
+    @app.get("/me")
+    async def me(request: Request):
+        return request.session.get("user")
+
+    @app.get("/logout")
+    async def logout(request: Request):
+        request.session.pop("user", None)
+        return {}
+
+    @app.get("/css/style.css")
+    async def css(request: Request):
+        return {"has_session": "session" in request.scope}
+
+    return TestClient(app)
+
+def test_cookie_only_carries_opaque_id():
+    store = MemorySessionStore(ttl_seconds=60)
+    client = make_client(store)
+
+    response = client.get("/login")
+    cookie = response.cookies["session"]
+    assert "example.com" not in response.headers["set-cookie"]
+    assert asyncio.run(store.load(cookie))["user"]["email"] == "test@example.com"
+
+    # Unchanged sessions don't resend the cookie
+    response = client.get("/me")
+    assert response.json()["email"] == "test@example.com"
+    assert "set-cookie" not in response.headers
+
+    client.get("/logout")
+    assert asyncio.run(store.load(cookie)) is None
+
+def test_static_routes_skip_sessions():
+    client = make_client(MemorySessionStore(ttl_seconds=60))
+    client.get("/login")
+    assert client.get("/css/style.css").json() == {"has_session": False}
+
+def test_unknown_session_id_is_ignored():
+    client = make_client(MemorySessionStore(ttl_seconds=60))
+    client.cookies.set("session", "forged-id")
+    assert client.get("/me").json() is None
+
+def test_session_id_changes_on_login():
+    store = MemorySessionStore(ttl_seconds=60)
+    client = make_client(store)
+    asyncio.run(store.save("planted-id", {"theme": "dark"})) # Id an attacker got issued before the victim logs in
+    client.cookies.set("session", "planted-id")
+
+    cookie = client.get("/login").cookies["session"]
+    assert cookie != "planted-id"
+    assert asyncio.run(store.load("planted-id")) is None
+    assert asyncio.run(store.load(cookie)) == {"theme": "dark", "user": {"email": "test@example.com", "name": "Test"}}
+
+def test_session_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+def test_memory_store_lru_and_ttl():
+    store = MemorySessionStore(ttl_seconds=60, max_entries=2)
+    asyncio.run(store.save("a", {"n": 1}))
+    asyncio.run(store.save("b", {"n": 2}))
+    asyncio.run(store.load("a"))  # "a" becomes most recently used
+    asyncio.run(store.save("c", {"n": 3}))
+    assert asyncio.run(store.load("b")) is None
+    assert asyncio.run(store.load("a")) == {"n": 1}
+
+    expired = MemorySessionStore(ttl_seconds=-1)
+    asyncio.run(expired.save("a", {"n": 1}))
+    assert asyncio.run(expired.load("a")) is None
+
+def test_multiple_gunicorn_workers_default_to_shared_sessions(monkeypatch):
+    environ = {k: v for k, v in os.environ.items() if k not in ("SESSION_BACKEND", "SHARED_STATE_BACKEND")}
+    monkeypatch.setattr(os, "environ", {**environ, "WEB_CONCURRENCY": "3"})
+    runpy.run_path(str(Path(__file__).resolve().parent.parent / "gunicorn_conf.py"))
+    assert os.environ["SESSION_BACKEND"] == "db" and os.environ["SHARED_STATE_BACKEND"] == "sqlite"
+
+def test_db_store_purges_expired_sessions_in_the_background(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sessions.db'}")
+    init_db(engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(db_module, "SessionLocal", Session)
+    db = Session()
+    db.add_all([
+        ServerSession(id="abandoned", data={}, expires_at=datetime.utcnow() - timedelta(days=1)),
+        ServerSession(id="active", data={}, expires_at=datetime.utcnow() + timedelta(days=1)),
+    ])
+    db.commit()
+
+    async def scenario():
+        task = asyncio.create_task(DatabaseSessionStore(ttl_seconds=60).run(interval=0.05))
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert [row.id for row in db.query(ServerSession).all()] == ["active"]
+    db.close()
+    engine.dispose()
+
+def test_lifespan_runs_session_housekeeping(monkeypatch):
+    intervals = []
+    class Store(MemorySessionStore):
+        async def run(self, interval):
+            intervals.append(interval)
+    monkeypatch.setattr(main, "session_store", Store(ttl_seconds=60))
+    with TestClient(main.app):
+        pass
+    assert intervals == [main.settings.SESSION_PURGE_SECONDS]
@@ -0,0 +1,167 @@
+import asyncio
+import multiprocessing
+import sqlite3
+import time
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.db import init_db
+from app.services.circuit_breaker import BreakerRegistry, CircuitOpenError
+from app.services.entitlements import EntitlementService
+from app.services.lookup_index import LookupIndex, normalize
+from app.services.rate_limit import RateLimitExceeded, UpstreamRateLimiter
+from app.services.shared_state import MemorySharedState, SharedState, SqliteSharedState, create_shared_state
+
+@pytest.fixture(params=["memory", "sqlite"])
+def state(request, tmp_path):
+    return create_shared_state(request.param, path=tmp_path / "shared.db")
+
+def eventually(check, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+def test_backends_implement_the_whole_interface():
+    with pytest.raises(TypeError):
+        SharedState()
+
+def test_get_set_ttl_and_delete(state):
+    assert state.get("a") is None
+    state.set("a", {"x": [1, "ñ"]})
+    state.set("short", 1, ttl=0.05)
+    assert state.get("a") == {"x": [1, "ñ"]} and state.get("short") == 1
+    time.sleep(0.06)
+    assert state.get("short") is None
+    state.delete("a")
+    assert state.get("a") is None
+    assert state.add("b", 1) and not state.add("b", 2) and state.get("b") == 1
+
+def test_incr_keeps_the_window_expiry(state):
+    assert state.incr("n", ttl=0.1) == 1
+    assert state.incr("n", 4, ttl=10) == 5 # Still the first window
+    time.sleep(0.11)
+    assert state.incr("n", ttl=10) == 1
+
+def test_compare_and_set(state):
+    assert state.compare_and_set("k", None, "v1")
+    assert not state.compare_and_set("k", None, "v2")
+    assert not state.compare_and_set("k", "nope", "v2")
+    assert state.compare_and_set("k", "v1", "v2") and state.get("k") == "v2"
+    state.set("gone", "old", ttl=0.01)
+    time.sleep(0.02)
+    assert state.compare_and_set("gone", None, "new") # Expired counts as missing
+
+def test_purge_expired(state):
+    state.set("old", 1, ttl=0.01)
+    state.set("kept", 1)
+    time.sleep(0.02)
+    assert state.purge_expired() == 1
+    assert state.snapshot()["keys"] == 1
+
+def _count_up(path, times):
+    state = SqliteSharedState(path)
+    for _ in range(times):
+        state.incr("hits")
+        while True:
+            current = state.get("cas")
+            if state.compare_and_set("cas", current, (current or 0) + 1):
+                break
+
+def test_sqlite_operations_are_atomic_across_processes(tmp_path):
+    path = tmp_path / "shared.db"
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_count_up, args=(path, 50)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+    state = SqliteSharedState(path)
+    assert state.get("hits") == 200 and state.get("cas") == 200
+
+def test_entitlement_change_reaches_other_workers(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    init_db(engine)
+    db = sessionmaker(bind=engine)()
+    path = tmp_path / "shared.db"
+    first = EntitlementService(300, 300, shared=SqliteSharedState(path))
+    second = EntitlementService(300, 300, shared=SqliteSharedState(path))
+
+    for service in (first, second):
+        service.preload(db)
+        eventually(lambda: service._generation_view.loaded)
+        service.is_premium("otro@example.com", db) # Takes the generation read as its baseline
+    assert not second.is_premium("ana@example.com", db) # Cached as non-premium for 5 minutes
+    first.set_premium(db, "ana@example.com", True) # Generation bumped in the background
+    eventually(lambda: first._generation == 1) # The worker that made the change keeps its cache
+    second._generation_view.max_age = 0
+    eventually(lambda: second.is_premium("ana@example.com", db))
+    db.close()
+    engine.dispose()
+
+def test_open_circuit_is_shared():
+    state = MemorySharedState()
+    first = BreakerRegistry(failure_threshold=2, recovery_timeout=30, shared=state).get("model")
+    second = BreakerRegistry(failure_threshold=2, recovery_timeout=30, shared=state).get("model")
+    first.before_call()
+    first.record_failure()
+    first.before_call()
+    first.record_failure()
+
+    with pytest.raises(CircuitOpenError) as error:
+        second.before_call() # Never saw a failure itself
+    assert 29 < error.value.retry_after <= 30 and second.state == "open"
+
+def test_rate_limit_and_backoff_hold_across_workers():
+    state = MemorySharedState()
+    workers = [UpstreamRateLimiter(state, max_per_minute=3, backoff_seconds=5) for _ in range(2)]
+    for worker in (0, 1, 0):
+        asyncio.run(workers[worker].acquire())
+    with pytest.raises(RateLimitExceeded) as error:
+        asyncio.run(workers[1].acquire())
+    assert 0 < error.value.retry_after <= 60
+
+    unlimited = [UpstreamRateLimiter(state, max_per_minute=0, backoff_seconds=5) for _ in range(2)]
+    unlimited[0].back_off(retry_after=20)
+    unlimited[1].back_off() # A shorter pause doesn't shorten the one already set
+    with pytest.raises(RateLimitExceeded) as error:
+        asyncio.run(unlimited[1].acquire())
+    assert error.value.retry_after > 19
+
+def test_locked_store_neither_blocks_the_loop_nor_the_call(tmp_path):
+    path = tmp_path / "shared.db"
+    state = SqliteSharedState(path, busy_timeout_ms=300)
+    state.set("warm", 1)
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE") # Another worker holding the write lock
+
+    async def scenario():
+        limiter = UpstreamRateLimiter(state, max_per_minute=10, backoff_seconds=5)
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        task = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        await limiter.acquire() # Fails open once the busy timeout runs out
+        elapsed = time.perf_counter() - start
+        task.cancel()
+        return ticks, elapsed
+
+    ticks, elapsed = asyncio.run(scenario())
+    holder.execute("ROLLBACK")
+    assert elapsed >= 0.25 and ticks >= 10 # The loop kept running while the thread waited
+
+def test_lookup_answers_are_shared():
+    state = MemorySharedState()
+    first = LookupIndex(threshold=0.8, shared=state, shared_ttl=60)
+    second = LookupIndex(threshold=0.8, shared=state, shared_ttl=60)
+    first.add("glossary", "meter la pata", "Equivocarse.")
+    assert second.lookup("glossary", "Meter la pata") is None # Local index only
+    hit = asyncio.run(second.lookup_shared("glossary", "Meter la pata"))
+    assert hit.exact and hit.result_text == "Equivocarse."
+    assert second.snapshot()["shared_hits"] == 1
+    assert normalize("meter la pata") in second.modules["glossary"].entries # Now answered locally
@@ -0,0 +1,102 @@
+import multiprocessing
+import threading
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app.models.db import AnalysisHistory, RoutingSession, User, create_engines, current_revision, init_db, HEAD_REVISION
+
+@pytest.fixture
+def engines(tmp_path):
+    writer, reader = create_engines(f"sqlite:///{tmp_path / 'wal.db'}")
+    init_db(writer)
+    yield writer, reader
+    writer.dispose()
+    reader.dispose()
+
+def pragma(conn, name):
+    return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+def test_pragmas(engines):
+    writer, reader = engines
+    with writer.connect() as conn:
+        assert pragma(conn, "journal_mode") == "wal"
+        assert pragma(conn, "synchronous") == 1 # NORMAL
+        assert pragma(conn, "busy_timeout") == 5000
+        assert pragma(conn, "temp_store") == 2 # MEMORY
+        assert pragma(conn, "query_only") == 0
+    with reader.connect() as conn:
+        assert pragma(conn, "query_only") == 1
+        with pytest.raises(OperationalError):
+            conn.execute(text("INSERT INTO users (email) VALUES ('x@example.com')"))
+    assert writer.pool.size() == 1
+
+def test_writes_go_to_the_writer_reads_to_the_pool(engines):
+    writer, reader = engines
+    used = []
+    event.listen(writer, "before_cursor_execute", lambda *a, **k: used.append(("writer", a[2].split()[0])))
+    event.listen(reader, "before_cursor_execute", lambda *a, **k: used.append(("reader", a[2].split()[0])))
+    Session = sessionmaker(class_=RoutingSession, writer=writer, reader=reader)
+
+    db = Session()
+    db.add(User(email="a@example.com"))
+    db.commit()
+    assert db.query(User).filter(User.email == "a@example.com").one().email == "a@example.com"
+    db.query(User).filter(User.email == "a@example.com").delete()
+    db.commit()
+    db.close()
+
+    assert ("writer", "INSERT") in used and ("writer", "DELETE") in used
+    assert ("reader", "SELECT") in used
+    assert not any(engine == "reader" and verb not in ("SELECT", "BEGIN") for engine, verb in used)
+
+def test_concurrent_reads_and_writes_do_not_lock(engines):
+    writer, reader = engines
+    Session = sessionmaker(class_=RoutingSession, writer=writer, reader=reader)
+    errors = []
+
+    def work(n):
+        try:
+            for i in range(30):
+                db = Session()
+                try:
+                    if i % 3 == 0:
+                        db.add(AnalysisHistory(user_email=f"u{n}@example.com", module="message",
+                                               input_text="hola", result_text="respuesta"))
+                        db.commit()
+                    else:
+                        db.query(AnalysisHistory).filter(AnalysisHistory.user_email == f"u{n}@example.com").all()
+                finally:
+                    db.close()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    with reader.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM history")).scalar() == 12 * 10
+
+def _start_worker(url, barrier):
+    writer, reader = create_engines(url)
+    barrier.wait() # All workers bootstrap at the same moment, like gunicorn
+    init_db(writer)
+
+def test_workers_starting_together_bootstrap_once(tmp_path):
+    context = multiprocessing.get_context("fork")
+    for run in range(3):
+        url = f"sqlite:///{tmp_path / f'race-{run}.db'}"
+        barrier = context.Barrier(4)
+        workers = [context.Process(target=_start_worker, args=(url, barrier)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+        assert [worker.exitcode for worker in workers] == [0, 0, 0, 0]
+        writer, reader = create_engines(url)
+        assert current_revision(writer) == HEAD_REVISION
+        writer.dispose()
+        reader.dispose()
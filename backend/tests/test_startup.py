@@ -0,0 +1,64 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Budgets are generous enough for slow CI machines; production target is sub-second.
+IMPORT_BUDGET_S = float(os.getenv("STARTUP_IMPORT_BUDGET_S", "1.5"))
+READY_BUDGET_S = float(os.getenv("STARTUP_READY_BUDGET_S", "3.0"))
+
+def import_times() -> dict:
+    """Runs `python -X importtime -c 'import app.main'` and returns cumulative µs per module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit():
+            times[module.strip()] = int(cumulative)
+    return times
+
+def test_heavy_sdks_are_not_imported_at_startup():
+    times = import_times()
+    assert "anthropic" not in times
+    assert "authlib" not in times
+
+def test_import_time_budget():
+    times = import_times()
+    assert times["app.main"] / 1_000_000 < IMPORT_BUDGET_S
+
+def test_time_to_first_200(tmp_path):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path / 'startup.db'}"}
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        elapsed = None
+        while time.perf_counter() - start < READY_BUDGET_S * 3:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/").status_code == 200:
+                    elapsed = time.perf_counter() - start
+                    break
+            except httpx.TransportError:
+                time.sleep(0.02)
+        assert elapsed is not None, "Server never answered"
+        assert elapsed < READY_BUDGET_S
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
@@ -0,0 +1,68 @@
+import json
+import pytest
+from app.config import settings
+from app.services.prompt_router import get_prompts
+from app.models.enums import AnalysisModule
+from app.services.token_budget import MODULE_OUTPUT_TOKENS, fit_to_budget, estimate_tokens
+
+@pytest.fixture
+def small_context(monkeypatch):
+    monkeypatch.setattr(settings, "CONTEXT_TOKEN_TARGET", 4000)
+
+def test_short_prompt_is_untouched():
+    system, user = get_prompts("message", "Hola")
+    budgeted = fit_to_budget("message", "Hola", system, user)
+    assert budgeted.user_prompt == user
+    assert budgeted.trimmed_turns == 0
+    assert budgeted.estimated_input_tokens == estimate_tokens(system) + estimate_tokens(user) + 8
+
+def test_long_roleplay_drops_oldest_turns(small_context):
+    history = [{"role": "system", "content": "Escenario: entrevista"}]
+    for i in range(200):
+        history.append({"role": "user" if i % 2 == 0 else "assistant", "content": f"Turno {i} " + "bla " * 30})
+    text = json.dumps(history)
+    system, user = get_prompts("roleplay", text)
+
+    budgeted = fit_to_budget("roleplay", text, system, user)
+
+    assert budgeted.trimmed_turns > 0
+    assert budgeted.estimated_input_tokens <= settings.CONTEXT_TOKEN_TARGET - budgeted.max_tokens
+    kept = json.loads(budgeted.user_prompt[len("Historial de conversación:\n\n"):])
+    assert kept[0]["content"] == "Escenario: entrevista"
+    assert "omitidos" in kept[1]["content"]
+    assert kept[-1]["content"].startswith("Turno 199")
+
+def test_long_feedback_transcript_is_trimmed(small_context):
+    text = "\n".join(f"Tú: mensaje {i} " + "bla " * 30 for i in range(200))
+    system, user = get_prompts("roleplay_feedback", text)
+    budgeted = fit_to_budget("roleplay_feedback", text, system, user)
+    assert "turnos anteriores omitidos" in budgeted.user_prompt
+    assert budgeted.user_prompt.endswith(text.split("\n")[-1])
+
+def test_oversized_non_conversation_fails_fast(small_context):
+    text = "palabra " * 20000
+    system, user = get_prompts("message", text)
+    with pytest.raises(ValueError, match="demasiado largo"):
+        fit_to_budget("message", text, system, user)
+
+def test_output_budget_follows_the_module(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.api import routes
+    from app.main import app
+    sent = {}
+    async def fake_call_claude(system_prompt, user_prompt, max_tokens=1024, **kwargs):
+        sent[kwargs["module"]] = max_tokens
+        return "ok"
+    monkeypatch.setattr(routes, "call_claude", fake_call_claude)
+    monkeypatch.setattr(settings, "LOOKUP_INDEX_ENABLED", False)
+    client = TestClient(app)
+    for module, text in [("roleplay", json.dumps([{"role": "user", "content": "Hola"}])),
+                         ("glossary", "pez fuera del agua"), ("routine", "Trabajo y compra")]:
+        assert client.post("/api/analyze", json={"module": module, "text": text}).status_code == 200
+    assert sent["roleplay"] < sent["glossary"] < sent["routine"]
+    assert sent["routine"] > 1024 # A full table no longer gets cut at the old flat limit
+
+    ending = json.dumps([{"role": "user", "content": "Hola"}, {"role": "assistant", "content": "¿Qué tal?"},
+                         {"role": "user", "content": "FINALIZAR_SESION"}])
+    assert client.post("/api/analyze", json={"module": "roleplay", "text": ending}).status_code == 200
+    assert sent["roleplay"] == MODULE_OUTPUT_TOKENS[AnalysisModule.ROLEPLAY_FEEDBACK] # Feedback mode isn't cut off
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services import claude_client
+from app.services.traffic_capture import traffic_capture
+from tools.fake_anthropic import FakeAnthropic, fake_client
+from tools.replay_traffic import ReplayPlan, build_request, load_records, replay, saturation_reasons
+
+@pytest.fixture
+def capture(tmp_path, monkeypatch):
+    monkeypatch.setattr(traffic_capture, "enabled", True)
+    monkeypatch.setattr(traffic_capture, "path", tmp_path / "capture.jsonl")
+    traffic_capture.start()
+    yield traffic_capture
+    traffic_capture.stop()
+
+def captured(capture) -> list:
+    capture.stop() # Flushes the listener
+    return load_records([capture.file])
+
+def test_captures_anonymized_shapes_with_upstream_usage(capture, monkeypatch):
+    monkeypatch.setattr(claude_client, "_client", fake_client(FakeAnthropic(latency=0.01, usage=(120, 40))))
+    client = TestClient(app)
+    secret = "Mi jefe me dijo 'ya hablaremos' y no sé qué significa"
+    assert client.post("/api/analyze", json={"module": "message", "text": secret,
+                                             "user_profile": {"name": "Andrea"}}).status_code == 200
+    client.post("/api/analyze", json={"module": "nope", "text": "x"})
+    client.get("/healthz")
+
+    records = captured(capture)
+    raw = capture.file.read_text()
+    assert "jefe" not in raw and "Andrea" not in raw
+    analyze = [r for r in records if r["path"] == "/api/analyze"]
+    assert len(records) == 2 and len(analyze) == 2 # /healthz is not captured
+    assert analyze[0]["module"] == "message" and analyze[0]["chars"] == len(secret)
+    assert analyze[0]["flags"] == ["profile"] and analyze[0]["status"] == 200
+    assert [call[:2] for call in analyze[0]["up"]] == [[120, 40]]
+    assert analyze[1]["status"] == 400 and "up" not in analyze[1]
+
+def test_roleplay_turns_and_flags():
+    request = build_request({"method": "POST", "path": "/api/analyze", "module": "roleplay", "chars": 3000, "turns": 7,
+                             "flags": ["user", "scenario", "premium", "conversation"]}, run=0, index=3)
+    body = request["json"]
+    turns = json.loads(body["text"])
+    assert len(turns) == 7 and abs(len(body["text"]) - 3000) < 50
+    assert body["user_email"] == "replay-premium@example.com" and body["scenario_context"]["is_premium"] is True
+    assert all("[[replay 0 3]]" in turn["content"] for turn in turns[1:])
+    assert build_request({"method": "GET", "path": "/api/jobs/{id}"}, 0, 0) is None
+
+def test_replay_plan_reproduces_recorded_calls():
+    records = [
+        {"ts": 1.0, "method": "POST", "path": "/api/analyze", "module": "message", "chars": 100, "up": [[900, 300, 2500.0]]},
+        {"ts": 2.0, "method": "POST", "path": "/api/analyze", "module": "message", "chars": 50},
+    ]
+    plan = ReplayPlan(records)
+    assert plan("sys", "... [[replay 0 0]] ...") == (2.5, 900, 300)
+    assert plan("sys", "[[replay 0 1]]") == (2.5, 900, 300) # No recorded call: sampled from the module
+    assert plan("sys", "sin marcador") is None
+
+def test_replay_drives_the_app_with_recorded_latencies(monkeypatch):
+    records = [{"ts": 100 + i * 0.5, "method": "POST", "path": "/api/analyze", "module": "message", "chars": 200,
+                "up": [[500, 200, 50.0]], "status": 200} for i in range(6)]
+    fake = FakeAnthropic(plan=ReplayPlan(records))
+    monkeypatch.setattr(claude_client, "_client", fake_client(fake))
+    monkeypatch.setattr("app.api.routes.settings.LOOKUP_INDEX_ENABLED", False)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+            return await replay(client, records, speed=10, run=0)
+
+    summary = asyncio.run(scenario())
+    assert fake.calls == 6
+    assert summary["requests"] == 6 and summary["errors"] == 0 and summary["shed"] == 0
+    assert summary["p50_ms"] >= 50 # The recorded upstream latency is reproduced
+    assert saturation_reasons(summary, summary) == []
+    assert "p95" in saturation_reasons({**summary, "p95_ms": summary["p95_ms"] * 3}, summary)[0]
@@ -0,0 +1,261 @@
+"""
+Builds the production frontend into frontend/dist.
+
+    python backend/tools/build_assets.py
+
+- Scans index.html and js/app_v8.js for the data-lucide icons actually used and
+  emits a small icons.<hash>.js with only those icons. It keeps the same
+  `lucide.createIcons()` API, so the app code doesn't change. This replaces
+  both lucide.min.js (the full icon set) and the unpkg copy.
+- Moves the inline <script> blocks into minified, content-hashed files that
+  browsers can cache forever.
+- Copies only what index.html references. Stale bundles (app_v6.js,
+  app_v7.js, debug scripts...) never end up in dist, so the server no longer
+  exposes them.
+
+The server serves frontend/dist when it exists (see config.frontend_dir).
+"""
+import hashlib
+import json
+import re
+import shutil
+import sys
+from pathlib import Path
+
+FRONTEND_DIR = Path(__file__).resolve().parent.parent.parent / "frontend"
+DIST_DIR = FRONTEND_DIR / "dist"
+
+ICON_SOURCES = ["index.html", "js/app_v8.js"]
+LUCIDE_BUNDLE = "js/lucide.min.js"
+
+_ICON_ATTR = re.compile(r"""data-lucide=["']([a-z0-9-]+)["']""")
+_INLINE_SCRIPT = re.compile(r"<script(?P<attrs>(?:(?!\bsrc=)[^>])*)>(?P<body>.*?)</script>", re.DOTALL | re.IGNORECASE)
+_LUCIDE_TAGS = re.compile(r'\s*<script src="(?:/js/lucide\.min\.js|https://unpkg\.com/lucide@[^"]*)"></script>')
+_STYLESHEET = re.compile(r'href="/css/([\w.-]+\.css)"')
+
+
+def content_hash(data: str) -> str:
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:8]
+
+
+def pascal_case(name: str) -> str:
+    return "".join(part[:1].upper() + part[1:] for part in name.split("-"))
+
+
+# --- Icons ---
+
+def find_icons(frontend: Path) -> list[str]:
+    icons = set()
+    for source in ICON_SOURCES:
+        path = frontend / source
+        if path.exists():
+            icons.update(_ICON_ATTR.findall(path.read_text(encoding="utf-8-sig")))
+    return sorted(icons)
+
+
+def _matching_bracket(source: str, start: int) -> int:
+    """Index just past the ']' closing the '[' at `start` (string-aware)."""
+    depth, i, quote = 0, start, None
+    while i < len(source):
+        c = source[i]
+        if quote:
+            if c == "\\":
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in "\"'":
+            quote = c
+        elif c == "[":
+            depth += 1
+        elif c == "]":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    raise ValueError("Unbalanced icon definition")
+
+
+def extract_icon_nodes(lucide_source: str, name: str) -> list:
+    """Pulls one icon's node list (e.g. [["path",{d:"..."}]]) out of the minified UMD bundle."""
+    alias = re.search(rf"[{{,]{pascal_case(name)}:([\w$]+)[,}}]", lucide_source)
+    if not alias:
+        raise KeyError(f"Icon '{name}' not found in {LUCIDE_BUNDLE}")
+    definition = re.search(rf"[,;\s]{re.escape(alias.group(1))}=\[\[", lucide_source)
+    start = definition.end() - 2
+    literal = lucide_source[start:_matching_bracket(lucide_source, start)]
+    # JS object keys are unquoted in the minified source
+    return json.loads(re.sub(r'([{,])([A-Za-z_][\w-]*):', r'\1"\2":', literal))
+
+
+ICONS_RUNTIME = """/* Lucide icons subset (ISC license), generated by backend/tools/build_assets.py */
+(function(){var I=%s;
+var D={xmlns:"http://www.w3.org/2000/svg",width:24,height:24,viewBox:"0 0 24 24",fill:"none",stroke:"currentColor","stroke-width":2,"stroke-linecap":"round","stroke-linejoin":"round"};
+function el(t,a){var e=document.createElementNS(D.xmlns,t);for(var k in a)e.setAttribute(k,a[k]);return e}
+function createIcons(o){var r=(o&&o.root)||document;r.querySelectorAll("[data-lucide]").forEach(function(n){var name=n.getAttribute("data-lucide"),nodes=I[name];if(!nodes)return;var s=el("svg",D);
+for(var i=0;i<n.attributes.length;i++){var at=n.attributes[i];if(at.name!=="class")s.setAttribute(at.name,at.value)}
+s.setAttribute("class",("lucide lucide-"+name+" "+(n.getAttribute("class")||"")).trim());
+nodes.forEach(function(c){s.appendChild(el(c[0],c[1]))});n.parentNode.replaceChild(s,n)})}
+window.lucide={createIcons:createIcons,icons:I}})();
+"""
+
+
+def build_icons_bundle(frontend: Path) -> str:
+    lucide_source = (frontend / LUCIDE_BUNDLE).read_text(encoding="utf-8")
+    icons = {name: extract_icon_nodes(lucide_source, name) for name in find_icons(frontend)}
+    return ICONS_RUNTIME % json.dumps(icons, separators=(",", ":"))
+
+
+# --- Script minification ---
+
+_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^") | {""}
+
+
+def minify_js(source: str) -> str:
+    """
+    Conservative minifier: drops comments, indentation and blank lines, but
+    keeps line breaks (no ASI surprises) and never touches string, template
+    or regex literals.
+    """
+    out = []
+    i, n = 0, len(source)
+    last_significant = ""
+    at_line_start = True
+    while i < n:
+        c = source[i]
+        nxt = source[i + 1] if i + 1 < n else ""
+
+        if c == "\n":
+            while out and out[-1] in " \t":
+                out.pop()
+            if out and out[-1] != "\n":
+                out.append("\n")
+            at_line_start = True
+            i += 1
+            continue
+        if c in " \t\r":
+            if not at_line_start and out and out[-1] not in " \n":
+                out.append(" ")
+            i += 1
+            continue
+
+        if c == "/" and nxt == "/":
+            while i < n and source[i] != "\n":
+                i += 1
+            continue
+        if c == "/" and nxt == "*":
+            end = source.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            continue
+
+        at_line_start = False
+        if c in "\"'`" or (c == "/" and last_significant in _REGEX_PRECEDERS):
+            # Copy the literal verbatim
+            start = i
+            i += 1
+            in_class = False
+            while i < n:
+                ch = source[i]
+                if ch == "\\":
+                    i += 2
+                    continue
+                if c == "/":
+                    if ch == "[":
+                        in_class = True
+                    elif ch == "]":
+                        in_class = False
+                    elif ch == "/" and not in_class:
+                        break
+                elif ch == c:
+                    break
+                i += 1
+            i += 1
+            if c == "/":
+                while i < n and source[i].isalpha(): # Regex flags
+                    i += 1
+            out.append(source[start:i])
+            last_significant = "a"
+            continue
+
+        out.append(c)
+        if c.isalnum() or c in "_$":
+            # Keywords after which a '/' starts a regex
+            word_start = i
+            while i + 1 < n and (source[i + 1].isalnum() or source[i + 1] in "_$"):
+                i += 1
+                out.append(source[i])
+            word = source[word_start:i + 1]
+            last_significant = "" if word in ("return", "typeof", "case", "do", "else") else "a"
+        else:
+            last_significant = c
+        i += 1
+    return "".join(out).strip() + "\n"
+
+
+# --- Build ---
+
+def write_hashed(dist: Path, folder: str, stem: str, ext: str, content: str) -> str:
+    name = f"{stem}.{content_hash(content)}.{ext}"
+    (dist / folder).mkdir(parents=True, exist_ok=True)
+    (dist / folder / name).write_text(content, encoding="utf-8")
+    return f"/{folder}/{name}"
+
+
+def build(frontend: Path = FRONTEND_DIR, dist: Path = DIST_DIR) -> dict:
+    html = (frontend / "index.html").read_text(encoding="utf-8-sig")
+    before = len(html.encode("utf-8")) + (frontend / LUCIDE_BUNDLE).stat().st_size
+
+    if dist.exists():
+        shutil.rmtree(dist)
+    dist.mkdir(parents=True)
+    written = {}
+
+    icons_url = write_hashed(dist, "js", "icons", "js", build_icons_bundle(frontend))
+    written[icons_url] = (dist / icons_url.lstrip("/")).stat().st_size
+    # One icons bundle where the local lucide.min.js was; drop the unpkg duplicate
+    first = True
+    def replace_lucide(match):
+        nonlocal first
+        if first:
+            first = False
+            return match.group(0).split("<script")[0] + f'<script src="{icons_url}"></script>'
+        return ""
+    html = _LUCIDE_TAGS.sub(replace_lucide, html)
+
+    counter = 0
+    def extract(match):
+        nonlocal counter
+        body = match.group("body")
+        if not body.strip():
+            return match.group(0)
+        counter += 1
+        url = write_hashed(dist, "js", f"inline{counter}", "js", minify_js(body))
+        written[url] = (dist / url.lstrip("/")).stat().st_size
+        return f'<script src="{url}"{match.group("attrs")}></script>'
+    html = _INLINE_SCRIPT.sub(extract, html)
+
+    def copy_css(match):
+        css = (frontend / "css" / match.group(1)).read_text(encoding="utf-8")
+        url = write_hashed(dist, "css", Path(match.group(1)).stem, "css", css)
+        written[url] = len(css.encode("utf-8"))
+        return f'href="{url}"'
+    html = _STYLESHEET.sub(copy_css, html)
+
+    if (frontend / "assets").is_dir():
+        shutil.copytree(frontend / "assets", dist / "assets")
+
+    (dist / "index.html").write_text(html, encoding="utf-8")
+    written["/index.html"] = len(html.encode("utf-8"))
+    return {"before_bytes": before, "files": written}
+
+
+def main():
+    report = build()
+    for url, size in sorted(report["files"].items()):
+        print(f"{size / 1024:8.1f} KB  {url}")
+    js_after = sum(size for url, size in report["files"].items() if url.endswith(".js"))
+    print(f"index.html + lucide.min.js before: {report['before_bytes'] / 1024:.1f} KB "
+          f"(plus lucide@latest from unpkg); JS after: {js_after / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Precomputes glossary/translator answers for a curated idiom list.
+
+    cd backend
+    python -m tools.build_kb --idioms kb/idioms.txt --out kb/idioms_kb.sqlite
+
+Uses the same prompts as /api/analyze (metaphor_glossary.txt, translator.txt)
+and CLAUDE_API_KEY / CLAUDE_MODEL / ANTHROPIC_BASE_URL from the settings, so
+it can be pointed at tools/fake_anthropic.py for a dry run. The output is a
+read-only SQLite file loaded by app.services.knowledge_base.
+
+Run it offline and commit kb/idioms_kb.sqlite: deploys ship that file and
+never call Claude at build time. A run that gets fewer answers than
+--min-coverage of the expected ones exits with status 1 and leaves the
+existing KB untouched.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from app.config import settings, BACKEND_ROOT
+from app.models.enums import AnalysisModule
+from app.services.knowledge_base import SCHEMA
+from app.services.lookup_index import normalize
+from app.services.prompt_router import get_prompts
+
+logger = logging.getLogger("build_kb")
+
+DEFAULT_MODULES = [AnalysisModule.GLOSSARY.value, AnalysisModule.TRANSLATOR.value]
+
+
+class IncompleteBuild(Exception):
+    """Too many answers failed; the KB was not written."""
+
+
+def read_idioms(path: Path) -> list[str]:
+    idioms = []
+    seen = set()
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        key = normalize(line)
+        if key not in seen:
+            seen.add(key)
+            idioms.append(line)
+    return idioms
+
+
+async def generate(client, model: str, modules: list[str], idioms: list[str], concurrency: int) -> list[tuple]:
+    """Returns (module, key, idiom, answer) rows. Failed items are logged and skipped."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(module: str, idiom: str):
+        system_prompt, user_prompt = get_prompts(module, idiom)
+        async with semaphore:
+            try:
+                message = await client.messages.create(
+                    model=model,
+                    max_tokens=1024,
+                    system=system_prompt,
+                    messages=[{"role": "user", "content": user_prompt}]
+                )
+            except Exception as e:
+                logger.error("Failed %s '%s': %s", module, idiom, e)
+                return None
+        text = message.content[0].text if message.content else ""
+        return (module, normalize(idiom), idiom, text) if text else None
+
+    results = await asyncio.gather(*(one(m, i) for m in modules for i in idioms))
+    return [r for r in results if r]
+
+
+def write_kb(out: Path, rows: list[tuple], version: str, model: str) -> None:
+    """Writes to a temp file and renames it, so readers never see a half-built KB."""
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(".tmp")
+    tmp.unlink(missing_ok=True)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(SCHEMA)
+        conn.executemany("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?)", rows)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("version", version),
+            ("model", model),
+            ("created_at", datetime.utcnow().isoformat()),
+        ])
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp, out)
+
+
+async def build_kb(idioms_path: Path, out: Path, client, model: str, modules: list[str] = DEFAULT_MODULES,
+                   concurrency: int = 8, version: str | None = None, min_coverage: float = 1.0) -> int:
+    idioms = read_idioms(idioms_path)
+    rows = await generate(client, model, modules, idioms, concurrency)
+    expected = len(idioms) * len(modules)
+    if len(rows) < expected * min_coverage:
+        raise IncompleteBuild(f"Only {len(rows)} of {expected} answers were generated; {out} left as it was")
+    version = version or datetime.utcnow().strftime("kb-%Y%m%d%H%M")
+    write_kb(out, rows, version, model)
+    logger.info("Wrote %d answers (%d idioms x %d modules) to %s as %s", len(rows), len(idioms), len(modules), out, version)
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the idiom knowledge base")
+    parser.add_argument("--idioms", type=Path, default=BACKEND_ROOT / "kb" / "idioms.txt")
+    parser.add_argument("--out", type=Path, default=settings.KB_PATH)
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, choices=DEFAULT_MODULES)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--version", default=None)
+    parser.add_argument("--min-coverage", type=float, default=1.0,
+                        help="Fraction of idiom x module answers required to write the KB")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    from app.services.claude_client import get_client
+    try:
+        asyncio.run(build_kb(args.idioms, args.out, get_client(), settings.CLAUDE_MODEL,
+                             args.modules, args.concurrency, args.version, args.min_coverage))
+    except IncompleteBuild as e:
+        logger.error("%s", e)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
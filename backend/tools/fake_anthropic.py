@@ -0,0 +1,146 @@
+"""
+Local stand-in for the Anthropic Messages API, for tests and benchmarks.
+
+    python -m tools.fake_anthropic --port 9999 --latency 0.8
+    python -m tools.fake_anthropic --port 9999 --replay traffic/capture-*.jsonl*
+    ANTHROPIC_BASE_URL=http://127.0.0.1:9999 CLAUDE_API_KEY=fake uvicorn app.main:app
+
+In-process (no sockets), use fake_client():
+
+    fake = FakeAnthropic(latency=lambda call: 2.0 if call == 1 else 0.05)
+    client = fake_client(fake)
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import math
+from typing import Callable, Optional, Union
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+
+def _default_responder(system: str, user: str) -> str:
+    return f"Respuesta simulada ({len(user)} caracteres analizados)."
+
+
+class FakeAnthropic:
+    """
+    ASGI app answering POST /v1/messages with a canned message.
+
+    `latency` is seconds per call, or a callable taking the 1-based call number.
+    `responder(system, user)` builds the reply text. `usage` can override the
+    reported token counts the same way (callable or (input, output) tuple).
+    `plan(system, user)` may return (latency, input_tokens, output_tokens) for
+    a call, overriding all three (tools/replay_traffic.py replays captures so).
+    """
+
+    def __init__(self, latency: Union[float, Callable[[int], float]] = 0.0,
+                 responder: Callable[[str, str], str] = _default_responder,
+                 usage: Optional[Union[tuple, Callable[[int], tuple]]] = None,
+                 status_code: int = 200,
+                 plan: Optional[Callable[[str, str], Optional[tuple]]] = None):
+        self.latency = latency
+        self.responder = responder
+        self.usage = usage
+        self.status_code = status_code
+        self.plan = plan
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                await send({"type": message["type"] + ".complete"})
+                if message["type"] == "lifespan.shutdown":
+                    return
+        response = await self.handle(Request(scope, receive))
+        await response(scope, receive, send)
+
+    async def handle(self, request: Request) -> JSONResponse:
+        if request.method != "POST" or not request.url.path.endswith("/v1/messages"):
+            return JSONResponse({"type": "error", "error": {"type": "not_found_error", "message": "Not found"}}, status_code=404)
+
+        self.calls += 1
+        call = self.calls
+        body = json.loads(await request.body())
+
+        system = body.get("system") or ""
+        if isinstance(system, list):
+            system = "".join(block.get("text", "") for block in system)
+        user = "".join(
+            m["content"] if isinstance(m["content"], str) else "".join(b.get("text", "") for b in m["content"])
+            for m in body.get("messages", [])
+        )
+        planned = self.plan(system, user) if self.plan else None
+
+        if planned:
+            delay = planned[0]
+        else:
+            delay = self.latency(call) if callable(self.latency) else self.latency
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+        if self.status_code != 200:
+            return JSONResponse(
+                {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}},
+                status_code=self.status_code
+            )
+
+        if planned:
+            input_tokens, output_tokens = planned[1], planned[2]
+            text = ("Respuesta simulada. " * (math.ceil(output_tokens * 3.5 / 20) + 1))[:math.ceil(output_tokens * 3.5)]
+        else:
+            text = self.responder(system, user)
+            if self.usage is None:
+                input_tokens, output_tokens = math.ceil((len(system) + len(user)) / 3.5), math.ceil(len(text) / 3.5)
+            else:
+                input_tokens, output_tokens = self.usage(call) if callable(self.usage) else self.usage
+
+        return JSONResponse({
+            "id": f"msg_fake_{call}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "fake"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+        })
+
+
+def fake_client(fake: FakeAnthropic, **kwargs):
+    """AsyncAnthropic client wired to `fake` through an in-process ASGI transport."""
+    from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+
+    # Newer SDKs ship their own httpx fork; build the transport from whichever one it uses
+    httpx_module = importlib.import_module(DefaultAsyncHttpxClient.__mro__[1].__module__.split(".")[0])
+    http_client = DefaultAsyncHttpxClient(transport=httpx_module.ASGITransport(app=fake))
+    kwargs.setdefault("max_retries", 0)
+    return AsyncAnthropic(api_key="fake", base_url="http://fake", http_client=http_client, **kwargs)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Anthropic Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per response")
+    parser.add_argument("--replay", nargs="+", metavar="CAPTURE",
+                        help="Reproduce the token counts and latencies of captured traffic (see tools/replay_traffic.py)")
+    args = parser.parse_args()
+    plan = None
+    if args.replay:
+        from tools.replay_traffic import ReplayPlan, load_records
+        plan = ReplayPlan(load_records(args.replay))
+    uvicorn.run(FakeAnthropic(latency=args.latency, plan=plan), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+Replays captured API traffic (TRAFFIC_CAPTURE_ENABLED=true) against a local
+instance at increasing speeds, to find where it saturates.
+
+    cd backend
+    python -m tools.replay_traffic traffic/capture-*.jsonl* --speeds 1 2 4 8 16 --workers 2
+
+Starts tools/fake_anthropic.py with --replay (each Claude call takes the
+recorded latency and reports the recorded token counts) and the app under the
+gunicorn launcher on a throwaway SQLite database, then re-sends the captured
+requests with their recorded inter-arrival gaps divided by the speed. Open
+loop: requests go out on schedule whether or not earlier ones have finished.
+Use --target to drive an instance started by hand instead (point its
+ANTHROPIC_BASE_URL at `python -m tools.fake_anthropic --replay <captures>`).
+
+Bodies are synthetic: same module, length, roleplay turn count and optional
+fields as captured, filled with text carrying a marker that tells the fake
+which record a prompt belongs to. Jobs are followed over their SSE watch
+until the result. Per speed it prints throughput, latency percentiles and
+shed/error rates, then the first speed at which the instance saturated.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+USERS = 50 # Synthetic users the captured requests are spread over
+PREMIUM_EMAIL = "replay-premium@example.com" # Seeded as premium in the instance this tool starts
+FILLER = "Texto de prueba para la simulación de carga, sin contenido real. "
+MARKER_EVERY = 1000 # Chars between markers, so every chunk of a chunked analysis carries one
+MARKER_RE = re.compile(r"\[\[replay (\d+) (\d+)\]\]")
+
+REPLAYED = {
+    ("POST", "/api/analyze"), ("POST", "/api/analyze/stream"), ("POST", "/api/jobs"),
+    ("GET", "/api/history"), ("GET", "/api/wellbeing"), ("POST", "/api/wellbeing"),
+}
+# Polls and watches of captured jobs are not replayed: each replayed job is followed instead
+
+# Saturation: any of these at a given speed
+MAX_SHED_RATE = 0.01 # 503s from admission control
+MAX_ERROR_RATE = 0.01 # Other 5xx and connection failures
+MAX_P95_GROWTH = 2.0 # p95 latency vs the slowest speed (a backlog shows up here first)
+
+
+def load_records(paths) -> list:
+    """Captured records from all files (rotated ones included), oldest first."""
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # Line cut by a rotation or a crash
+                if isinstance(record, dict) and "ts" in record:
+                    records.append(record)
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+class ReplayPlan:
+    """
+    The fake's `plan`: for a prompt carrying a replay marker, the Claude calls
+    recorded for that request, in order. Calls a request made that weren't
+    captured (background drafts, jobs, retries) get a random recorded call of
+    the same module.
+    """
+
+    def __init__(self, records: list, seed: int = 0):
+        self.records = records
+        self.pools = defaultdict(list)
+        for record in records:
+            for call in record.get("up", []):
+                self.pools[record.get("module")].append(call)
+                self.pools[None].append(call)
+        self.served = Counter()
+        self.random = random.Random(seed)
+
+    def __call__(self, system: str, user: str) -> Optional[tuple]:
+        match = MARKER_RE.search(user)
+        if not match:
+            return None
+        run, index = int(match.group(1)), int(match.group(2))
+        record = self.records[index] if index < len(self.records) else {}
+        calls = record.get("up") or []
+        served = self.served[(run, index)]
+        self.served[(run, index)] += 1
+        if served < len(calls):
+            call = calls[served]
+        else:
+            pool = self.pools.get(record.get("module")) or self.pools[None]
+            if not pool:
+                return None
+            call = self.random.choice(pool)
+        input_tokens, output_tokens, latency_ms = call
+        return latency_ms / 1000, input_tokens or 0, output_tokens or 0
+
+
+def filler(chars: int, marker: str) -> str:
+    block = (marker + " " + FILLER * (MARKER_EVERY // len(FILLER) + 1))[:MARKER_EVERY]
+    return (block * (chars // MARKER_EVERY + 1))[:max(chars, len(marker))]
+
+
+def roleplay_history(chars: int, turns: int, marker: str) -> str:
+    """A roleplay history (JSON list of turns, as the frontend sends it) about `chars` long."""
+    turns = max(turns, 2)
+    skeleton = [{"role": "system", "content": "Escenario: Simulación"}] + [
+        {"role": "assistant" if i % 2 == 0 else "user", "content": ""} for i in range(turns - 1)
+    ]
+    per_turn = max(len(marker), (chars - len(json.dumps(skeleton, ensure_ascii=False))) // (turns - 1))
+    for turn in skeleton[1:]:
+        turn["content"] = filler(per_turn, marker)
+    return json.dumps(skeleton, ensure_ascii=False)
+
+
+def build_request(record: dict, run: int, index: int) -> Optional[dict]:
+    """Synthetic request with the captured shape, or None for endpoints that aren't replayed."""
+    method, path = record.get("method"), record.get("path")
+    if (method, path) not in REPLAYED:
+        return None
+    user = f"replay{index % USERS}@example.com"
+    if method == "GET":
+        return {"method": method, "path": path, "params": {"email": user}}
+    if path == "/api/wellbeing":
+        return {"method": method, "path": path, "json": {"user_email": user, "battery_level": 50}}
+
+    module = record.get("module") or "glossary"
+    flags = set(record.get("flags", []))
+    marker = f"[[replay {run} {index}]]"
+    chars = record.get("chars", 0)
+    text = roleplay_history(chars, record.get("turns", 2), marker) if module == "roleplay" else filler(chars, marker)
+    body = {"module": module, "text": text}
+    if "user" in flags:
+        body["user_email"] = PREMIUM_EMAIL if "premium" in flags else user
+    if "profile" in flags:
+        body["user_profile"] = {"name": "Prueba", "gender": ""}
+    if "scenario" in flags:
+        body["scenario_context"] = {"character_name": "Sofía", "role": "Amiga", "is_premium": "premium" in flags}
+    if "conversation" in flags:
+        body["conversation_id"] = f"replay-{run}-{index}"
+    return {"method": method, "path": path, "json": body}
+
+
+async def send(client, request: dict) -> int:
+    """Sends one request (following jobs and streams to the end). Returns the final status."""
+    method, path = request["method"], request["path"]
+    if path == "/api/analyze/stream":
+        async with client.stream(method, path, json=request["json"]) as response:
+            body = "".join([chunk async for chunk in response.aiter_text()])
+        return 502 if "event: error" in body else response.status_code
+    response = await client.request(method, path, json=request.get("json"), params=request.get("params"))
+    if path != "/api/jobs" or response.status_code != 202:
+        return response.status_code
+    async with client.stream("GET", f"/api/jobs/{response.json()['id']}/events") as events:
+        body = "".join([chunk async for chunk in events.aiter_text()])
+    if "event: result" in body:
+        return 200
+    errors = [json.loads(line[len("data: "):]) for block in body.split("\n\n") if block.startswith("event: error")
+              for line in block.split("\n") if line.startswith("data: ")]
+    return (errors[0].get("status_code") if errors else None) or 502
+
+
+async def replay(client, records: list, speed: float, run: int, duration: Optional[float] = None) -> dict:
+    """Re-sends `records` `speed` times faster than captured. Returns the run's summary."""
+    from app.services.admission import classify
+
+    results = []
+    start = time.perf_counter()
+    first_ts = records[0]["ts"] if records else 0
+
+    async def fire(index: int, record: dict, request: dict, offset: float):
+        delay = offset - (time.perf_counter() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sent = time.perf_counter()
+        try:
+            status = await send(client, request)
+        except Exception:
+            status = 0 # Timeout / connection refused
+        finished = time.perf_counter()
+        results.append({
+            "class": classify(request["path"]), "module": record.get("module"), "status": status,
+            "latency": finished - sent, "lateness": sent - start - offset, "finished": finished - start,
+        })
+
+    tasks, first_offset, offered_window = [], None, 0.0
+    for index, record in enumerate(records):
+        offset = (record["ts"] - first_ts) / speed
+        if duration is not None and offset > duration:
+            break
+        request = build_request(record, run, index)
+        if request:
+            first_offset = offset if first_offset is None else first_offset
+            offered_window = offset - first_offset
+            tasks.append(asyncio.create_task(fire(index, record, request, offset)))
+    await asyncio.gather(*tasks)
+    return summarize(results, offered_window)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(results: list, offered_window: float) -> dict:
+    total = len(results)
+    latencies = [r["latency"] for r in results]
+    analyze = [r["latency"] for r in results if r["class"] == "analyze" or r["module"]]
+    # Rates between the first and last send / completion: a backlog stretches the completions out
+    finished = [r["finished"] for r in results]
+    completion_window = max(finished) - min(finished) if finished else 0.0
+    return {
+        "requests": total,
+        "offered_rps": (total - 1) / offered_window if offered_window else 0.0,
+        "rps": (total - 1) / completion_window if completion_window else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "analysis_p95_ms": percentile(analyze, 0.95) * 1000,
+        "shed": sum(r["status"] == 503 for r in results) / total if total else 0.0,
+        "errors": sum(r["status"] == 0 or (r["status"] >= 500 and r["status"] != 503) for r in results) / total if total else 0.0,
+        "late_p99_ms": percentile([r["lateness"] for r in results], 0.99) * 1000, # Load generator falling behind
+    }
+
+
+def saturation_reasons(summary: dict, baseline: dict) -> list:
+    reasons = []
+    if summary["shed"] > MAX_SHED_RATE:
+        reasons.append(f"{summary['shed']:.1%} shed")
+    if summary["errors"] > MAX_ERROR_RATE:
+        reasons.append(f"{summary['errors']:.1%} errors")
+    if baseline["p95_ms"] and summary["p95_ms"] > MAX_P95_GROWTH * baseline["p95_ms"]:
+        reasons.append(f"p95 {summary['p95_ms'] / baseline['p95_ms']:.1f}x the baseline")
+    return reasons
+
+
+def describe(records: list) -> None:
+    """Prints the captured workload mix."""
+    span = records[-1]["ts"] - records[0]["ts"] if len(records) > 1 else 0
+    print(f"{len(records)} captured records over {span / 60:.1f} min")
+    groups = defaultdict(list)
+    for record in records:
+        groups[(record.get("method"), record.get("path"), record.get("module"))].append(record)
+    print(f"  {'endpoint':<28}{'module':<19}{'count':>6}{'chars':>8}{'calls':>6}{'in tok':>8}{'out tok':>8}{'up ms':>8}")
+    for (method, path, module), group in sorted(groups.items(), key=lambda item: -len(item[1])):
+        calls = [call for r in group for call in r.get("up", [])]
+        mean = lambda values: statistics.mean(values) if values else 0
+        print(f"  {method + ' ' + path:<28}{module or '-':<19}{len(group):>6}{mean([r.get('chars', 0) for r in group]):>8.0f}"
+              f"{len(calls) / len(group):>6.1f}{mean([c[0] or 0 for c in calls]):>8.0f}{mean([c[1] or 0 for c in calls]):>8.0f}"
+              f"{mean([c[2] for c in calls]):>8.0f}")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_ready(url: str, timeout: float = 60.0) -> None:
+    import httpx
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def start_instance(captures: list, workers: int, tmp: Path) -> tuple:
+    """Fake Anthropic + the app under gunicorn. Returns (base url, processes)."""
+    fake_port, app_port = free_port(), free_port()
+    env = {**os.environ, "PYTHONPATH": str(BACKEND_DIR)}
+    fake = subprocess.Popen([sys.executable, "-m", "tools.fake_anthropic", "--port", str(fake_port), "--replay", *captures],
+                            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    env.update({
+        "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{fake_port}",
+        "CLAUDE_API_KEY": "fake",
+        "DATABASE_URL": f"sqlite:///{tmp / 'replay.db'}",
+        "PREMIUM_EMAILS": PREMIUM_EMAIL,
+        "TRAFFIC_CAPTURE_ENABLED": "false",
+        "WEB_CONCURRENCY": str(workers),
+        "LOG_LEVEL": "WARNING",
+    })
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", str(BACKEND_DIR / "gunicorn_conf.py"),
+                               "--bind", f"127.0.0.1:{app_port}", "app.main:app"],
+                              cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return f"http://127.0.0.1:{app_port}", [server, fake]
+
+
+async def main():
+    import httpx
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("captures", nargs="+", help="Capture files (capture-<pid>.jsonl and rotated .1, .2...)")
+    parser.add_argument("--speeds", type=float, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--duration", type=float, help="Seconds of wall time to replay per speed (default: whole capture)")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers (WEB_CONCURRENCY) for the local instance")
+    parser.add_argument("--target", help="Base URL of a running instance instead of starting one")
+    parser.add_argument("--cooldown", type=float, default=5.0, help="Pause between speeds")
+    args = parser.parse_args()
+
+    records = load_records(args.captures)
+    if not records:
+        sys.exit("No captured records found")
+    describe(records)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        processes = []
+        base_url = args.target
+        if not base_url:
+            base_url, processes = start_instance(args.captures, args.workers, Path(tmp))
+        try:
+            await wait_ready(f"{base_url}/readyz") # Past the warmup, which would skew the first requests
+            limits = httpx.Limits(max_connections=None, max_keepalive_connections=256)
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=180.0) as client:
+                print(f"\n{'speed':>6}{'reqs':>7}{'offered/s':>11}{'done/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                      f"{'analysis p95':>14}{'shed':>7}{'errors':>8}{'late p99':>10}")
+                baseline, saturated_at = None, None
+                for run, speed in enumerate(sorted(args.speeds)):
+                    summary = await replay(client, records, speed, run, args.duration)
+                    baseline = baseline or summary
+                    reasons = saturation_reasons(summary, baseline)
+                    print(f"{speed:>5g}x{summary['requests']:>7}{summary['offered_rps']:>11.1f}{summary['rps']:>9.1f}"
+                          f"{summary['p50_ms']:>9.0f}{summary['p95_ms']:>9.0f}{summary['p99_ms']:>9.0f}"
+                          f"{summary['analysis_p95_ms']:>14.0f}{summary['shed']:>7.1%}{summary['errors']:>8.1%}"
+                          f"{summary['late_p99_ms']:>10.0f}  {', '.join(reasons)}")
+                    if reasons and saturated_at is None:
+                        saturated_at = (speed, summary)
+                    await asyncio.sleep(args.cooldown)
+        finally:
+            for proc in processes:
+                proc.send_signal(signal.SIGTERM)
+                proc.wait(timeout=30)
+
+    if saturated_at:
+        speed, summary = saturated_at
+        print(f"\nSaturated at {speed:g}x the captured rate (~{summary['offered_rps']:.1f} req/s offered).")
+    else:
+        print(f"\nNo saturation up to {max(args.speeds):g}x the captured rate; try higher --speeds.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())